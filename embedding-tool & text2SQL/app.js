@@ -211,6 +211,40 @@ const sqlOutput = document.getElementById('sql-output');
 const resultTable = document.getElementById('result-table');
 const resultError = document.getElementById('result-error');
 const schemaContext = document.getElementById('schema-context');
+const resultPager = document.getElementById('result-pager');
+const resultStatus = document.getElementById('result-status');
+const loadMoreBtn = document.getElementById('load-more-btn');
+
+// Paging state of the result currently shown
+let nextPageToken = null;
+let shownRows = 0;
+
+function appendRows(rows) {
+    const tbody = resultTable.querySelector('tbody');
+    rows.forEach(row => {
+        const tr = document.createElement('tr');
+        row.forEach(cell => {
+            const td = document.createElement('td');
+            td.textContent = cell;
+            tr.appendChild(td);
+        });
+        tbody.appendChild(tr);
+    });
+    shownRows += rows.length;
+}
+
+function renderPager(page) {
+    nextPageToken = page.next_page_token;
+    loadMoreBtn.classList.toggle('hidden', !nextPageToken);
+    if (page.truncated) {
+        resultStatus.textContent = `Showing ${shownRows} rows. Result truncated at the server's row limit.`;
+    } else if (nextPageToken) {
+        resultStatus.textContent = `Showing the first ${shownRows} rows. More are available.`;
+    } else {
+        resultStatus.textContent = `Showing all ${shownRows} rows.`;
+    }
+    resultPager.classList.toggle('hidden', !shownRows);
+}
 
 askBtn.addEventListener('click', async () => {
     const question = userQuestion.value.trim();
@@ -250,6 +284,7 @@ askBtn.addEventListener('click', async () => {
         // Render Table
         resultTable.innerHTML = '';
         resultError.classList.add('hidden');
+        resultPager.classList.add('hidden');
 
         if (data.error) {
             resultError.textContent = data.error;
@@ -268,22 +303,16 @@ askBtn.addEventListener('click', async () => {
 
             // Body
             const tbody = document.createElement('tbody');
+            resultTable.appendChild(tbody);
+            shownRows = 0;
             if (data.rows.length === 0) {
                 const tr = document.createElement('tr');
                 tr.innerHTML = `<td colspan="${data.columns.length}">No results found.</td>`;
                 tbody.appendChild(tr);
             } else {
-                data.rows.forEach(row => {
-                    const tr = document.createElement('tr');
-                    row.forEach(cell => {
-                        const td = document.createElement('td');
-                        td.textContent = cell;
-                        tr.appendChild(td);
-                    });
-                    tbody.appendChild(tr);
-                });
+                appendRows(data.rows);
             }
-            resultTable.appendChild(tbody);
+            renderPager(data);
         }
 
         // Render Context
@@ -304,6 +333,26 @@ askBtn.addEventListener('click', async () => {
     }
 });
 
+loadMoreBtn.addEventListener('click', async () => {
+    if (!nextPageToken) return;
+    loadMoreBtn.disabled = true;
+    try {
+        const res = await fetch('/api/query/page', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ page_token: nextPageToken })
+        });
+        const page = await res.json();
+        if (!res.ok || page.error) throw new Error(page.error || 'Could not load more rows');
+        appendRows(page.rows);
+        renderPager(page);
+    } catch (e) {
+        alert('Error: ' + e.message);
+    } finally {
+        loadMoreBtn.disabled = false;
+    }
+});
+
 document.getElementById('copy-sql-btn').addEventListener('click', () => {
     navigator.clipboard.writeText(sqlOutput.textContent);
     alert('SQL copied to clipboard!');
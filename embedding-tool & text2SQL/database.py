@@ -6,6 +6,7 @@ Handles storage of jobs and embeddings.
 import sqlite3
 import json
 import logging
+import numpy as np
 from pathlib import Path
 import tempfile
 from typing import Dict, Any, List, Optional, Generator
@@ -40,7 +41,8 @@ def init_db():
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         input_file_path TEXT,
         provider TEXT,
-        model TEXT
+        model TEXT,
+        export_version INTEGER DEFAULT 0 -- Bumped when exported content changes
     )
     ''')
     
@@ -51,7 +53,7 @@ def init_db():
         job_id TEXT,
         row_index INTEGER,
         text TEXT,
-        embedding BLOB, -- Stored as JSON string or binary
+        embedding BLOB, -- Little-endian float64 bytes (JSON string for older jobs)
         metadata TEXT, -- Stored as JSON string
         cluster_id INTEGER, -- New column for clustering
         PRIMARY KEY (job_id, row_index),
@@ -66,6 +68,13 @@ def init_db():
         logger.info("Migrating database: Adding cluster_id column")
         cursor.execute('ALTER TABLE embeddings ADD COLUMN cluster_id INTEGER')
     
+    # Migration: Check if export_version exists, if not add it
+    try:
+        cursor.execute('SELECT export_version FROM jobs LIMIT 1')
+    except sqlite3.OperationalError:
+        logger.info("Migrating database: Adding export_version column")
+        cursor.execute('ALTER TABLE jobs ADD COLUMN export_version INTEGER DEFAULT 0')
+    
     conn.commit()
     conn.close()
     logger.info(f"Database initialized at {DB_PATH}")
@@ -130,6 +139,16 @@ def get_job(job_id: str) -> Optional[Dict[str, Any]]:
         return dict(row)
     return None
 
+def _encode_embedding(embedding) -> bytes:
+    """Pack an embedding as raw float64 bytes."""
+    return np.asarray(embedding, dtype='<f8').tobytes()
+
+def _decode_embedding(raw) -> np.ndarray:
+    """Unpack a stored embedding, accepting the legacy JSON text format."""
+    if isinstance(raw, (bytes, memoryview)):
+        return np.frombuffer(raw, dtype='<f8')
+    return np.asarray(json.loads(raw), dtype=np.float64)
+
 def save_embeddings_batch(job_id: str, embeddings_data: List[Dict[str, Any]]):
     """Save a batch of embeddings."""
     conn = get_db_connection()
@@ -141,7 +160,7 @@ def save_embeddings_batch(job_id: str, embeddings_data: List[Dict[str, Any]]):
             job_id,
             item['id'], # row_index
             item['text'],
-            json.dumps(item['embedding']), # Store as JSON string for simplicity
+            _encode_embedding(item['embedding']),
             json.dumps(item['metadata'])
         ))
     
@@ -157,6 +176,7 @@ def update_cluster_ids(job_id: str, cluster_map: Dict[int, int]):
     """
     Update cluster IDs for a job.
     cluster_map: {row_index: cluster_id}
+    Also bumps the job's export_version so cached exports are regenerated.
     """
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -168,12 +188,27 @@ def update_cluster_ids(job_id: str, cluster_map: Dict[int, int]):
         'UPDATE embeddings SET cluster_id = ? WHERE job_id = ? AND row_index = ?',
         values
     )
+    cursor.execute(
+        'UPDATE jobs SET export_version = COALESCE(export_version, 0) + 1 WHERE id = ?',
+        (job_id,)
+    )
     
     conn.commit()
     conn.close()
 
+def count_job_embeddings(job_id: str) -> int:
+    """Count stored embeddings for a job."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT COUNT(*) FROM embeddings WHERE job_id = ?', (job_id,))
+    count = cursor.fetchone()[0]
+    
+    conn.close()
+    return count
+
 def get_job_embeddings(job_id: str) -> Generator[Dict[str, Any], None, None]:
-    """Yield embeddings for a job efficiently."""
+    """Yield embeddings for a job efficiently (embedding as a float64 NumPy array)."""
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -190,7 +225,7 @@ def get_job_embeddings(job_id: str) -> Generator[Dict[str, Any], None, None]:
             yield {
                 "id": str(row['row_index']),
                 "text": row['text'],
-                "embedding": json.loads(row['embedding']),
+                "embedding": _decode_embedding(row['embedding']),
                 "metadata": json.loads(row['metadata']),
                 "cluster_id": row['cluster_id']
             }
@@ -0,0 +1,195 @@
+"""
+On-disk store for data dictionary embeddings.
+
+Embeddings are saved as a normalized float32 .npy matrix next to a JSON
+manifest holding the dictionary entries and a hash of each entry's text.
+Re-indexing only embeds entries whose text hash is new, and readers map
+the matrix into memory so every worker process shares the same pages.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Index directory
+INDEX_DIR = Path(tempfile.gettempdir()) / "embedding_tool_index"
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = "index.lock"
+
+
+def text_hash(text: str) -> str:
+    """Stable key for one dictionary entry's text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row so dot products are cosine similarities."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class DictionaryIndexStore:
+    """Persists the dictionary index for one SchemaManager deployment."""
+
+    def __init__(self, index_dir: Path = INDEX_DIR):
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.index_dir / MANIFEST_NAME
+        self.lock_path = self.index_dir / LOCK_NAME
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock shared by every process writing to this index directory."""
+        with open(self.lock_path, "a+b") as f:
+            if os.name == "nt":
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if os.name == "nt":
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def manifest_mtime(self) -> Optional[float]:
+        """Modification time of the manifest, or None if nothing is stored."""
+        try:
+            return self.manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable dictionary index manifest: {e}")
+            return None
+
+    def load(self) -> Optional[Tuple[Dict[str, Any], np.ndarray]]:
+        """
+        Load the stored index.
+
+        Returns:
+            (manifest, matrix) with the matrix memory-mapped read-only, or None
+        """
+        for attempt in range(2):
+            manifest = self._read_manifest()
+            if not manifest:
+                return None
+            try:
+                return manifest, np.load(self.index_dir / manifest["matrix"], mmap_mode="r")
+            except FileNotFoundError:
+                # A writer replaced the index after we read the manifest; read it again
+                continue
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable dictionary index: {e}")
+                return None
+        logger.warning("Ignoring dictionary index: its matrix file is missing")
+        return None
+
+    def update(self, entries: List[Dict[str, Any]], texts: List[str], generator) -> Tuple[Dict[str, Any], np.ndarray, int]:
+        """
+        Re-index the dictionary, embedding only new or changed entries.
+
+        Args:
+            entries: Data dictionary entries, in index order
+            texts: Text embedded for each entry
+            generator: EmbeddingGenerator used for entries not already stored
+
+        Returns:
+            (manifest, matrix, embedded_count)
+        """
+        hashes = [text_hash(text) for text in texts]
+
+        # Reuse stored rows only if they came from the same embedding model
+        known = {}
+        stored = self.load()
+        if stored:
+            manifest, matrix = stored
+            if manifest.get("provider") == generator.provider and manifest.get("model") == generator.model:
+                known = {h: i for i, h in enumerate(manifest["hashes"])}
+            old_matrix = matrix
+        else:
+            old_matrix = None
+
+        missing = [i for i, h in enumerate(hashes) if h not in known]
+        new_vectors = None
+        if missing:
+            embedded = generator.generate_embeddings([texts[i] for i in missing])
+            new_vectors = normalize_rows(np.asarray(embedded, dtype=np.float32))
+
+        if new_vectors is not None:
+            dimension = new_vectors.shape[1]
+        elif old_matrix is not None and len(old_matrix):
+            dimension = old_matrix.shape[1]
+        else:
+            dimension = 0
+
+        matrix = np.empty((len(texts), dimension), dtype=np.float32)
+        missing_rows = {row: n for n, row in enumerate(missing)}
+        for row, h in enumerate(hashes):
+            if row in missing_rows:
+                matrix[row] = new_vectors[missing_rows[row]]
+            else:
+                matrix[row] = old_matrix[known[h]]
+
+        manifest = {
+            "provider": generator.provider,
+            "model": generator.model,
+            "hashes": hashes,
+            "entries": entries,
+            "matrix": f"embeddings-{uuid.uuid4().hex}.npy"
+        }
+        matrix = self._write(manifest, matrix)
+        logger.info(f"Dictionary index saved: {len(missing)} embedded, {len(texts) - len(missing)} reused.")
+
+        return manifest, matrix, len(missing)
+
+    def _write(self, manifest: Dict[str, Any], matrix: np.ndarray) -> np.ndarray:
+        # The matrix gets a fresh name, then the manifest is swapped in atomically,
+        # so readers never see a manifest pointing at a half-written file. The lock
+        # keeps another writer's cleanup from deleting a matrix before its manifest lands.
+        # Returns the written matrix memory-mapped, opened before the lock is released.
+        with self._locked():
+            self._write_locked(manifest, matrix)
+            return np.load(self.index_dir / manifest["matrix"], mmap_mode="r")
+
+    def _write_locked(self, manifest: Dict[str, Any], matrix: np.ndarray):
+        matrix_tmp = self.index_dir / (manifest["matrix"] + ".tmp")
+        with open(matrix_tmp, "wb") as f:
+            np.save(f, matrix)
+        os.replace(matrix_tmp, self.index_dir / manifest["matrix"])
+
+        manifest_tmp = self.index_dir / f"{MANIFEST_NAME}.{uuid.uuid4().hex}.tmp"
+        with open(manifest_tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, default=str)
+        os.replace(manifest_tmp, self.manifest_path)
+
+        for path in self.index_dir.glob("embeddings-*.npy"):
+            if path.name != manifest["matrix"]:
+                try:
+                    path.unlink()
+                except OSError:
+                    # Still mapped by another process (Windows); cleaned up next time
+                    pass
@@ -0,0 +1,236 @@
+"""
+Compressed, cached download artifacts for completed exports.
+
+The first download of an export is streamed to the client and written to
+disk at the same time; later downloads are served from the artifact with
+Range and ETag support. Artifacts are keyed by the job's export_version,
+which changes whenever clustering rewrites cluster_id.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Artifact directory
+EXPORT_DIR = Path(tempfile.gettempdir()) / "embedding_tool_exports"
+EXPORT_DIR.mkdir(exist_ok=True)
+
+# Artifacts past either bound are evicted, least recently used first
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get("EXPORT_CACHE_MAX_MB", 2048)) * 1024 * 1024
+EXPORT_CACHE_MAX_AGE = float(os.environ.get("EXPORT_CACHE_MAX_AGE_HOURS", 24 * 7)) * 3600
+
+# Decimal places a client may request for vector components (float32 keeps ~7)
+MAX_PRECISION = 8
+
+# Supported Content-Encodings, in order of preference
+ENCODINGS = ["zstd", "gzip"] if zstandard else ["gzip"]
+
+_in_progress = set()
+_in_progress_lock = threading.Lock()
+
+
+def negotiate_encoding(accept_encodings, compressible: bool = True) -> str:
+    """
+    Pick a Content-Encoding from the client's Accept-Encoding header.
+
+    Args:
+        accept_encodings: Parsed Accept-Encoding header (request.accept_encodings)
+        compressible: False for formats that are already compressed
+
+    Returns:
+        "zstd", "gzip" or "identity"
+    """
+    if not compressible:
+        return "identity"
+    return accept_encodings.best_match(ENCODINGS) or "identity"
+
+
+def artifact_path(job_id: str, format_type: str, version: int, encoding: str) -> Path:
+    """Path of the cached artifact for one export representation."""
+    return EXPORT_DIR / f"{job_id}_v{version}_{format_type}.{encoding}"
+
+
+def etag_for(job_id: str, format_type: str, version: int, encoding: str) -> str:
+    """Strong validator for an export representation (unquoted)."""
+    key = f"{job_id}:{format_type}:{version}:{encoding}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+
+
+def get_artifact(job_id: str, format_type: str, version: int, encoding: str) -> Optional[Path]:
+    """Return the cached artifact if it has been fully written."""
+    path = artifact_path(job_id, format_type, version, encoding)
+    try:
+        # Mark as recently used so eviction keeps it
+        os.utime(path)
+    except OSError:
+        return None
+    return path
+
+
+def evict_artifacts(directory: Path = EXPORT_DIR, max_bytes: int = EXPORT_CACHE_MAX_BYTES,
+                    max_age: float = EXPORT_CACHE_MAX_AGE, keep: Optional[Path] = None):
+    """
+    Delete artifacts unused for max_age seconds, then the least recently used
+    ones until the directory holds at most max_bytes.
+
+    Args:
+        keep: Artifact that must survive (e.g. the one just written)
+    """
+    now = time.time()
+    artifacts = []
+    for path in Path(directory).iterdir():
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        if path.name.endswith(".part"):
+            # In-progress writes are only cleaned up once clearly abandoned
+            if now - stat.st_mtime > max_age:
+                _unlink(path)
+            continue
+        artifacts.append((stat.st_mtime, stat.st_size, path))
+
+    artifacts.sort()
+    total = sum(size for _, size, _ in artifacts)
+    for mtime, size, path in artifacts:
+        if path == keep:
+            continue
+        if now - mtime <= max_age and total <= max_bytes:
+            break
+        if _unlink(path):
+            total -= size
+
+
+def _unlink(path: Path) -> bool:
+    try:
+        path.unlink()
+        return True
+    except OSError as e:
+        logger.warning(f"Could not remove export artifact {path}: {e}")
+        return False
+
+
+def invalidate_job(job_id: str):
+    """
+    Delete every cached artifact for a job.
+
+    In-progress .part files are left to their writers: the stream using one
+    would otherwise fail when it finishes. They complete under the old
+    version's path, which is never served again and is evicted later.
+    """
+    for path in EXPORT_DIR.glob(f"{job_id}_v*"):
+        if not path.name.endswith(".part"):
+            _unlink(path)
+
+
+def compress_stream(chunks: Iterable[Union[str, bytes]], encoding: str) -> Iterator[bytes]:
+    """
+    Encode formatter output as bytes and compress it on the fly.
+
+    Args:
+        chunks: Text or binary chunks from a formatter
+        encoding: "zstd", "gzip" or "identity"
+
+    Yields:
+        Encoded byte chunks
+    """
+    if encoding == "gzip":
+        # wbits=31 writes a gzip header with a zero mtime, so output is deterministic
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    elif encoding == "zstd":
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+    else:
+        compressor = None
+
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        if compressor:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+
+    if compressor:
+        tail = compressor.flush()
+        if tail:
+            yield tail
+
+
+def materialize(produce: Callable[[], Iterable[bytes]], path: Path):
+    """Write an export to its artifact path without streaming it anywhere."""
+    for _ in stream_and_cache(produce, path, complete_on_disconnect=False):
+        pass
+
+
+def _materialize_in_background(produce: Callable[[], Iterable[bytes]], path: Path):
+    with _in_progress_lock:
+        if path in _in_progress or path.exists():
+            return
+        _in_progress.add(path)
+
+    def run():
+        try:
+            materialize(produce, path)
+            logger.info(f"Export artifact written to {path}")
+        except Exception as e:
+            logger.error(f"Failed to materialize export {path}: {e}")
+        finally:
+            with _in_progress_lock:
+                _in_progress.discard(path)
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+
+
+def stream_and_cache(produce: Callable[[], Iterable[bytes]], path: Path,
+                     complete_on_disconnect: bool = True) -> Iterator[bytes]:
+    """
+    Yield an export while writing it to `path`.
+
+    The artifact only appears once it is complete. If the client goes away
+    mid-stream the export is finished in a background thread, so a retry
+    can resume with a Range request instead of starting over.
+
+    Args:
+        produce: Callable returning a fresh iterator of encoded chunks
+        path: Final artifact path
+        complete_on_disconnect: Regenerate the artifact if the stream is closed early
+    """
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.part")
+    completed = False
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in produce():
+                f.write(chunk)
+                yield chunk
+        try:
+            os.replace(tmp_path, path)
+        except FileNotFoundError:
+            # Temp file removed under us (e.g. by cleanup): the client got the
+            # whole export, it just isn't cached
+            logger.warning(f"Export artifact {path} not cached: its temporary file is gone")
+        else:
+            completed = True
+            evict_artifacts(path.parent, keep=path)
+    except GeneratorExit:
+        if complete_on_disconnect:
+            _materialize_in_background(produce, path)
+        raise
+    finally:
+        if not completed and tmp_path.exists():
+            tmp_path.unlink()
@@ -1,142 +1,521 @@
 """
 Output formatters for different vector database formats.
+
+Each formatter is a streaming encoder: it emits a prefix, one chunk per
+item and a suffix, so exports can be written without holding every
+embedding in memory. Columnar formats (Parquet, Arrow IPC, NPY bundles)
+are written in row groups and need pyarrow.
 """
 
-import json
-from typing import List, Dict, Any
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Dict, Any, Iterable, Iterator, List, Optional
 
+import numpy as np
 
-def format_as_json(data: List[Dict[str, Any]]) -> str:
-    """
-    Format embeddings as a JSON array.
-    
-    Args:
-        data: List of embedding dictionaries
-        
-    Returns:
-        JSON string
-    """
-    return json.dumps(data, indent=2)
+from serializers import get_serializer
 
+# Text output is buffered and yielded in chunks of roughly this many characters
+DEFAULT_CHUNK_SIZE = 256 * 1024
 
-def format_as_jsonl(data: List[Dict[str, Any]]) -> str:
-    """
-    Format embeddings as JSONL (newline-delimited JSON).
-    
-    Args:
-        data: List of embedding dictionaries
-        
-    Returns:
-        JSONL string
-    """
-    lines = [json.dumps(item) for item in data]
-    return "\n".join(lines)
 
+def _indent(text: str, depth: int) -> str:
+    """Re-indent a pretty-printed JSON value nested `depth` levels deep."""
+    return text.replace("\n", "\n" + "  " * depth)
 
-def format_for_pinecone(data: List[Dict[str, Any]], namespace: str = "") -> str:
+
+class StreamingFormatter:
     """
-    Format embeddings for Pinecone batch upload.
-    
-    Args:
-        data: List of embedding dictionaries
-        namespace: Optional namespace for Pinecone
-        
-    Returns:
-        JSON string in Pinecone format
+    Base class for streaming encoders.
+
+    Subclasses implement the prefix/item/suffix protocol; `stream` drives it
+    over any iterable of embedding dictionaries.
     """
-    vectors = []
-    for item in data:
-        vector = {
+
+    extension = "json"
+    mimetype = "application/json"
+    # Set when the encoder must know the number of rows before writing
+    needs_row_count = False
+    # False for formats that are already compressed
+    compressible = True
+
+    def __init__(self, pretty: bool = False, precision: Optional[int] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, backend: Optional[str] = None):
+        """
+        Args:
+            pretty: Indent JSON output (compact by default)
+            precision: Decimal places kept for vector components
+            chunk_size: Approximate size of each yielded chunk
+            backend: JSON serializer backend ("orjson" or "json")
+        """
+        self.serializer = get_serializer(pretty=pretty, precision=precision, backend=backend)
+        self.chunk_size = chunk_size
+
+    def prefix(self) -> str:
+        """Text emitted before the first item."""
+        return ""
+
+    def item(self, item: Dict[str, Any], index: int) -> str:
+        """Text for a single item, including any separator before it."""
+        raise NotImplementedError
+
+    def suffix(self, count: int) -> str:
+        """Text emitted after the last item."""
+        return ""
+
+    def stream(self, data: Iterable[Dict[str, Any]]) -> Iterator[str]:
+        """
+        Encode items lazily.
+
+        Args:
+            data: Iterable of embedding dictionaries
+
+        Yields:
+            Chunks of the encoded output, grouped to about `chunk_size`
+        """
+        buffer = [self.prefix()]
+        buffered = len(buffer[0])
+
+        count = 0
+        for item in data:
+            text = self.item(item, count)
+            buffer.append(text)
+            buffered += len(text)
+            count += 1
+            if buffered >= self.chunk_size:
+                yield "".join(buffer)
+                buffer = []
+                buffered = 0
+
+        buffer.append(self.suffix(count))
+        tail = "".join(buffer)
+        if tail:
+            yield tail
+
+    def encode(self, data: Iterable[Dict[str, Any]]) -> str:
+        """Encode all items into a single string."""
+        return "".join(self.stream(data))
+
+
+class JsonFormatter(StreamingFormatter):
+    """Embeddings as a JSON array."""
+
+    # Nesting depth of each item inside the document
+    depth = 1
+
+    def prefix(self) -> str:
+        return "["
+
+    def transform(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Map an embedding dictionary to the object written for it."""
+        return {**item, "embedding": self.serializer.vector(item["embedding"])}
+
+    def item(self, item: Dict[str, Any], index: int) -> str:
+        body = self.serializer.dumps(self.transform(item))
+        if not self.serializer.pretty:
+            return body if index == 0 else "," + body
+
+        separator = "\n" if index == 0 else ",\n"
+        return separator + "  " * self.depth + _indent(body, self.depth)
+
+    def suffix(self, count: int) -> str:
+        if not self.serializer.pretty or count == 0:
+            return "]"
+        return "\n]"
+
+
+class JsonlFormatter(StreamingFormatter):
+    """Embeddings as JSONL (newline-delimited JSON, always one object per line)."""
+
+    extension = "jsonl"
+    mimetype = "application/x-ndjson"
+
+    def __init__(self, pretty: bool = False, **options):
+        super().__init__(**options)
+
+    def item(self, item: Dict[str, Any], index: int) -> str:
+        item = {**item, "embedding": self.serializer.vector(item["embedding"])}
+        line = self.serializer.dumps(item)
+        return line if index == 0 else "\n" + line
+
+
+class _WrappedArrayFormatter(JsonFormatter):
+    """A JSON object holding the items under a single array key."""
+
+    depth = 2
+    key = ""
+
+    def trailing_fields(self) -> Dict[str, Any]:
+        """Extra top-level fields written after the array."""
+        return {}
+
+    def prefix(self) -> str:
+        key = self.serializer.dumps(self.key)
+        if not self.serializer.pretty:
+            return "{" + key + ":["
+        return "{\n  " + key + ": ["
+
+    def suffix(self, count: int) -> str:
+        dumps = self.serializer.dumps
+        if not self.serializer.pretty:
+            closing = "]"
+            for key, value in self.trailing_fields().items():
+                closing += "," + dumps(key) + ":" + dumps(value)
+            return closing + "}"
+
+        closing = "]" if count == 0 else "\n  ]"
+        for key, value in self.trailing_fields().items():
+            closing += ",\n  " + dumps(key) + ": " + _indent(dumps(value), 1)
+        return closing + "\n}"
+
+
+class PineconeFormatter(_WrappedArrayFormatter):
+    """Embeddings for Pinecone batch upload."""
+
+    key = "vectors"
+
+    def __init__(self, namespace: str = "", **options):
+        """
+        Args:
+            namespace: Optional namespace for Pinecone
+            **options: Serializer options (see StreamingFormatter)
+        """
+        super().__init__(**options)
+        self.namespace = namespace
+
+    def transform(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        metadata = {"text": item["text"]}
+        if "cluster_id" in item:
+            metadata["cluster_id"] = item["cluster_id"]
+        metadata.update(item.get("metadata", {}))
+        return {
             "id": item["id"],
-            "values": item["embedding"],
-            "metadata": {
-                "text": item["text"],
-                **item.get("metadata", {})
-            }
+            "values": self.serializer.vector(item["embedding"]),
+            "metadata": metadata
         }
-        vectors.append(vector)
-    
-    result = {
-        "vectors": vectors
-    }
-    
-    if namespace:
-        result["namespace"] = namespace
-    
-    return json.dumps(result, indent=2)
-
-
-def format_for_weaviate(data: List[Dict[str, Any]], class_name: str = "Document") -> str:
-    """
-    Format embeddings for Weaviate batch import.
-    
-    Args:
-        data: List of embedding dictionaries
-        class_name: Weaviate class name
-        
-    Returns:
-        JSON string in Weaviate format
-    """
-    objects = []
-    for item in data:
-        obj = {
-            "class": class_name,
+
+    def trailing_fields(self) -> Dict[str, Any]:
+        return {"namespace": self.namespace} if self.namespace else {}
+
+
+class WeaviateFormatter(_WrappedArrayFormatter):
+    """Embeddings for Weaviate batch import."""
+
+    key = "objects"
+
+    def __init__(self, class_name: str = "Document", **options):
+        """
+        Args:
+            class_name: Weaviate class name
+            **options: Serializer options (see StreamingFormatter)
+        """
+        super().__init__(**options)
+        self.class_name = class_name
+
+    def transform(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "class": self.class_name,
             "id": item["id"],
             "properties": {
                 "text": item["text"],
                 **item.get("metadata", {})
             },
-            "vector": item["embedding"]
+            "vector": self.serializer.vector(item["embedding"])
         }
-        objects.append(obj)
-    
-    return json.dumps({"objects": objects}, indent=2)
 
 
-def format_for_qdrant(data: List[Dict[str, Any]]) -> str:
-    """
-    Format embeddings for Qdrant batch upload.
-    
-    Args:
-        data: List of embedding dictionaries
-        
-    Returns:
-        JSON string in Qdrant format
-    """
-    points = []
-    for item in data:
-        point = {
+class QdrantFormatter(_WrappedArrayFormatter):
+    """Embeddings for Qdrant batch upload."""
+
+    key = "points"
+
+    def transform(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        return {
             "id": item["id"],
-            "vector": item["embedding"],
+            "vector": self.serializer.vector(item["embedding"]),
             "payload": {
                 "text": item["text"],
                 **item.get("metadata", {})
             }
         }
-        points.append(point)
-    
-    return json.dumps({"points": points}, indent=2)
 
 
-def get_formatter(format_type: str):
+def _require_pyarrow():
+    """Import pyarrow lazily so text exports work without it."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        raise ImportError("pyarrow is required for columnar exports. Install it with: pip install pyarrow")
+
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class ColumnarFormatter(StreamingFormatter):
+    """
+    Base class for binary columnar exports.
+
+    Items are grouped into batches of `batch_size` rows; each batch becomes
+    one row group (or record batch) and its bytes are yielded as soon as
+    they are written.
+    """
+
+    def __init__(self, batch_size: int = 10000, **options):
+        """
+        Args:
+            batch_size: Rows per row group
+            **options: Serializer options; `precision` rounds the vectors
+        """
+        super().__init__(**options)
+        self.pa = _require_pyarrow()
+        self.batch_size = batch_size
+
+    def _batches(self, data: Iterable[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+        batch = []
+        for item in data:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _vectors(self, items: List[Dict[str, Any]]) -> np.ndarray:
+        vectors = np.asarray([self.serializer.vector(item["embedding"]) for item in items], dtype=np.float32)
+        if vectors.ndim != 2:
+            raise ValueError("All embeddings in an export must have the same dimension")
+        return vectors
+
+    def metadata_schema(self):
+        """Schema of the non-vector columns."""
+        pa = self.pa
+        return pa.schema([
+            ("id", pa.string()),
+            ("text", pa.string()),
+            ("metadata", pa.string()),  # JSON encoded, keys vary between jobs
+            ("cluster_id", pa.int64())
+        ])
+
+    def schema(self, dimension: int):
+        pa = self.pa
+        return self.metadata_schema().append(
+            pa.field("embedding", pa.list_(pa.float32(), dimension))
+        )
+
+    def metadata_batch(self, items: List[Dict[str, Any]]):
+        pa = self.pa
+        return pa.record_batch([
+            pa.array([item["id"] for item in items], pa.string()),
+            pa.array([item["text"] for item in items], pa.string()),
+            pa.array([self.serializer.dumps(item.get("metadata", {})) for item in items], pa.string()),
+            pa.array([item.get("cluster_id") for item in items], pa.int64())
+        ], schema=self.metadata_schema())
+
+    def record_batch(self, items: List[Dict[str, Any]], vectors: np.ndarray):
+        pa = self.pa
+        dimension = vectors.shape[1]
+        embedding = pa.FixedSizeListArray.from_arrays(pa.array(vectors.ravel(), pa.float32()), dimension)
+        columns = self.metadata_batch(items).columns + [embedding]
+        return pa.record_batch(columns, schema=self.schema(dimension))
+
+    def open_writer(self, sink, schema):
+        """Create the pyarrow writer for this format."""
+        raise NotImplementedError
+
+    def stream(self, data: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+        sink = _ChunkSink()
+        writer = None
+        dimension = None
+
+        for items in self._batches(data):
+            vectors = self._vectors(items)
+            if writer is None:
+                dimension = vectors.shape[1]
+                writer = self.open_writer(self.pa.PythonFile(sink, mode="w"), self.schema(dimension))
+            elif vectors.shape[1] != dimension:
+                raise ValueError("All embeddings in an export must have the same dimension")
+
+            writer.write_batch(self.record_batch(items, vectors))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+
+        if writer is None:
+            writer = self.open_writer(self.pa.PythonFile(sink, mode="w"), self.schema(0))
+        writer.close()
+
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+
+
+class ParquetFormatter(ColumnarFormatter):
+    """Embeddings as Parquet with a fixed-size float32 list column."""
+
+    extension = "parquet"
+    mimetype = "application/vnd.apache.parquet"
+    compressible = False
+
+    def open_writer(self, sink, schema):
+        return self.pa.parquet.ParquetWriter(sink, schema)
+
+
+class ArrowFormatter(ColumnarFormatter):
+    """Embeddings as an Arrow IPC stream."""
+
+    extension = "arrow"
+    mimetype = "application/vnd.apache.arrow.stream"
+
+    def open_writer(self, sink, schema):
+        return self.pa.ipc.new_stream(sink, schema)
+
+
+class NpyBundleFormatter(ColumnarFormatter):
+    """
+    Zip archive holding `vectors.npy` (float32, one row per item) and
+    `metadata.parquet` with the remaining columns in the same order.
+
+    The .npy header stores the array shape, so `row_count` must be set
+    before streaming.
+    """
+
+    extension = "zip"
+    mimetype = "application/zip"
+    needs_row_count = True
+    compressible = False
+
+    def __init__(self, batch_size: int = 10000, row_count: Optional[int] = None, **options):
+        """
+        Args:
+            batch_size: Rows per row group
+            row_count: Number of items that will be streamed
+            **options: Serializer options; `precision` rounds the vectors
+        """
+        super().__init__(batch_size, **options)
+        self.row_count = row_count
+
+    @staticmethod
+    def _member(name: str) -> zipfile.ZipInfo:
+        # Fixed timestamps keep the archive byte-identical between runs
+        return zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+
+    def _write_header(self, member, dimension: int):
+        header = {"descr": "<f4", "fortran_order": False, "shape": (self.row_count, dimension)}
+        np.lib.format.write_array_header_2_0(member, header)
+
+    def stream(self, data: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+        if self.row_count is None:
+            raise ValueError("row_count must be set before streaming an NPY bundle")
+
+        sink = _ChunkSink()
+        archive = zipfile.ZipFile(sink, "w")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Zip members are written one at a time, so metadata is spooled to
+            # disk while the vectors go straight into the archive.
+            metadata_path = Path(tmp_dir) / "metadata.parquet"
+            metadata_writer = self.pa.parquet.ParquetWriter(str(metadata_path), self.metadata_schema())
+
+            count = 0
+            dimension = None
+            with archive.open(self._member("vectors.npy"), "w", force_zip64=True) as member:
+                for items in self._batches(data):
+                    vectors = self._vectors(items)
+                    if dimension is None:
+                        dimension = vectors.shape[1]
+                        self._write_header(member, dimension)
+                    elif vectors.shape[1] != dimension:
+                        raise ValueError("All embeddings in an export must have the same dimension")
+
+                    count += len(items)
+                    if count > self.row_count:
+                        raise ValueError(f"Expected {self.row_count} rows but storage returned more")
+
+                    member.write(vectors.tobytes())
+                    metadata_writer.write_batch(self.metadata_batch(items))
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+
+                if dimension is None:
+                    self._write_header(member, 0)
+
+            metadata_writer.close()
+            if count != self.row_count:
+                raise ValueError(f"Expected {self.row_count} rows but storage returned {count}")
+
+            with open(metadata_path, "rb") as src, archive.open(self._member("metadata.parquet"), "w", force_zip64=True) as dest:
+                while True:
+                    block = src.read(1024 * 1024)
+                    if not block:
+                        break
+                    dest.write(block)
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+
+        archive.close()
+        yield sink.drain()
+
+
+FORMATTERS = {
+    "json": JsonFormatter,
+    "jsonl": JsonlFormatter,
+    "pinecone": PineconeFormatter,
+    "weaviate": WeaviateFormatter,
+    "qdrant": QdrantFormatter,
+    "parquet": ParquetFormatter,
+    "arrow": ArrowFormatter,
+    "npy": NpyBundleFormatter
+}
+
+
+def get_formatter(format_type: str, **options) -> StreamingFormatter:
     """
-    Get the appropriate formatter function.
-    
+    Get the appropriate streaming formatter.
+
     Args:
-        format_type: One of "json", "jsonl", "pinecone", "weaviate", "qdrant"
-        
+        format_type: One of "json", "jsonl", "pinecone", "weaviate", "qdrant",
+            "parquet", "arrow", "npy"
+        **options: Format-specific options (e.g. namespace, class_name, batch_size)
+            and serializer options (pretty, precision, chunk_size, backend)
+
     Returns:
-        Formatter function
+        StreamingFormatter instance
     """
-    formatters = {
-        "json": format_as_json,
-        "jsonl": format_as_jsonl,
-        "pinecone": format_for_pinecone,
-        "weaviate": format_for_weaviate,
-        "qdrant": format_for_qdrant
-    }
-    
-    if format_type not in formatters:
-        raise ValueError(f"Unsupported format: {format_type}. Choose from {list(formatters.keys())}")
-    
-    return formatters[format_type]
+    if format_type not in FORMATTERS:
+        raise ValueError(f"Unsupported format: {format_type}. Choose from {list(FORMATTERS.keys())}")
+
+    return FORMATTERS[format_type](**options)
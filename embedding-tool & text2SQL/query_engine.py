@@ -1,45 +1,258 @@
 import sqlite3
 import pandas as pd
-import google.generativeai as genai
+import requests
+from requests.adapters import HTTPAdapter
 from openai import OpenAI
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+import hashlib
+import hmac
+import base64
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 import json
 import re
+import threading
+from collections import OrderedDict
 from embeddings import EmbeddingGenerator
+from dictionary_index import DictionaryIndexStore, normalize_rows
+from table_loader import (
+    STATS_TABLE, bulk_load_csv, compute_column_stats, create_key_indexes, load_column_stats,
+    quote_identifier, save_column_stats, summarize_column_stats
+)
+from schema_retrieval import build_dictionary_bm25, reciprocal_rank_fusion, group_by_table, format_schema_block
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 
 logger = logging.getLogger(__name__)
 
+# Gemini REST endpoint; called through a pooled requests.Session instead of the
+# genai SDK, whose genai.configure() swaps a process-global client
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+GEMINI_STREAM_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent?alt=sse"
+
+# Generation failures are returned as a SELECT of the error message, starting with this
+GENERATION_ERROR = "SELECT 'Error generating SQL"
+
+class ReadConnectionPool:
+    """
+    Pool of read-only SQLite connections.
+    
+    A connection is checked out for the duration of one query, so concurrent
+    requests each read through their own connection instead of sharing one.
+    """
+    
+    def __init__(self, connect, max_idle: int = 8):
+        """
+        Args:
+            connect: Callable returning a new read-only connection
+            max_idle: Connections kept open between queries; extras are closed on release
+        """
+        self._connect = connect
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        
+    def acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+    
+    def release(self, conn: sqlite3.Connection):
+        # Drop any open read transaction so the next user sees fresh data
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+        
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+            
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
 class SchemaManager:
     """Manages the SQLite database and Data Dictionary."""
     
-    def __init__(self, db_path: str = ":memory:"):
+    def __init__(self, db_path: str = ":memory:", query_cache_size: int = 1024, index_dir: Optional[str] = None,
+                 max_idle_readers: int = 8, embedding_api_keys: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            db_path: SQLite file for uploaded tables, or ":memory:" for a private
+                shared-cache in-memory database
+            query_cache_size: Query embeddings kept in the LRU cache
+            index_dir: Directory of the persisted dictionary index (optional)
+            max_idle_readers: Read-only connections kept open in the pool
+            embedding_api_keys: {provider: API key} used to embed queries against
+                an index another worker built with an API provider
+        """
         self.db_path = db_path
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        self.cursor = self.conn.cursor()
+        if db_path == ":memory:":
+            # Named so reader connections can attach to the same in-memory database;
+            # it lives as long as the writer connection stays open
+            self._uri = f"file:schema_manager_{uuid.uuid4().hex}?mode=memory&cache=shared"
+            self._read_uri = self._uri
+        else:
+            path = Path(db_path).resolve().as_posix()
+            self._uri = f"file:{path}"
+            self._read_uri = f"file:{path}?mode=ro"
+        
+        # Single writer, used only by load_table under _write_lock
+        self.conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+        self._write_lock = threading.Lock()
+        if db_path != ":memory:":
+            # WAL lets readers keep querying while a table is being loaded
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.readers = ReadConnectionPool(self._connect_reader, max_idle=max_idle_readers)
+        
         self.data_dictionary = [] # List of dicts: {table_name, column_name, description, ...}
         self.table_schemas = {} # {table_name: [col1, col2...]}
+        self.column_types = {} # {table_name: {column: SQLite type}}
+        self.column_stats = {} # {table_name: {column: stats}}, computed once per load
+        # schema_version the three dicts above were read at; another worker's load bumps it
+        self._tables_version = None
+        self._tables_lock = threading.Lock()
         
         # For semantic search
+        self.embedding_api_keys = {k: v for k, v in (embedding_api_keys or {}).items() if v}
         self.embedding_generator = None
-        self.dictionary_embeddings = []
+        self.dictionary_index = None # (n_entries, dim) float32, rows L2-normalized
         self.dictionary_texts = []
+        self.lexical_index = None # BM25 over table/column names and descriptions
+        
+        # LRU cache of normalized query embeddings: {(provider, model, query): vector}
+        self.query_cache_size = query_cache_size
+        self._query_cache = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        
+        # Optional on-disk index shared by all worker processes
+        self.index_store = DictionaryIndexStore(index_dir) if index_dir else None
+        self._index_mtime = None
+        self._index_lock = threading.Lock()
+        self._sync_index()
+        self._load_existing_tables()
+        
+    def _connect_reader(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._read_uri, uri=True, check_same_thread=False, timeout=5.0)
+        conn.execute("PRAGMA query_only=1")
+        if self.db_path == ":memory:":
+            # Shared-cache readers would otherwise hit table locks held by the writer
+            conn.execute("PRAGMA read_uncommitted=1")
+        return conn
+    
+    @property
+    def schema_version(self) -> int:
+        """
+        Bumped whenever tables, the dictionary or its index change.
+        
+        Kept in the database header (PRAGMA user_version) rather than in this
+        object, so every worker process sharing the database sees the same value.
+        """
+        with self.readers.connection() as conn:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+        
+    def _bump_schema_version(self):
+        with self._write_lock:
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            self.conn.execute(f"PRAGMA user_version = {version + 1}")
+            self.conn.commit()
+    
+    def close(self):
+        """Closes the pooled readers and the writer connection."""
+        self.readers.close()
+        self.conn.close()
+        
+    def _load_existing_tables(self):
+        """Reads every table's columns, types and statistics from the database."""
+        version = self.schema_version
+        table_schemas, column_types = {}, {}
+        with self.readers.connection() as conn:
+            column_stats = load_column_stats(conn)
+            tables = conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name != ?;", (STATS_TABLE,)
+            ).fetchall()
+            for (table,) in tables:
+                info = conn.execute(f"PRAGMA table_info({quote_identifier(table)})").fetchall()
+                table_schemas[table] = [row[1] for row in info]
+                column_types[table] = {row[1]: row[2] for row in info}
+        # Swapped in whole so concurrent readers never see a half-built state
+        self.table_schemas, self.column_types, self.column_stats = table_schemas, column_types, column_stats
+        self._tables_version = version
+        
+    def _sync_tables(self):
+        """Reloads table state if the schema version moved, e.g. another worker loaded a table."""
+        if self.schema_version == self._tables_version:
+            return
+        with self._tables_lock:
+            if self.schema_version != self._tables_version:
+                self._load_existing_tables()
+                
+    def row_count(self, table_name: str) -> int:
+        """Rows in a loaded table, from its statistics (0 if unknown)."""
+        self._sync_tables()
+        return next(iter(self.column_stats.get(table_name, {}).values()), {}).get("row_count", 0)
         
     def load_table(self, table_name: str, csv_path: str):
-        """Loads a CSV into a SQLite table."""
+        """Loads a CSV into a typed SQLite table, indexing its join-key columns."""
         try:
-            df = pd.read_csv(csv_path)
             # Sanitize table name
             table_name = re.sub(r'\W+', '_', table_name)
-            df.to_sql(table_name, self.conn, if_exists='replace', index=False)
-            self.table_schemas[table_name] = df.columns.tolist()
-            logger.info(f"Loaded table '{table_name}' with {len(df)} rows.")
+            with self._write_lock:
+                columns, types, row_count = bulk_load_csv(
+                    self.conn, table_name, csv_path, descriptions=self._column_descriptions(table_name)
+                )
+                stats = compute_column_stats(self.conn, table_name, columns)
+                save_column_stats(self.conn, table_name, stats)
+                self.conn.commit()
+            self.table_schemas[table_name] = columns
+            self.column_types[table_name] = types
+            self.column_stats[table_name] = stats
+            self._bump_schema_version()
+            logger.info(f"Loaded table '{table_name}' with {row_count} rows.")
             return True, f"Table '{table_name}' loaded successfully."
         except Exception as e:
             logger.error(f"Error loading table {table_name}: {e}")
             return False, str(e)
+            
+    def column_stats_summary(self, entries: List[Dict]) -> Dict[Tuple[str, str], str]:
+        """
+        Prompt-ready statistics for the columns in retrieved schema entries.
+        
+        Returns:
+            {(table_name, column_name): summary} for columns that have statistics
+        """
+        self._sync_tables()
+        summaries = {}
+        for entry in entries:
+            table, column = str(entry.get('table_name')), str(entry.get('column_name'))
+            stats = self.column_stats.get(table, {}).get(column)
+            if stats:
+                sql_type = self.column_types.get(table, {}).get(column)
+                summaries[(table, column)] = summarize_column_stats(stats, sql_type)
+        return summaries
+        
+    def _column_descriptions(self, table_name: str) -> Dict[str, str]:
+        """{column: description} from the data dictionary for one table."""
+        return {
+            str(entry.get('column_name')): entry.get('description')
+            for entry in self.data_dictionary
+            if str(entry.get('table_name')) == table_name
+        }
 
     def load_data_dictionary(self, csv_path: str):
         """Loads the Data Dictionary CSV."""
@@ -54,6 +267,15 @@ class SchemaManager:
                 return False, f"Data Dictionary must contain columns: {required_cols}"
             
             self.data_dictionary = df.to_dict('records')
+            self.lexical_index = build_dictionary_bm25(self.data_dictionary)
+            
+            # Tables loaded before the dictionary may have newly marked join keys
+            self._sync_tables()
+            with self._write_lock:
+                for table, columns in self.table_schemas.items():
+                    create_key_indexes(self.conn, table, columns, self._column_descriptions(table))
+                self.conn.commit()
+            self._bump_schema_version()
             logger.info(f"Loaded Data Dictionary with {len(self.data_dictionary)} entries.")
             return True, "Data Dictionary loaded successfully."
         except Exception as e:
@@ -66,73 +288,318 @@ class SchemaManager:
             return False, "No Data Dictionary loaded."
             
         self.embedding_generator = EmbeddingGenerator(provider, api_key, model)
+        if api_key:
+            self.embedding_api_keys[self.embedding_generator.provider] = api_key
         
         # Create text representation for each entry
-        self.dictionary_texts = []
-        for entry in self.data_dictionary:
-            text = f"Table: {entry.get('table_name')} Column: {entry.get('column_name')} Description: {entry.get('description')}"
-            self.dictionary_texts.append(text)
+        self.dictionary_texts = [self._entry_text(entry) for entry in self.data_dictionary]
             
         # Generate embeddings
         try:
-            self.dictionary_embeddings = self.embedding_generator.generate_embeddings(self.dictionary_texts)
+            if self.index_store:
+                with self._index_lock:
+                    _, self.dictionary_index, embedded = self.index_store.update(
+                        self.data_dictionary, self.dictionary_texts, self.embedding_generator
+                    )
+                    self._index_mtime = self.index_store.manifest_mtime()
+                self._bump_schema_version()
+                reused = len(self.dictionary_texts) - embedded
+                logger.info(f"Data Dictionary indexed: {embedded} embedded, {reused} reused.")
+                return True, f"Data Dictionary indexed ({embedded} embedded, {reused} reused)."
+            
+            embeddings = self.embedding_generator.generate_embeddings(self.dictionary_texts)
+            self.dictionary_index = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+            self._bump_schema_version()
             logger.info("Data Dictionary indexed successfully.")
             return True, "Data Dictionary indexed."
         except Exception as e:
             logger.error(f"Error indexing dictionary: {e}")
             return False, str(e)
 
+    @staticmethod
+    def _entry_text(entry: Dict) -> str:
+        return f"Table: {entry.get('table_name')} Column: {entry.get('column_name')} Description: {entry.get('description')}"
+
+    def _sync_index(self):
+        """Loads the on-disk index if another process has written a newer one."""
+        if not self.index_store:
+            return
+        mtime = self.index_store.manifest_mtime()
+        if mtime is None or mtime == self._index_mtime:
+            return
+            
+        with self._index_lock:
+            if mtime == self._index_mtime:
+                return
+            stored = self.index_store.load()
+            if not stored:
+                return
+            manifest, matrix = stored
+            
+            generator = self.embedding_generator
+            if not generator or (generator.provider, generator.model) != (manifest["provider"], manifest["model"]):
+                try:
+                    generator = EmbeddingGenerator(
+                        manifest["provider"], self.embedding_api_keys.get(manifest["provider"]), manifest["model"]
+                    )
+                except Exception as e:
+                    # Without a way to embed queries the index is unusable here; keep the
+                    # current state and don't retry until the index changes again
+                    logger.warning(
+                        f"Skipping dictionary index sync: cannot embed queries with "
+                        f"{manifest['provider']}/{manifest['model']} ({e}). Configure its API key for this worker."
+                    )
+                    self._index_mtime = mtime
+                    return
+            
+            self.data_dictionary = manifest["entries"]
+            self.lexical_index = build_dictionary_bm25(self.data_dictionary)
+            self.dictionary_texts = [self._entry_text(entry) for entry in self.data_dictionary]
+            self.dictionary_index = matrix
+            self.embedding_generator = generator
+            self._index_mtime = mtime
+            logger.info(f"Loaded dictionary index with {len(self.data_dictionary)} entries from disk.")
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Returns normalized float32 query embeddings, embedding only cache misses."""
+        generator = self.embedding_generator
+        keys = [(generator.provider, generator.model, q) for q in queries]
+        vectors = {}
+        
+        with self._query_cache_lock:
+            for key in keys:
+                if key in self._query_cache:
+                    self._query_cache.move_to_end(key)
+                    vectors[key] = self._query_cache[key]
+        
+        missing = list(dict.fromkeys(key for key in keys if key not in vectors))
+        if missing:
+            embedded = generator.generate_embeddings([key[2] for key in missing])
+            embedded = normalize_rows(np.asarray(embedded, dtype=np.float32))
+            with self._query_cache_lock:
+                for key, vector in zip(missing, embedded):
+                    vectors[key] = vector
+                    self._query_cache[key] = vector
+                    self._query_cache.move_to_end(key)
+                while len(self._query_cache) > self.query_cache_size:
+                    self._query_cache.popitem(last=False)
+        
+        return np.stack([vectors[key] for key in keys])
+
+    def embed_query(self, query: str) -> Optional[np.ndarray]:
+        """Normalized embedding of a question (cached), or None if no embedding index is set up."""
+        self._sync_index()
+        if not self.embedding_generator or self.dictionary_index is None:
+            return None
+        try:
+            return self._embed_queries([query])[0]
+        except Exception as e:
+            logger.warning(f"Could not embed query: {e}")
+            return None
+
     def search_relevant_schema(self, query: str, top_k: int = 10) -> List[Dict]:
         """Finds relevant dictionary entries for a user query."""
-        if not self.embedding_generator or not self.dictionary_embeddings:
-            # Fallback: Return all if no index (or simple keyword match could be added)
-            return self.data_dictionary[:20] 
-            
-        query_embedding = self.embedding_generator.generate_embeddings([query])[0]
+        return self.search_relevant_schema_batch([query], top_k)[0]
+
+    def search_relevant_schema_grouped(self, query: str, top_k: int = 10) -> Dict[str, List[Dict]]:
+        """Relevant dictionary entries grouped by table, without duplicate columns."""
+        return group_by_table(self.search_relevant_schema(query, top_k))
+
+    def search_relevant_schema_batch(self, queries: List[str], top_k: int = 10) -> List[List[Dict]]:
+        """
+        Finds relevant dictionary entries for several queries.
+        
+        BM25 and embedding rankings are combined with reciprocal rank fusion;
+        BM25 alone is used when no embedding index is available.
+        """
+        if not queries:
+            return []
+        self._sync_index()
         
-        # Calculate similarity
-        sims = cosine_similarity([query_embedding], self.dictionary_embeddings)[0]
+        # Rank a wider candidate pool than top_k so fusion has overlap to work with
+        pool = max(top_k * 3, 50)
         
-        # Get top k
-        top_indices = np.argsort(sims)[::-1][:top_k]
+        rankings = [[] for _ in queries]
+        if self.lexical_index:
+            for i, query in enumerate(queries):
+                rankings[i].append([doc_id for doc_id, _ in self.lexical_index.search(query, pool)])
+                
+        if self.embedding_generator and self.dictionary_index is not None and len(self.dictionary_index):
+            for i, dense in enumerate(self._dense_rankings(queries, pool)):
+                rankings[i].append(dense)
         
         results = []
-        for idx in top_indices:
-            results.append(self.data_dictionary[idx])
+        for query_rankings in rankings:
+            fused = reciprocal_rank_fusion(r for r in query_rankings if r)
+            if not fused:
+                # Nothing matched: fall back to the start of the dictionary
+                results.append(self.data_dictionary[:20])
+                continue
+            results.append([self.data_dictionary[idx] for idx in fused[:top_k]])
             
         return results
 
+    def _dense_rankings(self, queries: List[str], top_k: int) -> List[List[int]]:
+        """Embedding-similarity rankings computed with one matrix product."""
+        query_matrix = self._embed_queries(queries)
+        
+        # Rows are normalized, so the dot product is the cosine similarity
+        sims = query_matrix @ self.dictionary_index.T
+        
+        k = min(top_k, sims.shape[1])
+        
+        # argpartition finds the top k in O(n); only those k are sorted
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        rankings = []
+        for row, candidates in enumerate(top):
+            rankings.append(candidates[np.argsort(-sims[row, candidates])].tolist())
+            
+        return rankings
+
     def get_all_tables(self):
         """Returns list of all table names in DB."""
-        self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        return [row[0] for row in self.cursor.fetchall()]
+        with self.readers.connection() as conn:
+            rows = conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name != ?;", (STATS_TABLE,)
+            ).fetchall()
+        return [row[0] for row in rows]
 
 class SQLGenerator:
     """Generates SQL using Gemini or OpenAI."""
     
-    def __init__(self, api_key: str, model_name: str = "gemini-1.5-pro"):
+    def __init__(self, api_key: str, model_name: str = "gemini-1.5-pro", max_concurrency: int = 4, timeout: float = 120):
+        """
+        Args:
+            api_key: Gemini or OpenAI API key
+            model_name: "gpt-*" models use OpenAI, anything else Gemini
+            max_concurrency: Maximum in-flight requests through this client
+            timeout: Request timeout in seconds
+        """
         self.model_name = str(model_name)
         self.api_key = api_key
-        self.provider = "google"
+        self.provider = self.provider_for(self.model_name)
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        # Caps concurrent calls so simultaneous queries queue for a warm connection
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # Requests using this client, and whether the pool has dropped it
+        self._state_lock = threading.Lock()
+        self._in_flight = 0
+        self._retired = False
+        self._connect()
         
-        if self.model_name.lower().startswith("gpt"):
-            self.provider = "openai"
-            self.client = OpenAI(api_key=api_key)
+    def _connect(self):
+        if self.provider == "openai":
+            # The OpenAI client is thread-safe and keeps its HTTP connections alive
+            self.client = OpenAI(api_key=self.api_key, timeout=self.timeout)
         else:
-            self.provider = "google"
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel(self.model_name)
+            self.session = requests.Session()
+            self.session.headers.update({"x-goog-api-key": self.api_key, "Content-Type": "application/json"})
+            self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency))
+            self.gemini_url = GEMINI_API_URL.format(model=self.model_name.split("/")[-1])
+            self.gemini_stream_url = GEMINI_STREAM_URL.format(model=self.model_name.split("/")[-1])
+        self.closed = False
+            
+    @staticmethod
+    def provider_for(model_name: str) -> str:
+        return "openai" if str(model_name).lower().startswith("gpt") else "google"
         
-    def generate_sql(self, question: str, schema_context: List[Dict], all_tables: List[str]) -> str:
-        """
-        Generates a SQL query based on the question and schema context.
-        """
-        # Construct the prompt
-        schema_text = ""
-        for item in schema_context:
-            schema_text += f"- Table: {item.get('table_name')}, Column: {item.get('column_name')}, Description: {item.get('description')}\n"
+    def close(self):
+        """Releases pooled connections."""
+        if self.provider == "openai":
+            self.client.close()
+        else:
+            self.session.close()
+        self.closed = True
+        
+    def retire(self):
+        """Closes the client once no request is using it (called when the pool drops it)."""
+        with self._state_lock:
+            self._retired = True
+            idle = self._in_flight == 0 and not self.closed
+        if idle:
+            self.close()
+            
+    @contextmanager
+    def _request_slot(self):
+        """Holds one of the client's concurrency slots for the duration of a request."""
+        with self._state_lock:
+            self._in_flight += 1
+            if self.closed:
+                # Retired between the pool handing it out and this request starting
+                self._connect()
+        try:
+            with self._slots:
+                yield
+        finally:
+            with self._state_lock:
+                self._in_flight -= 1
+                close = self._retired and self._in_flight == 0 and not self.closed
+            if close:
+                self.close()
+            
+    def _messages(self, prompt: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": "You are a helpful SQL assistant."},
+            {"role": "user", "content": prompt}
+        ]
+        
+    def _gemini_body(self, prompt: str) -> Dict[str, Any]:
+        return {"contents": [{"parts": [{"text": prompt}]}], "generationConfig": {"temperature": 0}}
+        
+    def _complete(self, prompt: str) -> str:
+        """Sends one prompt to the provider and returns the raw completion text."""
+        with self._request_slot():
+            if self.provider == "openai":
+                response = self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=self._messages(prompt),
+                    temperature=0
+                )
+                return response.choices[0].message.content
+            
+            # Google Gemini
+            response = self.session.post(self.gemini_url, json=self._gemini_body(prompt), timeout=self.timeout)
+            if not response.ok:
+                raise RuntimeError(f"Gemini API error {response.status_code}: {response.text[:500]}")
+            parts = response.json()["candidates"][0]["content"]["parts"]
+            return "".join(part.get("text", "") for part in parts)
             
-        prompt = f"""You are an expert SQL data analyst. 
+    def _stream_complete(self, prompt: str) -> Iterator[str]:
+        """Like _complete, but yields text deltas as the provider produces them."""
+        with self._request_slot():
+            if self.provider == "openai":
+                stream = self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=self._messages(prompt),
+                    temperature=0,
+                    stream=True
+                )
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+                return
+            
+            # Google Gemini: server-sent events, one JSON payload per "data:" line
+            with self.session.post(self.gemini_stream_url, json=self._gemini_body(prompt),
+                                   timeout=self.timeout, stream=True) as response:
+                if not response.ok:
+                    raise RuntimeError(f"Gemini API error {response.status_code}: {response.text[:500]}")
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    payload = json.loads(line[5:])
+                    for candidate in payload.get("candidates", [])[:1]:
+                        for part in candidate.get("content", {}).get("parts", []):
+                            if part.get("text"):
+                                yield part["text"]
+        
+    def build_prompt(self, question: str, schema_context: List[Dict], all_tables: List[str],
+                     column_stats: Optional[Dict[Tuple[str, str], str]] = None) -> str:
+        """Prompt sent to the LLM for a question; column_stats come from SchemaManager.column_stats_summary."""
+        schema_text = format_schema_block(schema_context, column_stats)
+            
+        return f"""You are an expert SQL data analyst. 
         Your task is to generate a valid SQLite SQL query to answer the user's question.
         
         Available Tables: {', '.join(all_tables)}
@@ -147,60 +614,458 @@ class SQLGenerator:
         2. Use only the tables and columns provided in the schema information or available tables list.
         3. The database is SQLite. Use SQLite syntax.
         4. If the question cannot be answered with the available data, return "SELECT 'Cannot answer question with available data' as error".
+        5. Notes in [brackets] after a column give its type, distinct count and existing values; match those literal values exactly.
         """
         
+    @staticmethod
+    def clean_sql(text: str) -> str:
+        """Strips whitespace and markdown code fences from a completion."""
+        sql = text.strip()
+        
+        # Clean up markdown if present (just in case)
+        if sql.startswith("```sql"):
+            sql = sql[6:]
+        if sql.startswith("```"):
+            sql = sql[3:]
+        if sql.endswith("```"):
+            sql = sql[:-3]
+            
+        return sql.strip()
+        
+    def generate_sql(self, question: str, schema_context: List[Dict], all_tables: List[str],
+                     column_stats: Optional[Dict[Tuple[str, str], str]] = None) -> str:
+        """
+        Generates a SQL query based on the question and schema context.
+        """
+        prompt = self.build_prompt(question, schema_context, all_tables, column_stats)
+        
         try:
-            if self.provider == "openai":
-                response = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "system", "content": "You are a helpful SQL assistant."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0
-                )
-                sql = response.choices[0].message.content.strip()
-            else:
-                # Google Gemini
-                response = self.model.generate_content(prompt)
-                sql = response.text.strip()
-            
-            # Clean up markdown if present (just in case)
-            if sql.startswith("```sql"):
-                sql = sql[6:]
-            if sql.startswith("```"):
-                sql = sql[3:]
-            if sql.endswith("```"):
-                sql = sql[:-3]
-                
-            return sql.strip()
+            return self.clean_sql(self._complete(prompt))
+        except Exception as e:
+            return f"{GENERATION_ERROR}: {str(e)}' as error"
             
+    def repair_sql(self, question: str, schema_context: List[Dict], all_tables: List[str], sql: str, problem: str,
+                   column_stats: Optional[Dict[Tuple[str, str], str]] = None) -> str:
+        """
+        Asks the LLM to fix a query that failed validation.
+        
+        Args:
+            sql: The rejected query
+            problem: What validation found (SQLite error or full table scans)
+        """
+        prompt = self.build_prompt(question, schema_context, all_tables, column_stats) + f"""
+        A previous attempt produced this query:
+        {sql}
+        
+        It was rejected before running: {problem}
+        Return ONLY the corrected SQL query.
+        """
+        
+        try:
+            return self.clean_sql(self._complete(prompt))
         except Exception as e:
-            return f"SELECT 'Error generating SQL: {str(e)}' as error"
+            return f"{GENERATION_ERROR}: {str(e)}' as error"
+        
+    def stream_sql(self, question: str, schema_context: List[Dict], all_tables: List[str],
+                   column_stats: Optional[Dict[Tuple[str, str], str]] = None) -> Iterator[str]:
+        """
+        Streams the raw completion text for a question, token by token.
+        
+        Callers join the deltas and pass the result through clean_sql.
+        Errors propagate to the caller.
+        """
+        prompt = self.build_prompt(question, schema_context, all_tables, column_stats)
+        yield from self._stream_complete(prompt)
+
+class SQLGeneratorPool:
+    """
+    Reuses SQLGenerator clients across requests, keyed by (provider, model, key hash),
+    so each query gets a warm HTTP connection instead of a fresh client.
+    """
+    
+    def __init__(self, max_clients: int = 32, max_concurrency: int = 4):
+        """
+        Args:
+            max_clients: Clients kept before the least recently used is dropped; it is
+                closed once its in-flight requests finish
+            max_concurrency: Per-client limit on in-flight requests
+        """
+        self.max_clients = max_clients
+        self.max_concurrency = max_concurrency
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        
+    @staticmethod
+    def _key(api_key: str, model_name: str) -> Tuple[str, str, str]:
+        # Never keep raw API keys as dictionary keys
+        key_hash = hashlib.sha256(str(api_key).encode("utf-8")).hexdigest()[:16]
+        return SQLGenerator.provider_for(model_name), str(model_name), key_hash
+        
+    def get(self, api_key: str, model_name: str = "gemini-1.5-pro") -> SQLGenerator:
+        """Returns the pooled client for this provider, model and key, creating it once."""
+        key = self._key(api_key, model_name)
+        with self._lock:
+            if key in self._clients:
+                self._clients.move_to_end(key)
+                return self._clients[key]
+            
+            generator = SQLGenerator(api_key, model_name, max_concurrency=self.max_concurrency)
+            self._clients[key] = generator
+            evicted = []
+            while len(self._clients) > self.max_clients:
+                evicted.append(self._clients.popitem(last=False)[1])
+        # Requests still using an evicted client finish first; it closes after the last one
+        for client in evicted:
+            client.retire()
+        return generator
+
+# A predicate an index could serve; scans of unfiltered queries (e.g. aggregates) are unavoidable
+FILTER_CLAUSE = re.compile(r'(?i)\b(?:where|on|using)\b')
+
+# FROM/JOIN table references, with an optional alias
+TABLE_REFERENCE = re.compile(r'(?i)\b(?:from|join)\s+("[^"]+"|`[^`]+`|\[[^\]]+\]|\w+)(?:\s+(?:as\s+)?(\w+))?')
+SQL_KEYWORDS = {
+    "where", "join", "inner", "left", "right", "full", "outer", "cross", "natural", "on", "using",
+    "group", "order", "limit", "having", "union", "except", "intersect", "window", "as"
+}
+
+class QueryTimeout(Exception):
+    """Raised when a query exceeds its time budget."""
+
 
 class SQLExecutor:
     """Executes SQL on the SchemaManager's DB."""
     
-    def __init__(self, schema_manager: SchemaManager):
+    # SQLite VM instructions between progress handler checks
+    PROGRESS_INTERVAL = 1000
+    
+    def __init__(self, schema_manager: SchemaManager, max_rows: int = 10000, page_size: int = 500,
+                 timeout: float = 30.0, secret: Optional[bytes] = None, large_table_rows: int = 100000):
+        """
+        Args:
+            schema_manager: Owner of the query database
+            max_rows: Hard cap on rows returned for one query, across all pages
+            page_size: Default rows per page for execute_page
+            timeout: Seconds of SQLite work allowed per query (None disables it)
+            secret: Key used to sign page tokens (random per process if omitted)
+            large_table_rows: Tables with at least this many rows are flagged when fully scanned
+        """
         self.manager = schema_manager
+        self.max_rows = max_rows
+        self.page_size = page_size
+        self.timeout = timeout
+        self.secret = secret or os.urandom(32)
+        self.large_table_rows = large_table_rows
+        
+    def _run(self, conn: sqlite3.Connection, call, budget: Dict[str, float]):
+        """
+        Runs one SQLite call under the remaining time budget.
+        
+        `budget["remaining"]` is reduced by the time spent, so a query that is
+        fetched in several calls shares one budget.
+        """
+        if self.timeout is None:
+            return call()
+        
+        started = time.monotonic()
+        deadline = started + budget["remaining"]
+        expired = []
+        
+        def check():
+            if time.monotonic() > deadline:
+                expired.append(True)
+                return 1
+            return 0
+        
+        # The handler is per connection, and each query has its own pooled reader
+        conn.set_progress_handler(check, self.PROGRESS_INTERVAL)
+        try:
+            return call()
+        except sqlite3.OperationalError:
+            if expired:
+                raise QueryTimeout(f"Query timed out after {self.timeout:g}s")
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+            budget["remaining"] -= time.monotonic() - started
+        
+    def _new_budget(self) -> Dict[str, float]:
+        return {"remaining": self.timeout if self.timeout is not None else 0.0}
+        
+    @staticmethod
+    def _table_aliases(sql: str) -> Dict[str, str]:
+        """{alias or name: table} for tables referenced in FROM/JOIN clauses."""
+        aliases = {}
+        for table, alias in TABLE_REFERENCE.findall(sql):
+            table = table.strip('"`[]')
+            aliases[table] = table
+            if alias and alias.lower() not in SQL_KEYWORDS:
+                aliases[alias.strip('"`[]')] = table
+        return aliases
+        
+    def validate(self, sql: str) -> Tuple[Optional[str], List[str]]:
+        """
+        Checks SQL with EXPLAIN QUERY PLAN without running it.
+        
+        Returns:
+            (error, full_scans): error is SQLite's message for SQL that cannot run
+            (syntax errors, missing tables or columns); full_scans names large
+            tables the plan reads end to end without an index, reported only
+            when the query has a filter or join condition an index could serve
+        """
+        try:
+            with self.manager.readers.connection() as conn:
+                plan = self._run(conn, lambda: conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall(), self._new_budget())
+        except QueryTimeout as e:
+            return str(e), []
+        except sqlite3.Error as e:
+            return str(e), []
+        
+        full_scans = []
+        if not FILTER_CLAUSE.search(sql):
+            return None, full_scans
+        
+        aliases = self._table_aliases(sql)
+        for row in plan:
+            match = re.match(r"SCAN (?:TABLE )?(\S+)$", row[-1])
+            if not match:
+                continue
+            table = aliases.get(match.group(1), match.group(1))
+            row_count = self.manager.row_count(table)
+            if row_count >= self.large_table_rows:
+                full_scans.append(f"{table} ({row_count} rows)")
+        return None, full_scans
         
     def execute(self, sql: str) -> Tuple[List[str], List[Any], Optional[str]]:
         """
         Executes SQL and returns (columns, rows, error).
+        
+        At most max_rows rows are returned; use execute_page to page through more.
         """
+        budget = self._new_budget()
         try:
-            cursor = self.manager.conn.cursor()
-            cursor.execute(sql)
-            
-            if cursor.description:
-                columns = [description[0] for description in cursor.description]
-                rows = cursor.fetchall()
-                return columns, rows, None
-            else:
-                # For INSERT/UPDATE/DELETE (though we mainly do SELECT)
-                self.manager.conn.commit()
-                return [], [], "Query executed successfully (no results)."
+            with self.manager.readers.connection() as conn:
+                cursor = conn.cursor()
+                self._run(conn, lambda: cursor.execute(sql), budget)
+                
+                if cursor.description:
+                    columns = [description[0] for description in cursor.description]
+                    rows = self._run(conn, lambda: cursor.fetchmany(self.max_rows), budget)
+                    cursor.close()
+                    return columns, rows, None
+                else:
+                    # Reader connections are query_only, so writes fail before getting here
+                    return [], [], "Query executed successfully (no results)."
                 
+        except QueryTimeout as e:
+            logger.warning(f"SQL Execution Timeout: {e}")
+            return [], [], str(e)
         except Exception as e:
             logger.error(f"SQL Execution Error: {e}")
             return [], [], str(e)
+    
+    def make_page_token(self, sql: str, offset: int, page_size: int) -> str:
+        """Signed, opaque token for the page of `sql` starting at `offset`."""
+        payload = json.dumps({
+            "sql": sql,
+            "offset": offset,
+            "page_size": page_size,
+            "schema_version": self.manager.schema_version
+        }, separators=(",", ":")).encode("utf-8")
+        signature = hmac.new(self.secret, payload, hashlib.sha256).digest()[:16]
+        return base64.urlsafe_b64encode(signature + payload).decode("ascii")
+    
+    def read_page_token(self, token: str) -> Dict[str, Any]:
+        """
+        Decodes a page token.
+        
+        Raises:
+            ValueError: If the token is malformed, was not issued by this server,
+                or the tables changed since it was issued
+        """
+        try:
+            raw = base64.urlsafe_b64decode(token.encode("ascii"))
+        except (ValueError, UnicodeEncodeError):
+            raise ValueError("Malformed page token")
+        signature, payload = raw[:16], raw[16:]
+        expected = hmac.new(self.secret, payload, hashlib.sha256).digest()[:16]
+        if not hmac.compare_digest(signature, expected):
+            raise ValueError("Invalid page token")
+        state = json.loads(payload)
+        if state["schema_version"] != self.manager.schema_version:
+            raise ValueError("Page token expired: tables changed since the query ran")
+        return state
+    
+    def execute_page(self, sql: Optional[str] = None, page_token: Optional[str] = None,
+                     page_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Executes one page of a query.
+        
+        The statement runs exactly as written, so column names (duplicates
+        from joins included) and trailing comments behave as in validate().
+        Rows are stepped through with fetchmany: SQLite stops after the page
+        instead of materializing the whole result, and a later page re-runs
+        the query and skips the rows already sent.
+        
+        Args:
+            sql: Query to run (first page)
+            page_token: Token from a previous page (takes precedence over sql)
+            page_size: Rows per page (defaults to self.page_size)
+            
+        Returns:
+            Dict with columns, rows, next_page_token, truncated, timed_out and error
+        """
+        result = {"columns": [], "rows": [], "next_page_token": None,
+                  "truncated": False, "timed_out": False, "error": None}
+        offset = 0
+        if page_token:
+            try:
+                state = self.read_page_token(page_token)
+            except ValueError as e:
+                result["error"] = str(e)
+                return result
+            sql, offset, page_size = state["sql"], state["offset"], state["page_size"]
+        page_size = max(1, min(page_size or self.page_size, self.max_rows))
+        
+        # Never read past the hard cap; one extra row tells us whether more exist
+        limit = min(page_size, self.max_rows - offset)
+        
+        budget = self._new_budget()
+        try:
+            with self.manager.readers.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    self._run(conn, lambda: cursor.execute(sql), budget)
+                    if not cursor.description:
+                        result["error"] = "Query executed successfully (no results)."
+                        return result
+                    
+                    result["columns"] = [description[0] for description in cursor.description]
+                    skip = offset
+                    while skip > 0:
+                        skipped = self._run(conn, lambda: cursor.fetchmany(min(skip, self.page_size)), budget)
+                        if not skipped:
+                            break
+                        skip -= len(skipped)
+                    rows = self._run(conn, lambda: cursor.fetchmany(limit + 1), budget)
+                finally:
+                    cursor.close()
+        except QueryTimeout as e:
+            logger.warning(f"SQL Execution Timeout: {e}")
+            result.update(error=str(e), timed_out=True)
+            return result
+        except Exception as e:
+            logger.error(f"SQL Execution Error: {e}")
+            result["error"] = str(e)
+            return result
+        
+        has_more = len(rows) > limit
+        result["rows"] = rows[:limit]
+        end = offset + len(result["rows"])
+        if has_more and end >= self.max_rows:
+            result["truncated"] = True
+        elif has_more:
+            result["next_page_token"] = self.make_page_token(sql, end, page_size)
+        return result
+            
+    def execute_pages(self, sql: str, page_size: int = 500) -> Iterator[Tuple[List[str], List[Any]]]:
+        """
+        Executes SQL and yields (columns, rows) pages as SQLite produces them.
+        
+        The first page may be empty so columns are known before any rows arrive.
+        Stops after max_rows rows. Errors, including QueryTimeout, propagate to
+        the caller.
+        """
+        budget = self._new_budget()
+        with self.manager.readers.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                self._run(conn, lambda: cursor.execute(sql), budget)
+                if not cursor.description:
+                    return
+                
+                columns = [description[0] for description in cursor.description]
+                yield columns, []
+                remaining = self.max_rows
+                while remaining > 0:
+                    rows = self._run(conn, lambda: cursor.fetchmany(min(page_size, remaining)), budget)
+                    if not rows:
+                        break
+                    remaining -= len(rows)
+                    yield columns, rows
+            finally:
+                cursor.close()
+
+def generate_validated_sql(generator: SQLGenerator, executor: SQLExecutor, question: str,
+                           schema_context: List[Dict], all_tables: List[str],
+                           column_stats: Optional[Dict[Tuple[str, str], str]] = None,
+                           max_repairs: int = 1, sql: Optional[str] = None) -> Tuple[str, List[Dict[str, Any]], bool]:
+    """
+    Generates SQL and validates it with EXPLAIN QUERY PLAN, repairing it if needed.
+    
+    Invalid SQL (missing tables/columns, syntax errors) and avoidable full scans
+    of large tables are sent back to the LLM with the problem, at most
+    max_repairs times. A query that still scans after its repairs is accepted,
+    since some questions need a full scan, and a repair that fails or does not
+    validate cleanly never replaces a query that did.
+    
+    Args:
+        sql: Already generated SQL to validate instead of generating it
+        
+    Returns:
+        (sql, steps, failed): steps records each step's name, duration in ms and
+        findings; failed is True when sql is only the SELECT of a generation error
+    """
+    steps = []
+    
+    if sql is None:
+        started = time.perf_counter()
+        sql = generator.generate_sql(question, schema_context, all_tables, column_stats)
+        steps.append({"step": "generate", "ms": round((time.perf_counter() - started) * 1000, 1)})
+    
+    # Last SQL that validated without an error
+    runnable = None
+    for attempt in range(max_repairs + 1):
+        # Generation failures are already a SELECT of the error message
+        if sql.startswith(GENERATION_ERROR):
+            if runnable is not None:
+                # The repair call failed: keep the query that worked
+                sql = runnable
+            break
+        
+        started = time.perf_counter()
+        error, full_scans = executor.validate(sql)
+        steps.append({
+            "step": "validate",
+            "ms": round((time.perf_counter() - started) * 1000, 1),
+            "error": error,
+            "full_scans": full_scans
+        })
+        if error:
+            if runnable is not None:
+                # The repair broke a query that worked: keep the working one
+                sql = runnable
+                break
+            problem = f"SQLite error: {error}"
+        elif full_scans:
+            runnable = sql
+            problem = (
+                f"it scans every row of {', '.join(full_scans)}. Filter or join on indexed columns "
+                "if the question allows; otherwise return the query unchanged."
+            )
+        else:
+            break
+        if attempt == max_repairs:
+            break
+        
+        started = time.perf_counter()
+        try:
+            repaired = generator.repair_sql(question, schema_context, all_tables, sql, problem, column_stats)
+        except Exception as e:
+            repaired = f"{GENERATION_ERROR}: {str(e)}' as error"
+        steps.append({"step": "repair", "ms": round((time.perf_counter() - started) * 1000, 1), "problem": problem})
+        if not error and repaired == sql:
+            break
+        sql = repaired
+    
+    return sql, steps, sql.startswith(GENERATION_ERROR)
@@ -0,0 +1,134 @@
+"""
+Lexical retrieval over the data dictionary.
+
+A small in-process BM25 index over table names, column names and
+descriptions, plus reciprocal rank fusion to combine it with the dense
+(embedding) ranking and helpers to group results by table.
+"""
+
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it",
+    "many", "me", "of", "on", "or", "show", "that", "the", "to", "what", "which", "who", "with"
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; snake_case and camelCase names are split into words."""
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", str(text))
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", text.lower()):
+        if token in STOPWORDS:
+            continue
+        # Crude plural folding so "accounts" matches "account"
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of documents."""
+
+    def __init__(self, documents: Sequence[List[str]], k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            documents: Tokenized documents
+            k1: Term frequency saturation
+            b: Length normalization
+        """
+        self.k1 = k1
+        self.b = b
+        self.doc_count = len(documents)
+        self.doc_lengths = [len(doc) for doc in documents]
+        self.avg_length = (sum(self.doc_lengths) / self.doc_count) if self.doc_count else 0.0
+
+        # Inverted index: {token: [(doc, term_frequency), ...]}
+        self.postings = defaultdict(list)
+        for doc_id, doc in enumerate(documents):
+            for token, tf in Counter(doc).items():
+                self.postings[token].append((doc_id, tf))
+
+        self.idf = {
+            token: math.log(1 + (self.doc_count - len(posts) + 0.5) / (len(posts) + 0.5))
+            for token, posts in self.postings.items()
+        }
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
+        """Returns up to top_k (doc_id, score) pairs with a positive score, best first."""
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            idf = self.idf.get(token)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[token]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / (self.avg_length or 1.0))
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+
+def build_dictionary_bm25(entries: Iterable[Dict]) -> BM25Index:
+    """BM25 index over dictionary entries; table and column names count double."""
+    documents = []
+    for entry in entries:
+        names = tokenize(entry.get("table_name", "")) + tokenize(entry.get("column_name", ""))
+        documents.append(names * 2 + tokenize(entry.get("description", "")))
+    return BM25Index(documents)
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[int]], k: int = 60) -> List[int]:
+    """
+    Fuse several rankings of document ids.
+
+    Args:
+        rankings: Lists of doc ids, best first
+        k: RRF damping constant
+
+    Returns:
+        Doc ids ordered by fused score
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
+
+
+def group_by_table(entries: Iterable[Dict]) -> Dict[str, List[Dict]]:
+    """Groups entries by table in order of first appearance, dropping duplicate columns."""
+    grouped = {}
+    seen = set()
+    for entry in entries:
+        table = str(entry.get("table_name"))
+        key = (table, str(entry.get("column_name")))
+        if key in seen:
+            continue
+        seen.add(key)
+        grouped.setdefault(table, []).append(entry)
+    return grouped
+
+
+def format_schema_block(entries: Iterable[Dict], column_stats: Optional[Dict[Tuple[str, str], str]] = None) -> str:
+    """
+    Compact prompt text: one header per table, one line per column.
+
+    Args:
+        entries: Dictionary entries
+        column_stats: {(table, column): summary} appended to matching columns (optional)
+    """
+    column_stats = column_stats or {}
+    lines = []
+    for table, columns in group_by_table(entries).items():
+        lines.append(f"Table: {table}")
+        for entry in columns:
+            line = f"  - {entry.get('column_name')}: {entry.get('description')}"
+            stats = column_stats.get((table, str(entry.get("column_name"))))
+            if stats:
+                line += f" [{stats}]"
+            lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,79 @@
+"""
+JSON serializers for the export hot path.
+
+Uses orjson when it is installed and falls back to the standard library.
+Output is compact unless pretty printing is requested, and vectors are
+encoded directly from NumPy arrays.
+"""
+
+import json
+from typing import Any, Optional
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonSerializer:
+    """Serializes export objects to JSON text."""
+
+    def __init__(self, pretty: bool = False, precision: Optional[int] = None, backend: Optional[str] = None):
+        """
+        Args:
+            pretty: Indent output with two spaces (one value per line)
+            precision: Round vector components to this many decimal places
+            backend: "orjson" or "json"; defaults to orjson when available
+        """
+        self.pretty = pretty
+        self.precision = precision
+        self.backend = backend or ("orjson" if orjson else "json")
+
+        if self.backend == "orjson":
+            if orjson is None:
+                raise ImportError("orjson is not installed. Install it with: pip install orjson")
+            self._option = orjson.OPT_SERIALIZE_NUMPY
+            if pretty:
+                self._option |= orjson.OPT_INDENT_2
+        elif self.backend != "json":
+            raise ValueError(f"Unsupported serializer backend: {self.backend}. Choose from ['orjson', 'json']")
+
+    @staticmethod
+    def _default(obj: Any) -> Any:
+        if isinstance(obj, (np.ndarray, np.generic)):
+            return obj.tolist()
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    def vector(self, values: Any) -> np.ndarray:
+        """Convert an embedding to a float array, applying the configured precision."""
+        vector = np.asarray(values)
+        if vector.dtype.kind != "f":
+            vector = vector.astype(np.float64)
+        if self.precision is not None:
+            vector = np.round(vector, self.precision)
+        return vector
+
+    def dumps(self, obj: Any) -> str:
+        """Serialize an object to a JSON string."""
+        if self.backend == "orjson":
+            return orjson.dumps(obj, option=self._option).decode("utf-8")
+        if self.pretty:
+            return json.dumps(obj, indent=2, default=self._default)
+        return json.dumps(obj, separators=(",", ":"), default=self._default)
+
+
+def get_serializer(pretty: bool = False, precision: Optional[int] = None, backend: Optional[str] = None) -> JsonSerializer:
+    """
+    Get a JSON serializer.
+
+    Args:
+        pretty: Indent output with two spaces
+        precision: Decimal places kept for vector components (None keeps full precision)
+        backend: "orjson" or "json" (optional)
+
+    Returns:
+        JsonSerializer instance
+    """
+    return JsonSerializer(pretty=pretty, precision=precision, backend=backend)
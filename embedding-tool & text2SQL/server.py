@@ -23,6 +23,7 @@ import tempfile
 from embeddings import process_csv_chunk
 from formatters import get_formatter
 import database as db
+import export_cache
 import numpy as np
 from sklearn.cluster import KMeans
 from sklearn.metrics.pairwise import cosine_similarity
@@ -364,6 +365,7 @@ def cluster_embeddings():
         ids = [row['id'] for row in embedding_rows]
         cluster_map = {row_id: int(label) for row_id, label in zip(ids, labels)}
         db.update_cluster_ids(job_id, cluster_map)
+        export_cache.invalidate_job(job_id)
         
         # Generate summary
         unique, counts = np.unique(labels, return_counts=True)
@@ -481,73 +483,81 @@ def download_embeddings(format_type):
     try:
         data = request.json
         job_id = data.get('session_id')
-        return download_logic(job_id, format_type)
+        return download_logic(job_id, format_type, data)
     except Exception as e:
         logger.error(f"Error in download: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-def download_logic(job_id, format_type):
+def download_logic(job_id, format_type, options=None):
+    """
+    Stream or serve an export. `options` (query string by default) may set
+    `pretty` for indented JSON and `precision` to round vector components.
+    """
     try:
         job = db.get_job(job_id)
         if not job or job['status'] != 'completed':
             return jsonify({"error": "Job not completed or found"}), 400
-            
-        # Generator for streaming response
-        def generate():
-            # Get formatter
-            formatter = get_formatter(format_type)
-            
-            # For JSON array, we need to handle the opening/closing brackets manually
-            # to stream effectively without loading everything
-            if format_type == 'json':
-                yield '[\n'
-                first = True
-                for item in db.get_job_embeddings(job_id):
-                    if not first:
-                        yield ',\n'
-                    yield json.dumps(item, indent=2)
-                    first = False
-                yield '\n]'
-                
-            elif format_type == 'jsonl':
-                for item in db.get_job_embeddings(job_id):
-                    yield json.dumps(item) + '\n'
-                    
-            elif format_type == 'pinecone':
-                # Pinecone format is { "vectors": [...] }
-                # Streaming this is tricky, we'll do a simplified stream
-                yield '{\n  "vectors": [\n'
-                first = True
-                for item in db.get_job_embeddings(job_id):
-                    vector = {
-                        "id": item["id"],
-                        "values": item["embedding"],
-                        "metadata": {
-                            "text": item["text"],
-                            "cluster_id": item.get("cluster_id"), # Add cluster_id to metadata
-                            **item.get("metadata", {})
-                        }
-                    }
-                    if not first:
-                        yield ',\n'
-                    yield json.dumps(vector, indent=2)
-                    first = False
-                yield '\n  ]\n}'
-                
-            else:
-                # Fallback for other formats - load all (not ideal for huge datasets but acceptable for now)
-                # Ideally we'd implement streaming for all formatters
-                all_items = list(db.get_job_embeddings(job_id))
-                yield formatter(all_items)
 
-        # Determine filename
-        extension = "jsonl" if format_type == "jsonl" else "json"
-        filename = f"embeddings_{format_type}.{extension}"
+        if options is None:
+            options = request.args
+        pretty = str(options.get('pretty', '')).lower() in ('1', 'true', 'yes')
+        precision = options.get('precision')
+
+        try:
+            precision = int(precision) if precision not in (None, '') else None
+            # Each precision is cached separately, so only a small fixed set is allowed
+            if precision is not None and not 0 <= precision <= export_cache.MAX_PRECISION:
+                raise ValueError(f"precision must be between 0 and {export_cache.MAX_PRECISION}")
+            formatter = get_formatter(format_type, pretty=pretty, precision=precision)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Cache entries are per format and serializer options
+        variant = format_type
+        if pretty:
+            variant += "_pretty"
+        if precision is not None:
+            variant += f"_p{precision}"
+
+        if formatter.needs_row_count:
+            formatter.row_count = db.count_job_embeddings(job_id)
+
+        version = job.get('export_version') or 0
+        encoding = export_cache.negotiate_encoding(request.accept_encodings, formatter.compressible)
+        etag = export_cache.etag_for(job_id, variant, version, encoding)
+        filename = f"embeddings_{format_type}.{formatter.extension}"
+
+        headers = {'Vary': 'Accept-Encoding'}
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+
+        # Completed exports are served from disk with Range/ETag support
+        artifact = export_cache.get_artifact(job_id, variant, version, encoding)
+        if artifact:
+            response = send_file(
+                artifact,
+                mimetype=formatter.mimetype,
+                as_attachment=True,
+                download_name=filename,
+                conditional=True,
+                etag=etag
+            )
+            response.headers.update(headers)
+            return response
+
+        # Otherwise stream from the DB cursor, writing the artifact as we go
+        def produce():
+            chunks = formatter.stream(db.get_job_embeddings(job_id))
+            return export_cache.compress_stream(chunks, encoding)
+
+        path = export_cache.artifact_path(job_id, variant, version, encoding)
+        headers['Content-Disposition'] = f'attachment; filename={filename}'
+        headers['ETag'] = f'"{etag}"'
         
         return Response(
-            stream_with_context(generate()),
-            mimetype='application/json',
-            headers={'Content-Disposition': f'attachment; filename={filename}'}
+            stream_with_context(export_cache.stream_and_cache(produce, path)),
+            mimetype=formatter.mimetype,
+            headers=headers
         )
     
     except Exception as e:
@@ -555,11 +565,41 @@ def download_logic(job_id, format_type):
         return jsonify({"error": str(e)}), 500
 
 
-from query_engine import SchemaManager, SQLGenerator, SQLExecutor
+from query_engine import SchemaManager, SQLGeneratorPool, SQLExecutor, QueryTimeout, generate_validated_sql
+from dictionary_index import INDEX_DIR
+from sql_cache import SQLCache
 
 # Initialize Query Engine Components
-schema_manager = SchemaManager()
-sql_executor = SQLExecutor(schema_manager)
+# The dictionary index is persisted so restarts and other workers reuse it
+# Uploaded tables live in a WAL database file so queries read concurrently
+QUERY_DB_PATH = os.environ.get('QUERY_DB_PATH', str(Path(tempfile.gettempdir()) / "embedding_tool_query.db"))
+schema_manager = SchemaManager(
+    db_path=QUERY_DB_PATH,
+    index_dir=INDEX_DIR,
+    # Lets every worker embed questions against an index built with an API provider
+    embedding_api_keys={
+        "openai": os.environ.get('OPENAI_API_KEY'),
+        "google": os.environ.get('GOOGLE_API_KEY')
+    }
+)
+sql_executor = SQLExecutor(
+    schema_manager,
+    max_rows=int(os.environ.get('QUERY_MAX_ROWS', 10000)),
+    page_size=int(os.environ.get('QUERY_PAGE_SIZE', 500)),
+    timeout=float(os.environ.get('QUERY_TIMEOUT', 30)),
+    # Must be set when running several workers so page tokens work on any of them
+    secret=os.environ.get('QUERY_PAGE_SECRET', '').encode('utf-8') or None,
+    large_table_rows=int(os.environ.get('QUERY_LARGE_TABLE_ROWS', 100000))
+)
+if not os.environ.get('QUERY_PAGE_SECRET'):
+    logger.warning("QUERY_PAGE_SECRET is not set: page tokens only work on the worker that issued them")
+# Repair prompts sent per question when validation rejects the generated SQL
+SQL_MAX_REPAIRS = int(os.environ.get('SQL_MAX_REPAIRS', 1))
+sql_generators = SQLGeneratorPool(max_concurrency=int(os.environ.get('LLM_MAX_CONCURRENCY', 4)))
+sql_cache = SQLCache(
+    max_entries=int(os.environ.get('SQL_CACHE_SIZE', 1000)),
+    similarity_threshold=float(os.environ.get('SQL_CACHE_SIMILARITY', 0.95))
+)
 
 @app.route('/api/upload_table', methods=['POST'])
 def upload_table():
@@ -581,6 +621,7 @@ def upload_table():
         success, msg = schema_manager.load_table(table_name, str(file_path))
         
         if success:
+            sql_cache.invalidate()
             return jsonify({"message": msg, "table_name": table_name})
         else:
             return jsonify({"error": msg}), 500
@@ -604,6 +645,7 @@ def upload_dictionary():
         success, msg = schema_manager.load_data_dictionary(str(file_path))
         if not success:
             return jsonify({"error": msg}), 400
+        sql_cache.invalidate()
             
         # Index (using default provider for now, or user provided)
         # We can get params from form data
@@ -622,6 +664,56 @@ def upload_dictionary():
         logger.error(f"Error uploading dictionary: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/search_schema', methods=['POST'])
+def search_schema():
+    """Find relevant dictionary entries for one or more questions."""
+    try:
+        data = request.json
+        questions = data.get('questions') or [data.get('question')]
+        top_k = int(data.get('top_k', 10))
+        
+        if not all(questions):
+            return jsonify({"error": "At least one question is required"}), 400
+            
+        results = schema_manager.search_relevant_schema_batch(questions, top_k)
+        return jsonify({"results": [{"question": q, "schema": r} for q, r in zip(questions, results)]})
+        
+    except Exception as e:
+        logger.error(f"Error searching schema: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def _parse_bool(value, default: bool) -> bool:
+    """Boolean flag from JSON or form input; strings like "false" and "0" are False."""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('1', 'true', 'yes', 'on'):
+        return True
+    if text in ('0', 'false', 'no', 'off', ''):
+        return False
+    raise ValueError(f"Expected a boolean, got {value!r}")
+
+def _parse_page_size(value):
+    """page_size from a request body: None for the default, else an int in 1..QUERY_MAX_ROWS."""
+    if value is None:
+        return None
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("page_size must be an integer")
+    if not 1 <= page_size <= sql_executor.max_rows:
+        raise ValueError(f"page_size must be between 1 and {sql_executor.max_rows}")
+    return page_size
+
+def _should_cache(cache_hit, failed: bool, error=None) -> bool:
+    """
+    Whether generated SQL goes into the SQL cache: only freshly generated SQL
+    that ran, never a cache hit or the SELECT of a generation error.
+    """
+    return cache_hit is None and not failed and error is None
+
 @app.route('/api/query', methods=['POST'])
 def process_query():
     """Process a natural language query."""
@@ -633,30 +725,138 @@ def process_query():
         
         if not question or not api_key:
             return jsonify({"error": "Question and API Key are required"}), 400
+        try:
+            page_size = _parse_page_size(data.get('page_size'))
+            use_cache = _parse_bool(data.get('use_cache'), True)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
             
         # 1. Search relevant schema
         relevant_schema = schema_manager.search_relevant_schema(question)
         all_tables = schema_manager.get_all_tables()
         
-        # 2. Generate SQL
-        generator = SQLGenerator(api_key, model)
-        sql = generator.generate_sql(question, relevant_schema, all_tables)
+        # 2. Generate SQL, unless this (or a very similar) question was answered before
+        schema_version = schema_manager.schema_version
+        query_embedding = schema_manager.embed_query(question)
+        sql, cache_hit, steps, failed = None, None, [], False
+        if use_cache:
+            sql, cache_hit = sql_cache.get(question, schema_version, model, query_embedding)
+        if sql is None:
+            # Generated SQL is checked with EXPLAIN and repaired before it runs
+            sql, steps, failed = generate_validated_sql(
+                sql_generators.get(api_key, model), sql_executor, question, relevant_schema, all_tables,
+                schema_manager.column_stats_summary(relevant_schema), max_repairs=SQL_MAX_REPAIRS
+            )
+        
+        # 3. Execute SQL (first page only; the rest via /api/query/page)
+        started = time.perf_counter()
+        page = sql_executor.execute_page(sql, page_size=page_size)
+        steps.append({"step": "execute", "ms": round((time.perf_counter() - started) * 1000, 1)})
         
-        # 3. Execute SQL
-        columns, rows, error = sql_executor.execute(sql)
+        if _should_cache(cache_hit, failed, page["error"]):
+            sql_cache.put(question, schema_version, model, sql, query_embedding)
         
         return jsonify({
             "sql": sql,
-            "columns": columns,
-            "rows": rows,
-            "error": error,
-            "relevant_schema": relevant_schema
+            **page,
+            "relevant_schema": relevant_schema,
+            "cached": cache_hit,
+            "steps": steps
         })
         
     except Exception as e:
         logger.error(f"Error processing query: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/query/page', methods=['POST'])
+def query_page():
+    """Fetch the next page of a query result using its next_page_token."""
+    data = request.json or {}
+    page_token = data.get('page_token')
+    if not page_token:
+        return jsonify({"error": "page_token is required"}), 400
+    
+    try:
+        sql_executor.read_page_token(page_token)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify(sql_executor.execute_page(page_token=page_token))
+
+def _sse(event, data):
+    """Formats one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.route('/api/query/stream', methods=['POST'])
+def process_query_stream():
+    """
+    Streaming variant of /api/query over Server-Sent Events.
+    
+    Events, in order: 'schema', 'token' (LLM deltas), 'validation' (EXPLAIN
+    checks and repairs), 'sql', 'columns', 'rows' (one page each), then
+    'done' or 'error'.
+    """
+    data = request.json or {}
+    question = data.get('question')
+    api_key = data.get('api_key')
+    model = data.get('model', 'gemini-1.5-pro')
+    
+    if not question or not api_key:
+        return jsonify({"error": "Question and API Key are required"}), 400
+    try:
+        page_size = _parse_page_size(data.get('page_size')) or sql_executor.page_size
+        use_cache = _parse_bool(data.get('use_cache'), True)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+        
+    def generate():
+        try:
+            relevant_schema = schema_manager.search_relevant_schema(question)
+            all_tables = schema_manager.get_all_tables()
+            yield _sse('schema', relevant_schema)
+            
+            schema_version = schema_manager.schema_version
+            query_embedding = schema_manager.embed_query(question)
+            sql, cache_hit, failed = None, None, False
+            if use_cache:
+                sql, cache_hit = sql_cache.get(question, schema_version, model, query_embedding)
+            if sql is None:
+                generator = sql_generators.get(api_key, model)
+                completion = []
+                column_stats = schema_manager.column_stats_summary(relevant_schema)
+                for token in generator.stream_sql(question, relevant_schema, all_tables, column_stats):
+                    completion.append(token)
+                    yield _sse('token', {"text": token})
+                sql = generator.clean_sql("".join(completion))
+                sql, steps, failed = generate_validated_sql(
+                    generator, sql_executor, question, relevant_schema, all_tables, column_stats,
+                    max_repairs=SQL_MAX_REPAIRS, sql=sql
+                )
+                yield _sse('validation', steps)
+            yield _sse('sql', {"sql": sql, "cached": cache_hit})
+            
+            row_count = 0
+            for i, (columns, rows) in enumerate(sql_executor.execute_pages(sql, page_size)):
+                if i == 0:
+                    yield _sse('columns', columns)
+                if rows:
+                    row_count += len(rows)
+                    yield _sse('rows', rows)
+            
+            if _should_cache(cache_hit, failed):
+                sql_cache.put(question, schema_version, model, sql, query_embedding)
+            yield _sse('done', {"row_count": row_count, "truncated": row_count >= sql_executor.max_rows})
+            
+        except Exception as e:
+            logger.error(f"Error streaming query: {e}")
+            yield _sse('error', {"error": str(e), "timed_out": isinstance(e, QueryTimeout)})
+            
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     print(f"\nStructured Data Query Tool running on http://localhost:{port}")
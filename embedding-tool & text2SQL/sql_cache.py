@@ -0,0 +1,116 @@
+"""
+Cache of generated SQL for natural language questions.
+
+Level 1 is an exact match on (normalized question, schema version, model).
+Level 2 is a nearest-neighbour match over the embeddings of previously
+answered questions, accepted above a similarity cutoff.
+"""
+
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?.! ")
+
+
+class SQLCache:
+    """Thread-safe LRU cache from questions to generated SQL."""
+
+    def __init__(self, max_entries: int = 1000, similarity_threshold: float = 0.95):
+        """
+        Args:
+            max_entries: Maximum cached questions before LRU eviction
+            similarity_threshold: Minimum cosine similarity for a semantic hit
+                (set above 1 to disable semantic matching)
+        """
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        # {(question, schema_version, model): (sql, normalized embedding or None)}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Stacked embeddings per (schema_version, model), rebuilt after changes
+        self._matrices = {}
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+
+    def get(self, question: str, schema_version: int, model: str,
+            embedding: Optional[np.ndarray] = None) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Look up cached SQL.
+
+        Args:
+            question: User question
+            schema_version: SchemaManager.schema_version the SQL was generated against
+            model: LLM model name
+            embedding: Normalized question embedding, enables semantic matching
+
+        Returns:
+            (sql, "exact" | "semantic") on a hit, (None, None) on a miss
+        """
+        key = (normalize_question(question), schema_version, model)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits["exact"] += 1
+                return self._entries[key][0], "exact"
+
+            if embedding is not None and self.similarity_threshold <= 1:
+                keys, matrix = self._matrix(schema_version, model)
+                if keys:
+                    sims = matrix @ np.asarray(embedding, dtype=np.float32)
+                    best = int(np.argmax(sims))
+                    if sims[best] >= self.similarity_threshold:
+                        match = keys[best]
+                        self._entries.move_to_end(match)
+                        self.hits["semantic"] += 1
+                        logger.info(f"Semantic SQL cache hit ({sims[best]:.3f}): '{question}' ~ '{match[0]}'")
+                        return self._entries[match][0], "semantic"
+
+            self.misses += 1
+            return None, None
+
+    def put(self, question: str, schema_version: int, model: str, sql: str,
+            embedding: Optional[np.ndarray] = None):
+        """Store SQL for a question."""
+        key = (normalize_question(question), schema_version, model)
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._entries[key] = (sql, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrices.clear()
+
+    def invalidate(self):
+        """Drop every entry (called when tables or the dictionary change)."""
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+
+    def _matrix(self, schema_version: int, model: str):
+        """Embeddings of cached questions for one schema version and model. Caller holds the lock."""
+        group = (schema_version, model)
+        if group not in self._matrices:
+            keys = [
+                key for key, (_, embedding) in self._entries.items()
+                if key[1:] == group and embedding is not None
+            ]
+            matrix = np.stack([self._entries[key][1] for key in keys]) if keys else None
+            self._matrices[group] = (keys, matrix)
+        return self._matrices[group]
+
+    def stats(self) -> dict:
+        """Hit/miss counters."""
+        with self._lock:
+            return {"entries": len(self._entries), "hits": dict(self.hits), "misses": self.misses}
@@ -0,0 +1,243 @@
+"""
+Bulk loading of CSV files into SQLite tables.
+
+Column types are inferred from a sample of the file, the table is created
+with those types and filled chunk by chunk with executemany inside one
+transaction. The new table replaces the old one atomically on commit, so
+readers never see a half-loaded table.
+
+Each loaded table is also profiled once (distinct counts, ranges, most
+common values) so SQL prompts can mention the literals that actually exist.
+"""
+
+import json
+import logging
+import re
+import sqlite3
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Dictionary descriptions that mark a column as a join key
+KEY_DESCRIPTION = re.compile(r"\b(foreign key|primary key|join key|unique identifier|references)\b", re.IGNORECASE)
+
+# Table holding per-column statistics for every loaded table
+STATS_TABLE = "_column_stats"
+
+
+def quote_identifier(name: str) -> str:
+    """Quote a table or column name for SQLite."""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def infer_sqlite_types(sample: pd.DataFrame, raw: Optional[pd.DataFrame] = None) -> Dict[str, str]:
+    """
+    Map each column of a sample to a SQLite column type.
+
+    Float columns whose values are all whole numbers (integers with gaps,
+    which pandas reads as float) become INTEGER. If raw, the same sample
+    read as strings, is given, digit columns with a leading zero (zip
+    codes, account numbers) stay TEXT so the zeros are kept.
+    """
+    types = {}
+    for column in sample.columns:
+        values = sample[column]
+        if pd.api.types.is_bool_dtype(values) or pd.api.types.is_integer_dtype(values):
+            types[column] = "INTEGER"
+        elif pd.api.types.is_float_dtype(values):
+            present = values.dropna()
+            whole = len(present) and (present == present.round()).all()
+            types[column] = "INTEGER" if whole else "REAL"
+        else:
+            types[column] = "TEXT"
+        if types[column] == "INTEGER" and raw is not None and has_leading_zero(raw[column]):
+            types[column] = "TEXT"
+    return types
+
+
+def has_leading_zero(values: pd.Series) -> bool:
+    """True if any value is a run of digits starting with 0 (but not 0 itself)."""
+    return bool(values.dropna().astype(str).str.strip().str.fullmatch(r"0\d+").any())
+
+
+def is_key_column(column: str, description: Optional[str] = None) -> bool:
+    """True for ID-like column names or columns the dictionary describes as keys."""
+    name = str(column)
+    if name.lower() == "id" or name.lower().endswith("_id") or name.endswith("Id"):
+        return True
+    return bool(description and KEY_DESCRIPTION.search(str(description)))
+
+
+def create_key_indexes(conn, table_name: str, columns: Iterable[str],
+                       descriptions: Optional[Dict[str, str]] = None) -> List[str]:
+    """
+    Index the join-key columns of a table.
+
+    Args:
+        conn: Writer connection
+        table_name: Table to index
+        columns: Columns of the table
+        descriptions: {column: dictionary description} for the table (optional)
+
+    Returns:
+        Names of the columns that are indexed
+    """
+    descriptions = descriptions or {}
+    indexed = []
+    for column in columns:
+        if not is_key_column(column, descriptions.get(column)):
+            continue
+        index_name = re.sub(r"\W+", "_", f"idx_{table_name}_{column}")
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {quote_identifier(index_name)} "
+            f"ON {quote_identifier(table_name)} ({quote_identifier(column)})"
+        )
+        indexed.append(column)
+    return indexed
+
+
+def bulk_load_csv(conn, table_name: str, csv_path: str, chunk_size: int = 50000, sample_rows: int = 1000,
+                  descriptions: Optional[Dict[str, str]] = None) -> Tuple[List[str], Dict[str, str], int]:
+    """
+    Load a CSV into a typed table, replacing any existing table of that name.
+
+    Args:
+        conn: Writer connection (no other transaction may be open on it)
+        table_name: Sanitized table name
+        csv_path: Path to the CSV file
+        chunk_size: Rows read and inserted per batch
+        sample_rows: Rows used to infer column types
+        descriptions: {column: dictionary description}, used to pick indexed columns
+
+    Returns:
+        (columns, {column: SQLite type}, row_count)
+    """
+    sample = pd.read_csv(csv_path, nrows=sample_rows)
+    columns = [str(c) for c in sample.columns]
+    types = infer_sqlite_types(sample, pd.read_csv(csv_path, nrows=sample_rows, dtype=str))
+    # Keep text columns as text in every chunk (e.g. codes with leading zeros)
+    text_columns = {column: str for column, sql_type in types.items() if sql_type == "TEXT"}
+
+    staging = f"{table_name}__load_{uuid.uuid4().hex[:8]}"
+    column_defs = ", ".join(f"{quote_identifier(c)} {types[c]}" for c in columns)
+    insert = (
+        f"INSERT INTO {quote_identifier(staging)} VALUES "
+        f"({', '.join('?' for _ in columns)})"
+    )
+
+    # The load is one transaction that is either committed whole or rolled back,
+    # so per-commit fsyncs buy nothing while it runs
+    synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+    conn.execute("PRAGMA synchronous=OFF")
+    row_count = 0
+    try:
+        conn.execute("BEGIN")
+        conn.execute(f"CREATE TABLE {quote_identifier(staging)} ({column_defs})")
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_size, dtype=text_columns):
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            conn.executemany(insert, chunk.itertuples(index=False, name=None))
+            row_count += len(chunk)
+
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(table_name)}")
+        conn.execute(f"ALTER TABLE {quote_identifier(staging)} RENAME TO {quote_identifier(table_name)}")
+        indexed = create_key_indexes(conn, table_name, columns, descriptions)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute(f"PRAGMA synchronous={synchronous}")
+
+    if indexed:
+        logger.info(f"Indexed {table_name} on {indexed}")
+    return columns, types, row_count
+
+
+def compute_column_stats(conn, table_name: str, columns: List[str], top_k: int = 5,
+                         max_categories: int = 50) -> Dict[str, Dict]:
+    """
+    Profile the columns of a table.
+
+    Distinct counts and ranges for all columns come from a single scan; most
+    common values are only collected for columns with at most max_categories
+    distinct values, where they tell the LLM which literals exist.
+
+    Returns:
+        {column: {row_count, distinct_count, null_count, min, max, top_values}}
+    """
+    table = quote_identifier(table_name)
+    aggregates = ["COUNT(*)"]
+    for column in columns:
+        quoted = quote_identifier(column)
+        aggregates += [f"COUNT(DISTINCT {quoted})", f"COUNT({quoted})", f"MIN({quoted})", f"MAX({quoted})"]
+    row = conn.execute(f"SELECT {', '.join(aggregates)} FROM {table}").fetchone()
+
+    row_count = row[0]
+    stats = {}
+    for i, column in enumerate(columns):
+        distinct_count, non_null, minimum, maximum = row[1 + 4 * i: 5 + 4 * i]
+        top_values = []
+        if 0 < distinct_count <= max_categories:
+            quoted = quote_identifier(column)
+            top_values = conn.execute(
+                f"SELECT {quoted}, COUNT(*) AS n FROM {table} WHERE {quoted} IS NOT NULL "
+                f"GROUP BY {quoted} ORDER BY n DESC, {quoted} LIMIT ?", (top_k,)
+            ).fetchall()
+        stats[column] = {
+            "row_count": row_count,
+            "distinct_count": distinct_count,
+            "null_count": row_count - non_null,
+            "min": minimum,
+            "max": maximum,
+            "top_values": [list(value) for value in top_values]
+        }
+    return stats
+
+
+def save_column_stats(conn, table_name: str, stats: Dict[str, Dict]):
+    """Replace the stored statistics of one table (caller commits)."""
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {STATS_TABLE} "
+        "(table_name TEXT, column_name TEXT, stats TEXT, PRIMARY KEY (table_name, column_name))"
+    )
+    conn.execute(f"DELETE FROM {STATS_TABLE} WHERE table_name = ?", (table_name,))
+    conn.executemany(
+        f"INSERT INTO {STATS_TABLE} VALUES (?, ?, ?)",
+        [(table_name, column, json.dumps(column_stats, default=str)) for column, column_stats in stats.items()]
+    )
+
+
+def load_column_stats(conn) -> Dict[str, Dict[str, Dict]]:
+    """All stored statistics as {table: {column: stats}}."""
+    try:
+        rows = conn.execute(f"SELECT table_name, column_name, stats FROM {STATS_TABLE}").fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    stats = {}
+    for table_name, column, column_stats in rows:
+        stats.setdefault(table_name, {})[column] = json.loads(column_stats)
+    return stats
+
+
+def _literal(value, max_length: int = 40) -> str:
+    if isinstance(value, str):
+        if len(value) > max_length:
+            value = value[:max_length] + "..."
+        return "'" + value.replace("'", "''") + "'"
+    return str(value)
+
+
+def summarize_column_stats(stats: Dict, sql_type: Optional[str] = None) -> str:
+    """One-line description of a column's statistics for the SQL prompt."""
+    parts = [sql_type] if sql_type else []
+    parts.append(f"{stats['distinct_count']} distinct of {stats['row_count']} rows")
+    if stats.get("null_count"):
+        parts.append(f"{stats['null_count']} null")
+    if stats.get("top_values"):
+        parts.append("values: " + ", ".join(f"{_literal(value)} ({count})" for value, count in stats["top_values"]))
+    elif stats.get("min") is not None:
+        parts.append(f"range {_literal(stats['min'])}..{_literal(stats['max'])}")
+    return "; ".join(parts)
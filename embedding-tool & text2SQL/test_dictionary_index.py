@@ -0,0 +1,98 @@
+import unittest
+import multiprocessing
+import tempfile
+from pathlib import Path
+from unittest import mock
+import numpy as np
+from dictionary_index import DictionaryIndexStore
+from query_engine import SchemaManager
+from test_query_engine import FakeEmbeddingGenerator
+
+
+def write_index(index_dir, entries, n):
+    """One writer process: updates the shared index repeatedly."""
+    store = DictionaryIndexStore(index_dir)
+    for i in range(10):
+        store.update(entries, [f"users id {n} {i}", "users name"], FakeEmbeddingGenerator())
+
+
+class TestDictionaryIndexStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = DictionaryIndexStore(self.tmp_dir.name)
+        self.entries = [
+            {"table_name": "users", "column_name": "id", "description": "User ID"},
+            {"table_name": "users", "column_name": "name", "description": "User name"},
+        ]
+        self.texts = ["users id", "users name"]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_incremental_update(self):
+        generator = FakeEmbeddingGenerator()
+        _, matrix, embedded = self.store.update(self.entries, self.texts, generator)
+        self.assertEqual(embedded, 2)
+        self.assertEqual(matrix.dtype, np.float32)
+        np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), 1.0, rtol=1e-6)
+
+        # Change one entry and add another: only those two are embedded
+        entries = self.entries + [{"table_name": "users", "column_name": "age", "description": "User age"}]
+        texts = ["users id", "users name called", "users age"]
+        _, matrix, embedded = self.store.update(entries, texts, generator)
+        self.assertEqual(embedded, 2)
+        self.assertEqual(generator.calls[-1], ["users name called", "users age"])
+        self.assertEqual(matrix.shape[0], 3)
+
+    def test_loaded_with_mmap(self):
+        self.store.update(self.entries, self.texts, FakeEmbeddingGenerator())
+        manifest, matrix = self.store.load()
+        self.assertIsInstance(matrix, np.memmap)
+        self.assertEqual(manifest["entries"], self.entries)
+
+    def test_concurrent_writers_keep_a_loadable_index(self):
+        # Separate processes, like server workers sharing the index directory
+        writers = [
+            multiprocessing.Process(target=write_index, args=(self.tmp_dir.name, self.entries, n))
+            for n in range(3)
+        ]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join(60)
+
+        self.assertEqual([writer.exitcode for writer in writers], [0, 0, 0])
+        manifest, matrix = self.store.load()
+        self.assertEqual(matrix.shape[0], 2)
+        # Only the current matrix is left
+        self.assertEqual([p.name for p in Path(self.tmp_dir.name).glob("embeddings-*.npy")], [manifest["matrix"]])
+
+    def test_other_manager_picks_up_index(self):
+        self.store.update(self.entries, self.texts, FakeEmbeddingGenerator())
+        with mock.patch("query_engine.EmbeddingGenerator", lambda provider, api_key, model: FakeEmbeddingGenerator()):
+            manager = SchemaManager(":memory:", index_dir=self.tmp_dir.name)
+        self.assertEqual(manager.data_dictionary, self.entries)
+        self.assertEqual(manager.dictionary_index.shape[0], 2)
+        self.assertIsNotNone(manager.embedding_generator)
+
+    def test_api_provider_index_uses_configured_key(self):
+        self.store.update(self.entries, self.texts, FakeEmbeddingGenerator())
+        seen = []
+
+        def make_generator(provider, api_key, model):
+            seen.append(api_key)
+            if not api_key:
+                raise ValueError("API key is required")
+            return FakeEmbeddingGenerator()
+
+        with mock.patch("query_engine.EmbeddingGenerator", make_generator):
+            keyed = SchemaManager(":memory:", index_dir=self.tmp_dir.name, embedding_api_keys={"fake": "secret"})
+            keyless = SchemaManager(":memory:", index_dir=self.tmp_dir.name)
+        self.assertEqual(seen, ["secret", None])
+        self.assertEqual(keyed.dictionary_index.shape[0], 2)
+        # Without a key the sync is skipped rather than loading an index it can't query
+        self.assertIsNone(keyless.dictionary_index)
+
+if __name__ == '__main__':
+    unittest.main()
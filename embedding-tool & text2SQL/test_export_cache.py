@@ -0,0 +1,85 @@
+import unittest
+import gzip
+import os
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+from werkzeug.http import parse_accept_header
+import export_cache
+
+
+class TestExportCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name) / "export.gzip"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def produce(self):
+        return export_cache.compress_stream(("row %d\n" % i for i in range(1000)), "gzip")
+
+    def test_negotiate_encoding(self):
+        self.assertEqual(export_cache.negotiate_encoding(parse_accept_header("gzip, deflate")), "gzip")
+        self.assertEqual(export_cache.negotiate_encoding(parse_accept_header("")), "identity")
+        self.assertEqual(export_cache.negotiate_encoding(parse_accept_header("gzip"), compressible=False), "identity")
+
+    def test_compress_stream_is_deterministic(self):
+        first = b"".join(self.produce())
+        self.assertEqual(first, b"".join(self.produce()))
+        self.assertEqual(gzip.decompress(first).decode().count("\n"), 1000)
+
+    def test_stream_and_cache_writes_artifact(self):
+        data = b"".join(export_cache.stream_and_cache(self.produce, self.path))
+        self.assertEqual(self.path.read_bytes(), data)
+        self.assertEqual(list(self.path.parent.glob("*.part")), [])
+
+    def test_disconnect_completes_in_background(self):
+        stream = export_cache.stream_and_cache(self.produce, self.path)
+        next(stream)
+        stream.close()
+
+        for _ in range(50):
+            if self.path.exists():
+                break
+            time.sleep(0.1)
+        self.assertEqual(self.path.read_bytes(), b"".join(self.produce()))
+
+    def test_eviction_by_age_and_size(self):
+        directory = Path(self.tmp_dir.name)
+        now = time.time()
+        for name, age in [("stale.gzip", 10000), ("old.gzip", 300), ("mid.gzip", 200), ("new.gzip", 100)]:
+            path = directory / name
+            path.write_bytes(b"x" * 100)
+            os.utime(path, (now - age, now - age))
+
+        export_cache.evict_artifacts(directory, max_bytes=250, max_age=3600, keep=directory / "old.gzip")
+        # stale is too old; then mid goes (old is kept) until 200 bytes remain
+        self.assertEqual(sorted(p.name for p in directory.iterdir()), ["new.gzip", "old.gzip"])
+
+    def test_invalidate_during_download_finishes_the_stream(self):
+        directory = Path(self.tmp_dir.name)
+        path = directory / "job1_v0_csv.gzip"
+        (directory / "job1_v0_json.gzip").write_bytes(b"old")
+        with mock.patch.object(export_cache, "EXPORT_DIR", directory):
+            stream = export_cache.stream_and_cache(self.produce, path)
+            data = [next(stream)]
+            # Re-clustered mid-download
+            export_cache.invalidate_job("job1")
+            data.extend(stream)
+        self.assertEqual(b"".join(data), b"".join(self.produce()))
+        self.assertFalse((directory / "job1_v0_json.gzip").exists())
+
+    def test_missing_temp_file_finishes_the_stream_uncached(self):
+        stream = export_cache.stream_and_cache(self.produce, self.path)
+        data = [next(stream)]
+        for part in self.path.parent.glob("*.part"):
+            part.unlink()
+        data.extend(stream)
+        self.assertEqual(b"".join(data), b"".join(self.produce()))
+        self.assertFalse(self.path.exists())
+
+if __name__ == '__main__':
+    unittest.main()
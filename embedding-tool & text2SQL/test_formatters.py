@@ -0,0 +1,162 @@
+import unittest
+import io
+import json
+import zipfile
+import numpy as np
+from formatters import get_formatter
+from serializers import orjson
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+def compact(obj):
+    return json.dumps(obj, separators=(",", ":"))
+
+
+BACKENDS = ["json", "orjson"] if orjson else ["json"]
+
+
+class TestFormatters(unittest.TestCase):
+
+    def setUp(self):
+        self.items = [
+            {"id": "0", "text": "apple", "embedding": [0.1, 0.2], "metadata": {"category": "fruit"}},
+            {"id": "1", "text": "bus", "embedding": [0.3, -0.4], "metadata": {"category": None}},
+        ]
+        self.pretty = {"pretty": True, "backend": "json"}
+
+    def test_json(self):
+        formatter = get_formatter("json", **self.pretty)
+        self.assertEqual(formatter.encode(self.items), json.dumps(self.items, indent=2))
+        self.assertEqual(formatter.encode([]), json.dumps([], indent=2))
+
+    def test_json_compact(self):
+        for backend in BACKENDS:
+            formatter = get_formatter("json", backend=backend)
+            self.assertEqual(formatter.encode(self.items), compact(self.items))
+            self.assertEqual(formatter.encode([]), "[]")
+
+    def test_jsonl(self):
+        formatter = get_formatter("jsonl")
+        expected = "\n".join(compact(item) for item in self.items)
+        self.assertEqual(formatter.encode(self.items), expected)
+
+    def test_pinecone(self):
+        vectors = [
+            {"id": i["id"], "values": i["embedding"], "metadata": {"text": i["text"], **i["metadata"]}}
+            for i in self.items
+        ]
+        formatter = get_formatter("pinecone", **self.pretty)
+        self.assertEqual(formatter.encode(self.items), json.dumps({"vectors": vectors}, indent=2))
+
+        formatter = get_formatter("pinecone", namespace="docs", **self.pretty)
+        expected = json.dumps({"vectors": vectors, "namespace": "docs"}, indent=2)
+        self.assertEqual(formatter.encode(self.items), expected)
+        expected = json.dumps({"vectors": [], "namespace": "docs"}, indent=2)
+        self.assertEqual(formatter.encode([]), expected)
+
+        formatter = get_formatter("pinecone", namespace="docs")
+        self.assertEqual(formatter.encode(self.items), compact({"vectors": vectors, "namespace": "docs"}))
+
+    def test_pinecone_cluster_id(self):
+        item = dict(self.items[0], cluster_id=3)
+        vector = json.loads(get_formatter("pinecone").encode([item]))["vectors"][0]
+        self.assertEqual(vector["metadata"]["cluster_id"], 3)
+
+    def test_weaviate(self):
+        objects = [
+            {"class": "Document", "id": i["id"], "properties": {"text": i["text"], **i["metadata"]}, "vector": i["embedding"]}
+            for i in self.items
+        ]
+        formatter = get_formatter("weaviate", **self.pretty)
+        self.assertEqual(formatter.encode(self.items), json.dumps({"objects": objects}, indent=2))
+        self.assertEqual(formatter.encode([]), json.dumps({"objects": []}, indent=2))
+        self.assertEqual(get_formatter("weaviate").encode(self.items), compact({"objects": objects}))
+
+    def test_qdrant(self):
+        points = [
+            {"id": i["id"], "vector": i["embedding"], "payload": {"text": i["text"], **i["metadata"]}}
+            for i in self.items
+        ]
+        formatter = get_formatter("qdrant", **self.pretty)
+        self.assertEqual(formatter.encode(self.items), json.dumps({"points": points}, indent=2))
+        self.assertEqual(get_formatter("qdrant").encode(self.items), compact({"points": points}))
+
+    def test_numpy_vectors_and_precision(self):
+        items = [dict(item, embedding=np.array([0.123456, -1.0 / 3])) for item in self.items]
+        for backend in BACKENDS:
+            decoded = json.loads(get_formatter("json", precision=3, backend=backend).encode(items))
+            self.assertEqual(decoded[0]["embedding"], [0.123, -0.333])
+
+    def test_chunking(self):
+        items = [dict(self.items[0], id=str(i)) for i in range(100)]
+        chunks = list(get_formatter("jsonl", chunk_size=1000).stream(items))
+        self.assertLess(len(chunks), 20)
+        self.assertEqual("".join(chunks), get_formatter("jsonl").encode(items))
+
+    def test_stream_is_lazy(self):
+        def items():
+            yield self.items[0]
+            raise RuntimeError("consumed too far")
+
+        chunks = get_formatter("qdrant", chunk_size=1).stream(items())
+        self.assertIn('"apple"', next(chunks))
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            get_formatter("csv")
+
+
+@unittest.skipIf(pa is None, "pyarrow not installed")
+class TestColumnarFormatters(unittest.TestCase):
+
+    def setUp(self):
+        self.items = [
+            {"id": str(i), "text": f"row {i}", "embedding": [i * 0.5, 1.0, -1.0], "metadata": {"n": i}, "cluster_id": i % 2}
+            for i in range(5)
+        ]
+
+    def test_parquet_row_groups(self):
+        data = b"".join(get_formatter("parquet", batch_size=2).stream(self.items))
+        parquet = pq.ParquetFile(io.BytesIO(data))
+        self.assertEqual(parquet.num_row_groups, 3)
+        self.assertEqual(str(parquet.schema_arrow.field("embedding").type), "fixed_size_list<element: float>[3]")
+
+        table = parquet.read()
+        self.assertEqual(table.column("id").to_pylist(), ["0", "1", "2", "3", "4"])
+        self.assertEqual(table.column("embedding").to_pylist()[3], [1.5, 1.0, -1.0])
+        self.assertEqual(json.loads(table.column("metadata")[4].as_py()), {"n": 4})
+
+    def test_arrow_stream(self):
+        data = b"".join(get_formatter("arrow", batch_size=2).stream(self.items))
+        table = pa.ipc.open_stream(data).read_all()
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(table.column("cluster_id").to_pylist(), [0, 1, 0, 1, 0])
+
+    def test_npy_bundle(self):
+        formatter = get_formatter("npy", batch_size=2, row_count=len(self.items))
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(formatter.stream(self.items))))
+        self.assertEqual(archive.namelist(), ["vectors.npy", "metadata.parquet"])
+
+        vectors = np.load(io.BytesIO(archive.read("vectors.npy")))
+        self.assertEqual(vectors.dtype, np.float32)
+        np.testing.assert_array_equal(vectors, np.array([i["embedding"] for i in self.items], dtype=np.float32))
+
+        metadata = pq.read_table(io.BytesIO(archive.read("metadata.parquet")))
+        self.assertEqual(metadata.column("text").to_pylist(), [i["text"] for i in self.items])
+
+    def test_npy_bundle_row_count_mismatch(self):
+        formatter = get_formatter("npy", row_count=10)
+        with self.assertRaises(ValueError):
+            b"".join(formatter.stream(self.items))
+
+    def test_empty(self):
+        data = b"".join(get_formatter("parquet").stream([]))
+        self.assertEqual(pq.read_table(io.BytesIO(data)).num_rows, 0)
+
+if __name__ == '__main__':
+    unittest.main()
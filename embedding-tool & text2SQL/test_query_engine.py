@@ -1,7 +1,25 @@
 import unittest
 import os
+import tempfile
+import threading
+import numpy as np
 import pandas as pd
-from query_engine import SchemaManager, SQLExecutor
+from query_engine import SchemaManager, SQLExecutor, SQLGenerator, SQLGeneratorPool, generate_validated_sql
+from schema_retrieval import format_schema_block
+
+class FakeEmbeddingGenerator:
+    """Deterministic bag-of-words embeddings so tests don't need a model."""
+    
+    provider = "fake"
+    model = "bag-of-words"
+    vocabulary = ["id", "name", "age", "user", "years", "called"]
+    
+    def __init__(self):
+        self.calls = []
+        
+    def generate_embeddings(self, texts):
+        self.calls.append(list(texts))
+        return [[text.lower().count(word) for word in self.vocabulary] for text in texts]
 
 class TestQueryEngine(unittest.TestCase):
     
@@ -50,5 +68,311 @@ class TestQueryEngine(unittest.TestCase):
         cols, rows, err = self.executor.execute("SELECT * FROM non_existent_table")
         self.assertIsNotNone(err)
 
+    def test_execute_pages(self):
+        self.manager.load_table("users", self.table_csv)
+        pages = list(self.executor.execute_pages("SELECT name FROM users ORDER BY id", page_size=2))
+        self.assertEqual(pages[0], (["name"], []))
+        self.assertEqual([rows for _, rows in pages[1:]], [[("Alice",), ("Bob",)], [("Charlie",)]])
+        
+    def test_execute_page_tokens_and_row_cap(self):
+        self.manager.load_table("users", self.table_csv)
+        executor = SQLExecutor(self.manager, max_rows=2)
+        
+        first = executor.execute_page("SELECT name FROM users ORDER BY id;", page_size=1)
+        self.assertEqual(first["rows"], [("Alice",)])
+        self.assertIsNotNone(first["next_page_token"])
+        
+        second = executor.execute_page(page_token=first["next_page_token"])
+        self.assertEqual(second["rows"], [("Bob",)])
+        # The third row is past the hard cap
+        self.assertIsNone(second["next_page_token"])
+        self.assertTrue(second["truncated"])
+        
+        forged = executor.execute_page(page_token=first["next_page_token"][:-4] + "AAAA")
+        self.assertIsNotNone(forged["error"])
+        
+    def test_execute_page_runs_the_statement_as_written(self):
+        self.manager.load_table("users", self.table_csv)
+        sql = "SELECT a.id, b.id, a.name FROM users a JOIN users b ON b.id = a.id ORDER BY a.id -- self join"
+        self.assertEqual(self.executor.validate(sql)[0], None)
+        
+        first = self.executor.execute_page(sql, page_size=2)
+        self.assertIsNone(first["error"])
+        self.assertEqual(first["columns"], ["id", "id", "name"])
+        self.assertEqual(first["rows"], [(1, 1, "Alice"), (2, 2, "Bob")])
+        
+        second = self.executor.execute_page(page_token=first["next_page_token"])
+        self.assertEqual(second["columns"], ["id", "id", "name"])
+        self.assertEqual(second["rows"], [(3, 3, "Charlie")])
+        self.assertIsNone(second["next_page_token"])
+        
+    def test_page_token_expires_when_tables_change(self):
+        self.manager.load_table("users", self.table_csv)
+        token = self.executor.execute_page("SELECT * FROM users", page_size=1)["next_page_token"]
+        self.manager.load_table("users", self.table_csv)
+        with self.assertRaises(ValueError):
+            self.executor.read_page_token(token)
+        
+    def test_page_tokens_work_across_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            # Two processes sharing a database file and QUERY_PAGE_SECRET
+            first = SchemaManager(os.path.join(tmp, "query.db"))
+            first.load_table("users", self.table_csv)
+            second = SchemaManager(os.path.join(tmp, "query.db"))
+            self.assertEqual(second.schema_version, first.schema_version)
+            
+            token = SQLExecutor(first, secret=b"shared").execute_page("SELECT * FROM users", page_size=2)["next_page_token"]
+            page = SQLExecutor(second, secret=b"shared").execute_page(page_token=token)
+            self.assertEqual([row[1] for row in page["rows"]], ["Charlie"])
+            
+            # A table loaded by one worker expires the other worker's tokens too
+            first.load_table("users", self.table_csv)
+            with self.assertRaises(ValueError):
+                SQLExecutor(second, secret=b"shared").read_page_token(token)
+            first.close()
+            second.close()
+        
+    def test_tables_loaded_by_another_worker_are_picked_up(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            first = SchemaManager(os.path.join(tmp, "query.db"))
+            second = SchemaManager(os.path.join(tmp, "query.db"))
+            first.load_table("users", self.table_csv)
+            
+            entries = [{"table_name": "users", "column_name": "age"}]
+            self.assertIn("3 distinct of 3 rows", second.column_stats_summary(entries)[("users", "age")])
+            self.assertEqual(second.table_schemas["users"], ["id", "name", "age"])
+            self.assertEqual(second.row_count("users"), 3)
+            # Full-scan detection on the second worker sees the row counts
+            executor = SQLExecutor(second, large_table_rows=3)
+            self.assertEqual(executor.validate("SELECT * FROM users WHERE name = 'Bob'"), (None, ["users (3 rows)"]))
+            first.close()
+            second.close()
+        
+    def test_query_timeout(self):
+        executor = SQLExecutor(self.manager, timeout=0.05)
+        runaway = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) SELECT count(*) FROM n"
+        page = executor.execute_page(runaway)
+        self.assertTrue(page["timed_out"])
+        self.assertIn("timed out", page["error"])
+        
+        # The connection is usable afterwards
+        cols, rows, err = executor.execute("SELECT 1")
+        self.assertIsNone(err)
+        
+    def test_readers_are_read_only(self):
+        self.manager.load_table("users", self.table_csv)
+        cols, rows, err = self.executor.execute("DELETE FROM users")
+        self.assertIn("readonly", err)
+        self.assertEqual(len(self.executor.execute("SELECT * FROM users")[1]), 3)
+        
+    def test_concurrent_reads_on_file_database(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            manager = SchemaManager(os.path.join(tmp, "query.db"))
+            manager.load_table("users", self.table_csv)
+            executor = SQLExecutor(manager)
+            
+            # Both queries hold a reader open at the same time
+            pages = [executor.execute_pages("SELECT * FROM users", page_size=1) for _ in range(2)]
+            for page in pages:
+                next(page)
+            results = [len(next(page)[1]) for page in pages]
+            self.assertEqual(results, [1, 1])
+            
+            # The writer is not blocked by open readers
+            success, msg = manager.load_table("more_users", self.table_csv)
+            self.assertTrue(success, msg)
+            for page in pages:
+                page.close()
+            
+            # A new manager on the same file picks up existing tables
+            reopened = SchemaManager(os.path.join(tmp, "query.db"))
+            self.assertEqual(reopened.table_schemas["users"], ["id", "name", "age"])
+            reopened.close()
+            manager.close()
+            
+    def test_parallel_queries(self):
+        self.manager.load_table("users", self.table_csv)
+        errors = []
+        def run():
+            for _ in range(20):
+                cols, rows, err = self.executor.execute("SELECT * FROM users")
+                if err or len(rows) != 3:
+                    errors.append(err)
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        
+    def test_search_relevant_schema(self):
+        self.manager.load_data_dictionary(self.dict_csv)
+        generator = FakeEmbeddingGenerator()
+        self.manager.embedding_generator = generator
+        self.manager.dictionary_texts = [
+            f"Table: {e['table_name']} Column: {e['column_name']} Description: {e['description']}"
+            for e in self.manager.data_dictionary
+        ]
+        self.manager.dictionary_index = np.asarray(
+            generator.generate_embeddings(self.manager.dictionary_texts), dtype=np.float32
+        )
+        self.manager.dictionary_index /= np.linalg.norm(self.manager.dictionary_index, axis=1, keepdims=True)
+        
+        results = self.manager.search_relevant_schema("age in years", top_k=1)
+        self.assertEqual([r["column_name"] for r in results], ["age"])
+        
+        batch = self.manager.search_relevant_schema_batch(["what is the name", "age in years"], top_k=2)
+        self.assertEqual(batch[0][0]["column_name"], "name")
+        self.assertEqual(batch[1][0]["column_name"], "age")
+        self.assertEqual(len(batch[1]), 2)
+        
+        # "age in years" was cached by the first search; only the new question is embedded
+        self.assertEqual(generator.calls[-1], ["what is the name"])
+        
+    def test_search_without_index(self):
+        self.manager.load_data_dictionary(self.dict_csv)
+        self.assertEqual(len(self.manager.search_relevant_schema("anything")), 3)
+
+    def test_lexical_search_without_embeddings(self):
+        self.manager.load_data_dictionary(self.dict_csv)
+        results = self.manager.search_relevant_schema("How old is each user? Show the age", top_k=2)
+        self.assertEqual(results[0]["column_name"], "age")
+        
+        grouped = self.manager.search_relevant_schema_grouped("user name", top_k=3)
+        self.assertEqual(list(grouped), ["users"])
+        self.assertEqual(grouped["users"][0]["column_name"], "name")
+        
+    def test_schema_block_is_grouped_and_deduplicated(self):
+        entries = [
+            {"table_name": "leads", "column_name": "lead_id", "description": "Lead ID"},
+            {"table_name": "accounts", "column_name": "account_id", "description": "Account ID"},
+            {"table_name": "leads", "column_name": "lead_id", "description": "Lead ID"},
+            {"table_name": "leads", "column_name": "account_id", "description": "FK to accounts"},
+        ]
+        self.assertEqual(
+            format_schema_block(entries),
+            "Table: leads\n  - lead_id: Lead ID\n  - account_id: FK to accounts\n"
+            "Table: accounts\n  - account_id: Account ID"
+        )
+
+class TestSQLGenerator(unittest.TestCase):
+    
+    def test_clean_sql_strips_fences(self):
+        self.assertEqual(SQLGenerator.clean_sql("```sql\nSELECT 1\n```"), "SELECT 1")
+        self.assertEqual(SQLGenerator.clean_sql(" SELECT 1 "), "SELECT 1")
+
+class ScriptedGenerator:
+    """Returns canned SQL and records the repair problems it was sent."""
+    
+    def __init__(self, first, repairs):
+        self.first = first
+        self.repairs = list(repairs)
+        self.problems = []
+        
+    def generate_sql(self, question, schema_context, all_tables, column_stats=None):
+        return self.first
+    
+    def repair_sql(self, question, schema_context, all_tables, sql, problem, column_stats=None):
+        self.problems.append(problem)
+        repair = self.repairs.pop(0)
+        if isinstance(repair, Exception):
+            raise repair
+        return repair
+
+class TestValidateAndRepair(unittest.TestCase):
+    
+    def setUp(self):
+        self.manager = SchemaManager(":memory:")
+        self.tmp = tempfile.TemporaryDirectory()
+        csv_path = os.path.join(self.tmp.name, "users.csv")
+        pd.DataFrame({"user_id": [1, 2, 3], "name": ["Alice", "Bob", "Charlie"]}).to_csv(csv_path, index=False)
+        self.manager.load_table("users", csv_path)
+        self.executor = SQLExecutor(self.manager, large_table_rows=3)
+        
+    def tearDown(self):
+        self.manager.close()
+        self.tmp.cleanup()
+        
+    def test_validate(self):
+        self.assertIn("no such column", self.executor.validate("SELECT nmae FROM users")[0])
+        self.assertIn("no such table", self.executor.validate("SELECT * FROM user")[0])
+        self.assertEqual(self.executor.validate("SELECT * FROM users u WHERE u.name = 'Bob'"), (None, ["users (3 rows)"]))
+        self.assertEqual(self.executor.validate("SELECT * FROM users WHERE user_id = 2"), (None, []))
+        # Nothing to filter on, so the scan is not worth a repair
+        self.assertEqual(self.executor.validate("SELECT count(*) FROM users"), (None, []))
+        
+    def test_missing_column_is_repaired(self):
+        generator = ScriptedGenerator("SELECT nmae FROM users WHERE user_id = 1", ["SELECT name FROM users WHERE user_id = 1"])
+        sql, steps, failed = generate_validated_sql(generator, self.executor, "q", [], ["users"])
+        
+        self.assertEqual(sql, "SELECT name FROM users WHERE user_id = 1")
+        self.assertIn("no such column: nmae", generator.problems[0])
+        self.assertEqual([step["step"] for step in steps], ["generate", "validate", "repair", "validate"])
+        self.assertTrue(all(step["ms"] >= 0 for step in steps))
+        
+    def test_repairs_are_bounded(self):
+        generator = ScriptedGenerator("SELECT a FROM nope", ["SELECT b FROM nope", "SELECT c FROM nope"])
+        sql, steps, failed = generate_validated_sql(generator, self.executor, "q", [], ["users"], max_repairs=1)
+        self.assertEqual(sql, "SELECT b FROM nope")
+        self.assertEqual(len(generator.problems), 1)
+        
+    def test_unavoidable_full_scan_is_accepted(self):
+        generator = ScriptedGenerator("SELECT * FROM users WHERE name = 'Bob'", ["SELECT * FROM users WHERE name = 'Bob'"])
+        sql, steps, failed = generate_validated_sql(generator, self.executor, "q", [], ["users"])
+        self.assertEqual(sql, "SELECT * FROM users WHERE name = 'Bob'")
+        self.assertIn("scans every row of users", generator.problems[0])
+        self.assertEqual(steps[-1]["step"], "repair")
+        
+    def test_broken_repair_keeps_working_query(self):
+        generator = ScriptedGenerator("SELECT * FROM users WHERE name = 'b'", ["SELECT * FROM users WHERE nmae = 'b'"])
+        sql, steps, failed = generate_validated_sql(generator, self.executor, "q", [], ["users"])
+        self.assertEqual(sql, "SELECT * FROM users WHERE name = 'b'")
+        self.assertIn("no such column: nmae", steps[-1]["error"])
+        
+    def test_failed_repair_keeps_working_query(self):
+        for repair in ["SELECT 'Error generating SQL: quota exceeded' as error", RuntimeError("quota exceeded")]:
+            generator = ScriptedGenerator("SELECT * FROM users WHERE name = 'b'", [repair])
+            sql, steps, failed = generate_validated_sql(generator, self.executor, "q", [], ["users"])
+            self.assertEqual(sql, "SELECT * FROM users WHERE name = 'b'")
+            self.assertFalse(failed)
+            self.assertEqual(steps[-1]["step"], "repair")
+        
+        # With nothing that worked, the error is reported
+        generator = ScriptedGenerator("SELECT nmae FROM users", [RuntimeError("quota exceeded")])
+        sql, steps, failed = generate_validated_sql(generator, self.executor, "q", [], ["users"])
+        self.assertTrue(failed)
+        self.assertIn("quota exceeded", sql)
+        
+    def test_unfiltered_aggregate_is_not_repaired(self):
+        generator = ScriptedGenerator("SELECT count(*) FROM users", [])
+        sql, steps, failed = generate_validated_sql(generator, self.executor, "q", [], ["users"])
+        self.assertEqual(sql, "SELECT count(*) FROM users")
+        self.assertEqual(generator.problems, [])
+
+class TestSQLGeneratorPool(unittest.TestCase):
+    
+    def test_clients_are_reused_per_key_and_model(self):
+        pool = SQLGeneratorPool(max_clients=2)
+        gemini = pool.get("key-1", "gemini-1.5-pro")
+        self.assertIs(pool.get("key-1", "gemini-1.5-pro"), gemini)
+        self.assertIsNot(pool.get("key-2", "gemini-1.5-pro"), gemini)
+        
+        openai = pool.get("key-1", "gpt-4o")
+        self.assertEqual(openai.provider, "openai")
+        # Capacity is 2, so the least recently used client was dropped
+        self.assertIsNot(pool.get("key-1", "gemini-1.5-pro"), gemini)
+        
+    def test_evicted_client_closes_after_its_last_request(self):
+        pool = SQLGeneratorPool(max_clients=1)
+        busy = pool.get("key-1", "gemini-1.5-pro")
+        with busy._request_slot():
+            pool.get("key-2", "gemini-1.5-pro")
+            self.assertFalse(busy.closed)
+        self.assertTrue(busy.closed)
+        
+        idle = pool.get("key-3", "gemini-1.5-pro")
+        pool.get("key-4", "gemini-1.5-pro")
+        self.assertTrue(idle.closed)
+
 if __name__ == '__main__':
     unittest.main()
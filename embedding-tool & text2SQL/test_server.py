@@ -0,0 +1,135 @@
+import unittest
+import os
+import json
+import tempfile
+import pandas as pd
+
+# The server builds its query engine at import time; point it at a scratch database
+_tmp = tempfile.TemporaryDirectory()
+os.environ['QUERY_DB_PATH'] = os.path.join(_tmp.name, "query.db")
+
+import server
+from query_engine import SQLGenerator
+
+class FakeGenerator:
+    """Stands in for an LLM client: always answers with the same SQL."""
+    
+    clean_sql = staticmethod(SQLGenerator.clean_sql)
+    
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        
+    def generate_sql(self, question, schema_context, all_tables, column_stats=None):
+        self.calls += 1
+        return self.sql
+    
+    def repair_sql(self, question, schema_context, all_tables, sql, problem, column_stats=None):
+        return sql
+    
+    def stream_sql(self, question, schema_context, all_tables, column_stats=None):
+        self.calls += 1
+        midpoint = len(self.sql) // 2
+        yield "```sql\n" + self.sql[:midpoint]
+        yield self.sql[midpoint:] + "\n```"
+
+class FakePool:
+    def __init__(self, generator):
+        self.generator = generator
+        
+    def get(self, api_key, model):
+        return self.generator
+
+def read_events(response):
+    """(event, data) pairs of a Server-Sent Events response."""
+    events = []
+    for block in response.get_data(as_text=True).split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+class TestQueryRoutes(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        csv_path = os.path.join(_tmp.name, "users.csv")
+        pd.DataFrame({"user_id": [1, 2, 3], "name": ["Alice", "Bob", "Charlie"]}).to_csv(csv_path, index=False)
+        server.schema_manager.load_table("users", csv_path)
+
+    def setUp(self):
+        self.client = server.app.test_client()
+        self.generator = FakeGenerator("SELECT name FROM users ORDER BY user_id")
+        self._pool = server.sql_generators
+        server.sql_generators = FakePool(self.generator)
+        server.sql_cache.invalidate()
+        
+    def tearDown(self):
+        server.sql_generators = self._pool
+        
+    def test_use_cache_strings_are_parsed(self):
+        version = server.schema_manager.schema_version
+        server.sql_cache.put("who", version, "gemini-1.5-pro", "SELECT 'cached'")
+        
+        res = self.client.post('/api/query', json={"question": "who", "api_key": "k", "use_cache": "false"})
+        self.assertEqual(res.get_json()["sql"], self.generator.sql)
+        self.assertIsNone(res.get_json()["cached"])
+        
+        self.assertEqual(self.generator.calls, 1)
+        
+        # The fresh answer replaced the cached one and is served without generating again
+        res = self.client.post('/api/query', json={"question": "who", "api_key": "k", "use_cache": "true"})
+        self.assertEqual(res.get_json()["cached"], "exact")
+        self.assertEqual(self.generator.calls, 1)
+        
+        res = self.client.post('/api/query', json={"question": "who", "api_key": "k", "use_cache": "maybe"})
+        self.assertEqual(res.status_code, 400)
+
+    def test_page_size_is_validated(self):
+        for page_size in ["many", 0, -5, server.sql_executor.max_rows + 1]:
+            for route in ('/api/query', '/api/query/stream'):
+                res = self.client.post(route, json={"question": "q", "api_key": "k", "page_size": page_size})
+                self.assertEqual(res.status_code, 400, (route, page_size))
+                self.assertIn("page_size", res.get_json()["error"])
+
+    def test_stream_sends_sql_then_pages(self):
+        res = self.client.post('/api/query/stream', json={"question": "names", "api_key": "k", "page_size": 2})
+        self.assertEqual(res.mimetype, "text/event-stream")
+        events = read_events(res)
+        names = [name for name, _ in events]
+        
+        self.assertEqual(names[0], "schema")
+        tokens = "".join(data["text"] for name, data in events if name == "token")
+        self.assertEqual(self.generator.clean_sql(tokens), self.generator.sql)
+        self.assertEqual(dict(events)["sql"], {"sql": self.generator.sql, "cached": None})
+        self.assertEqual(dict(events)["columns"], ["name"])
+        # One event per page, in order
+        pages = [data for name, data in events if name == "rows"]
+        self.assertEqual(pages, [[["Alice"], ["Bob"]], [["Charlie"]]])
+        self.assertEqual(names[-1], "done")
+        self.assertEqual(events[-1][1], {"row_count": 3, "truncated": False})
+        self.assertLess(names.index("sql"), names.index("columns"))
+        
+        # The second run comes from the cache, without tokens
+        events = read_events(self.client.post('/api/query/stream', json={"question": "names", "api_key": "k"}))
+        self.assertEqual(dict(events)["sql"]["cached"], "exact")
+        self.assertNotIn("token", [name for name, _ in events])
+        self.assertEqual(self.generator.calls, 1)
+        
+    def test_generation_errors_are_not_cached(self):
+        self.generator.sql = "SELECT 'Error generating SQL: quota exceeded' as error"
+        version = server.schema_manager.schema_version
+        for route in ('/api/query', '/api/query/stream'):
+            question = f"failing {route}"
+            res = self.client.post(route, json={"question": question, "api_key": "k"})
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(server.sql_cache.get(question, version, "gemini-1.5-pro"), (None, None), route)
+        
+    def test_stream_reports_sql_errors(self):
+        self.generator.sql = "SELECT missing FROM users"
+        events = read_events(self.client.post('/api/query/stream', json={"question": "bad", "api_key": "k"}))
+        self.assertEqual(events[-1][0], "error")
+        self.assertIn("missing", events[-1][1]["error"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import numpy as np
+from sql_cache import SQLCache, normalize_question
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class TestSQLCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = SQLCache(max_entries=2, similarity_threshold=0.9)
+
+    def test_exact_hit_ignores_case_and_punctuation(self):
+        self.cache.put("How many users?", 1, "gemini-1.5-pro", "SELECT COUNT(*) FROM users")
+        self.assertEqual(
+            self.cache.get("  how many   USERS ", 1, "gemini-1.5-pro"),
+            ("SELECT COUNT(*) FROM users", "exact")
+        )
+        self.assertEqual(normalize_question("Total revenue?!"), "total revenue")
+
+    def test_key_includes_schema_version_and_model(self):
+        self.cache.put("how many users", 1, "gemini-1.5-pro", "SELECT 1")
+        self.assertEqual(self.cache.get("how many users", 2, "gemini-1.5-pro"), (None, None))
+        self.assertEqual(self.cache.get("how many users", 1, "gpt-4o"), (None, None))
+
+    def test_semantic_hit(self):
+        self.cache.put("how many users", 1, "m", "SELECT COUNT(*) FROM users", unit([1, 0, 0]))
+        self.assertEqual(
+            self.cache.get("count the users", 1, "m", unit([1, 0.1, 0])),
+            ("SELECT COUNT(*) FROM users", "semantic")
+        )
+        self.assertEqual(self.cache.get("average age", 1, "m", unit([0, 1, 0])), (None, None))
+
+    def test_lru_eviction_and_invalidate(self):
+        for i in range(3):
+            self.cache.put(f"q{i}", 1, "m", f"SELECT {i}", unit([1, i, 0]))
+        self.assertEqual(self.cache.get("q0", 1, "m"), (None, None))
+        self.assertEqual(self.cache.get("q2", 1, "m")[0], "SELECT 2")
+
+        self.cache.invalidate()
+        self.assertEqual(self.cache.get("q2", 1, "m", unit([1, 2, 0])), (None, None))
+
+if __name__ == '__main__':
+    unittest.main()
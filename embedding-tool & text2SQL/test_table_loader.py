@@ -0,0 +1,106 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+import pandas as pd
+from table_loader import bulk_load_csv, compute_column_stats, infer_sqlite_types, is_key_column, summarize_column_stats
+from query_engine import SchemaManager, SQLGenerator
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_data")
+
+class TestTableLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmp.name, "orders.csv")
+        pd.DataFrame({
+            "order_id": [1, 2, 3, 4, 5],
+            "zip": ["02139", "10001", "94105", "02139", "60601"],
+            "amount": [10.5, 20.0, None, 7.25, 3.0],
+            "quantity": [1, None, 3, 4, 5],
+        }).to_csv(self.csv_path, index=False)
+        self.conn = sqlite3.connect(":memory:")
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def test_infer_types(self):
+        types = infer_sqlite_types(pd.read_csv(self.csv_path), pd.read_csv(self.csv_path, dtype=str))
+        self.assertEqual(types, {"order_id": "INTEGER", "zip": "TEXT", "amount": "REAL", "quantity": "INTEGER"})
+
+    def test_leading_zeros_are_kept(self):
+        bulk_load_csv(self.conn, "orders", self.csv_path)
+        zips = [row[0] for row in self.conn.execute("SELECT zip FROM orders ORDER BY order_id")]
+        self.assertEqual(zips, ["02139", "10001", "94105", "02139", "60601"])
+
+    def test_chunked_load_keeps_types_and_values(self):
+        pd.read_csv(self.csv_path, dtype={"zip": str}).assign(zip=lambda df: "Z" + df["zip"]).to_csv(self.csv_path, index=False)
+        columns, types, row_count = bulk_load_csv(self.conn, "orders", self.csv_path, chunk_size=2, sample_rows=3)
+
+        self.assertEqual(row_count, 5)
+        self.assertEqual(columns, ["order_id", "zip", "amount", "quantity"])
+        self.assertEqual(types["zip"], "TEXT")
+        rows = self.conn.execute("SELECT order_id, zip, amount, quantity FROM orders ORDER BY order_id").fetchall()
+        self.assertEqual(rows[0], (1, "Z02139", 10.5, 1))
+        self.assertEqual(rows[1], (2, "Z10001", 20.0, None))
+        self.assertEqual(self.conn.execute("SELECT typeof(quantity) FROM orders WHERE order_id = 3").fetchone()[0], "integer")
+
+    def test_failed_load_keeps_previous_table(self):
+        bulk_load_csv(self.conn, "orders", self.csv_path)
+        with self.assertRaises(Exception):
+            bulk_load_csv(self.conn, "orders", os.path.join(self.tmp.name, "missing.csv"))
+        self.assertEqual(self.conn.execute("SELECT count(*) FROM orders").fetchone()[0], 5)
+        tables = [row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        self.assertEqual(tables, ["orders"])
+
+    def test_key_columns(self):
+        self.assertTrue(is_key_column("account_id"))
+        self.assertTrue(is_key_column("accountId"))
+        self.assertTrue(is_key_column("owner", "Foreign key linking to the users table."))
+        self.assertFalse(is_key_column("region", "Geographical region of the account."))
+
+    def test_sample_tables_are_indexed_on_join_keys(self):
+        manager = SchemaManager(":memory:")
+        manager.load_table("leads", os.path.join(SAMPLE_DIR, "leads.csv"))
+        manager.load_data_dictionary(os.path.join(SAMPLE_DIR, "sales_data_dictionary.csv"))
+
+        with manager.readers.connection() as conn:
+            plan = conn.execute("EXPLAIN QUERY PLAN SELECT * FROM leads WHERE account_id = 'A001'").fetchall()
+        self.assertIn("idx_leads_account_id", " ".join(str(row[-1]) for row in plan))
+        manager.close()
+
+    def test_column_stats(self):
+        columns, types, _ = bulk_load_csv(self.conn, "orders", self.csv_path)
+        stats = compute_column_stats(self.conn, "orders", columns, top_k=1, max_categories=4)
+
+        self.assertEqual(stats["zip"]["distinct_count"], 4)
+        self.assertEqual(stats["zip"]["top_values"], [["02139", 2]])
+        self.assertEqual(stats["amount"]["null_count"], 1)
+        self.assertEqual((stats["amount"]["min"], stats["amount"]["max"]), (3.0, 20.0))
+        # Too many distinct values to list
+        self.assertEqual(stats["order_id"]["top_values"], [])
+        self.assertEqual(summarize_column_stats(stats["order_id"], "INTEGER"), "INTEGER; 5 distinct of 5 rows; range 1..5")
+
+    def test_stats_reach_the_prompt(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "query.db")
+            manager = SchemaManager(db_path)
+            manager.load_table("accounts", os.path.join(SAMPLE_DIR, "accounts.csv"))
+            manager.close()
+
+            # Statistics are stored with the tables and reloaded
+            manager = SchemaManager(db_path)
+            self.assertEqual(manager.get_all_tables(), ["accounts"])
+            entries = [{"table_name": "accounts", "column_name": "customer_status", "description": "Current status"}]
+            summary = manager.column_stats_summary(entries)[("accounts", "customer_status")]
+            self.assertIn("'Active'", summary)
+            self.assertIn("TEXT", summary)
+
+            generator = SQLGenerator("key", "gpt-4o")
+            prompt = generator.build_prompt("active accounts", entries, ["accounts"], manager.column_stats_summary(entries))
+            self.assertIn(f"customer_status: Current status [{summary}]", prompt)
+            manager.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,57 @@
+import os
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from chain import generate_sql, execute_sql, setup_mock_db
+from chain import generate_sql, get_router
 from utils import mask_pii, determine_intent
+from snowflake_client import get_snowflake_client
+from sales_db import ensure_database, query_dataframe
+from warehouse import get_warehouse
+from result_cache import get_result_cache
 
-# Initialize Mock DB
-setup_mock_db()
+# Initialize Mock DB (once per process, not on every rerun)
+ensure_database()
+
+# Start loading the local Snowflake model now rather than on the first question
+if os.getenv("SNOWFLAKE_PRELOAD", "0") == "1":
+    get_snowflake_client().start_background_load()
 
 st.set_page_config(page_title="Sales Data Assistant", layout="wide")
 
+@st.cache_data(show_spinner=False)
+def load_sample_previews():
+    """Masked Leads and Sales Reps previews, queried once for the app's lifetime."""
+    df_leads = query_dataframe("SELECT * FROM LEADS LIMIT 3")
+    df_reps = query_dataframe("SELECT * FROM SALES_REPS LIMIT 3")
+    return mask_pii(df_leads), mask_pii(df_reps)
+
+def load_masked_result(sql, placeholder, batch_size=500):
+    """
+    Masked result of a query, served from the result cache when the same SQL
+    already ran on the current data. Otherwise the first masked rows are shown
+    as soon as the first Arrow batch arrives, then the full result.
+    """
+    warehouse = get_warehouse()
+    cache = get_result_cache()
+    version = warehouse.data_version()
+    df = cache.get(sql, version)
+    if df is not None:
+        placeholder.dataframe(df)
+        return df
+
+    frames = []
+    try:
+        for batch in warehouse.stream_batches(sql, batch_size=batch_size):
+            frames.append(mask_pii(batch.to_pandas()))
+            if len(frames) == 1:
+                placeholder.dataframe(frames[0])
+        df = pd.concat(frames, ignore_index=True)
+        cache.put(sql, version, df)
+    except Exception as e:
+        df = pd.DataFrame({"error": [str(e)]})
+    placeholder.dataframe(df)
+    return df
+
 st.title("Sales Data Assistant 🤖")
 
 # Sidebar
@@ -20,10 +63,20 @@ with st.sidebar:
         "gemini-3-pro-preview",
         "snowflake-arctic-text2sql"
     ], index=0)
+    if "snowflake" in model_choice:
+        get_snowflake_client().start_background_load()
+        st.caption(f"Snowflake model: {get_snowflake_client().status()['state']}")
     st.info("Using Mock SQLite Database for demonstration.")
     
     if st.button("Clear Chat History"):
         st.session_state.messages = []
+    
+    with st.expander("LLM Latency"):
+        st.json(get_router().latency_stats())
+        st.json(get_snowflake_client().status())
+    
+    with st.expander("Result Cache"):
+        st.json(get_result_cache().stats())
 
 # Initialize chat history
 if "messages" not in st.session_state:
@@ -61,29 +114,23 @@ if prompt := st.chat_input("Ask a question about your sales data..."):
         with st.chat_message("assistant"):
             st.markdown("Here is a preview of the **Leads** and **Sales Reps** data:")
             
-            # Fetch sample data directly
-            import sqlite3
-            conn = sqlite3.connect('mock_sales.db')
             try:
-                df_leads = pd.read_sql_query("SELECT * FROM LEADS LIMIT 3", conn)
-                df_reps = pd.read_sql_query("SELECT * FROM SALES_REPS LIMIT 3", conn)
+                df_leads, df_reps = load_sample_previews()
                 
                 st.subheader("Leads (Preview)")
-                st.dataframe(mask_pii(df_leads))
+                st.dataframe(df_leads)
                 
                 st.subheader("Sales Reps (Preview)")
-                st.dataframe(mask_pii(df_reps))
+                st.dataframe(df_reps)
                 
                 response_text = "I've displayed some sample data above."
                 st.session_state.messages.append({
                     "role": "assistant", 
                     "content": response_text,
-                    "data": mask_pii(df_leads) # Storing one for history simplicity
+                    "data": df_leads # Storing one for history simplicity
                 })
             except Exception as e:
                 st.error(f"Error fetching sample data: {e}")
-            finally:
-                conn.close()
 
     elif intent == "GENERAL":
         # Soft fallback instead of blocking
@@ -99,19 +146,14 @@ if prompt := st.chat_input("Ask a question about your sales data..."):
                     # Generate SQL
                     sql_query = generate_sql(prompt, model_name=model_choice)
                     
-                    # Execute SQL
-                    df_result = execute_sql(sql_query)
-                    
-                    # Mask PII
-                    df_safe = mask_pii(df_result)
-                    
                     response_text = "Here is the data you requested:"
                     st.markdown(response_text)
                     
                     with st.expander("View Generated SQL"):
                         st.code(sql_query, language="sql")
                     
-                    st.dataframe(df_safe)
+                    # Execute SQL (or reuse a cached result), masking PII batch by batch as rows stream in
+                    df_safe = load_masked_result(sql_query, st.empty())
                     
                     # Generate Chart if appropriate
                     chart = None
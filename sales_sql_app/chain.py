@@ -1,14 +1,23 @@
+import asyncio
 import os
-import sqlite3
+import hashlib
+import importlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
 from puter_client import get_puter_client
+from embedding_cache import get_query_embedding_cache
+from llm_router import SQLRouter
 from snowflake_client import get_snowflake_client
+from sales_db import setup_mock_db  # noqa: F401 (re-exported)
+from warehouse import get_warehouse
 from langchain_ollama import ChatOllama, OllamaEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda
 from dotenv import load_dotenv
 import langchain
 
@@ -20,146 +29,274 @@ if not hasattr(langchain, 'debug'):
 if not hasattr(langchain, 'llm_cache'):
     langchain.llm_cache = None
 
-from prompts import SYSTEM_PROMPT, FEW_SHOT_EXAMPLES
+from prompts import SYSTEM_PROMPT
 
 load_dotenv()
 
-# Initialize Vector Store for Few-Shot Examples
-def setup_vector_store():
+# Few-shot vector store, loaded once per process and shared by all sessions
+INDEX_PATH = "faiss_index_ollama"
+
+_embeddings = None
+_vector_store = None
+_vector_store_hash = None
+_vector_store_lock = threading.Lock()
+
+# Runs few-shot retrieval alongside the rest of generate_sql's setup
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chain")
+
+def get_embeddings():
+    """Ollama embeddings (snowflake-arctic-embed2:568m), created once."""
+    global _embeddings
+    if _embeddings is None:
+        _embeddings = OllamaEmbeddings(
+            model="snowflake-arctic-embed2:568m",
+            base_url="http://localhost:11434"
+        )
+    return _embeddings
+
+def current_few_shot_examples():
     """
-    Setup vector store with Ollama embeddings (snowflake-arctic-embed2:568m).
+    FEW_SHOT_EXAMPLES as currently loaded.
+    
+    Looked up through sys.modules rather than a from-import, so an edited
+    prompts.py that Streamlit has reloaded is picked up.
+    """
+    return importlib.import_module("prompts").FEW_SHOT_EXAMPLES
+
+def example_id(example):
+    """Stable document id for one few-shot example."""
+    key = json.dumps({"question": example["question"], "sql": example["sql"]}, sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+def examples_hash(examples):
+    """Content hash of the whole example set."""
+    return hashlib.sha256("".join(example_id(ex) for ex in examples).encode("utf-8")).hexdigest()
+
+def setup_vector_store(examples=None):
     """
-    # Use Ollama for embeddings
-    embeddings = OllamaEmbeddings(
-        model="snowflake-arctic-embed2:568m",
-        base_url="http://localhost:11434"
-    )
+    Build or update the on-disk vector store (Ollama embeddings) for the few-shot examples.
     
-    # Index directory
-    index_path = "faiss_index_ollama"
+    Documents are keyed by example_id, so only examples missing from the saved
+    index are embedded; removed examples are deleted. Returns a fresh store
+    object that is not shared with other threads until get_vector_store swaps it in.
+    """
+    if examples is None:
+        examples = current_few_shot_examples()
+    embeddings = get_embeddings()
+    wanted = {example_id(ex): ex for ex in examples}
     
-    # Try to load existing index
-    if os.path.exists(index_path) and os.path.isdir(index_path):
+    vectorstore = None
+    if os.path.exists(os.path.join(INDEX_PATH, "index.faiss")):
         try:
-            if os.path.exists(os.path.join(index_path, "index.faiss")):
-                return FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+            vectorstore = FAISS.load_local(INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
         except Exception as e:
             print(f"Error loading FAISS index: {e}")
-
-    # Create new index
+    
     try:
-        print("Creating new vector store with Ollama embeddings...")
-        texts = [ex["question"] for ex in FEW_SHOT_EXAMPLES]
-        metadatas = [{"sql": ex["sql"]} for ex in FEW_SHOT_EXAMPLES]
-        vectorstore = FAISS.from_texts(texts, embeddings, metadatas=metadatas)
-        vectorstore.save_local(index_path)
-        print("Vector store created and saved.")
+        if vectorstore is None:
+            print("Creating new vector store with Ollama embeddings...")
+            ids = list(wanted)
+            vectorstore = FAISS.from_texts(
+                [wanted[i]["question"] for i in ids], embeddings,
+                metadatas=[{"sql": wanted[i]["sql"]} for i in ids], ids=ids
+            )
+        else:
+            stored = set(vectorstore.index_to_docstore_id.values())
+            removed = [i for i in stored if i not in wanted]
+            added = [i for i in wanted if i not in stored]
+            if not removed and not added:
+                return vectorstore
+            if len(removed) == len(stored):
+                # Nothing reusable (e.g. an index saved before examples had ids)
+                vectorstore = FAISS.from_texts(
+                    [wanted[i]["question"] for i in added], embeddings,
+                    metadatas=[{"sql": wanted[i]["sql"]} for i in added], ids=added
+                )
+            else:
+                if removed:
+                    vectorstore.delete(removed)
+                if added:
+                    vectorstore.add_texts(
+                        [wanted[i]["question"] for i in added],
+                        metadatas=[{"sql": wanted[i]["sql"]} for i in added], ids=added
+                    )
+            print(f"Vector store updated: {len(added)} examples embedded, {len(removed)} removed.")
+        vectorstore.save_local(INDEX_PATH)
         return vectorstore
     except Exception as e:
         print(f"Error creating vector store: {e}")
         return None
 
-# Mock Database Setup
-def setup_mock_db():
-    conn = sqlite3.connect('mock_sales.db')
-    cursor = conn.cursor()
-    
-    # Create tables
-    cursor.execute('''CREATE TABLE IF NOT EXISTS LEADS (lead_id INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT, email TEXT, phone TEXT, source TEXT, status TEXT, created_at DATETIME)''')
-    cursor.execute('''CREATE TABLE IF NOT EXISTS SALES_REPS (rep_id INTEGER PRIMARY KEY, name TEXT, region TEXT, quota FLOAT, email TEXT)''')
-    cursor.execute('''CREATE TABLE IF NOT EXISTS DEALS (deal_id INTEGER PRIMARY KEY, lead_id INTEGER, rep_id INTEGER, amount FLOAT, stage TEXT, close_date DATE, created_at DATETIME, FOREIGN KEY(lead_id) REFERENCES LEADS(lead_id), FOREIGN KEY(rep_id) REFERENCES SALES_REPS(rep_id))''')
-    cursor.execute('''CREATE TABLE IF NOT EXISTS REVENUE (revenue_id INTEGER PRIMARY KEY, deal_id INTEGER, amount FLOAT, recognition_date DATE, FOREIGN KEY(deal_id) REFERENCES DEALS(deal_id))''')
+def get_vector_store():
+    """
+    Process-wide few-shot vector store.
     
-    # Insert dummy data if empty
-    cursor.execute("SELECT count(*) FROM SALES_REPS")
-    if cursor.fetchone()[0] == 0:
-        cursor.execute("INSERT INTO SALES_REPS VALUES (1, 'John Doe', 'North', 100000, 'john@example.com')")
-        cursor.execute("INSERT INTO SALES_REPS VALUES (2, 'Jane Smith', 'South', 120000, 'jane@example.com')")
-        cursor.execute("INSERT INTO LEADS VALUES (1, 'Alice', 'Brown', 'alice@test.com', '555-0101', 'Web', 'New', '2023-01-01')")
-        cursor.execute("INSERT INTO DEALS VALUES (1, 1, 1, 5000, 'Closed Won', '2023-01-15', '2023-01-05')")
-        cursor.execute("INSERT INTO REVENUE VALUES (1, 1, 5000, '2023-01-15')")
-        conn.commit()
+    Rebuilt (incrementally) only when the FEW_SHOT_EXAMPLES content changes;
+    every other call returns the already loaded store.
+    """
+    global _vector_store, _vector_store_hash
+    examples = current_few_shot_examples()
+    current = examples_hash(examples)
+    if _vector_store is not None and _vector_store_hash == current:
+        return _vector_store
     
-    conn.close()
+    with _vector_store_lock:
+        if _vector_store is None or _vector_store_hash != current:
+            vectorstore = setup_vector_store(examples)
+            if vectorstore is None:
+                # Keep serving the previous store; retry on the next call
+                return _vector_store
+            _vector_store, _vector_store_hash = vectorstore, current
+        return _vector_store
+
+_schema_cache = {"mtime": None, "text": None}
+_schema_lock = threading.Lock()
 
 def get_schema_context():
+    """schema_context.md, re-read only when the file's mtime changes."""
     schema_path = os.path.join(os.path.dirname(__file__), 'schema_context.md')
-    with open(schema_path, 'r') as f:
-        return f.read()
+    mtime = os.stat(schema_path).st_mtime_ns
+    with _schema_lock:
+        if _schema_cache["mtime"] != mtime:
+            with open(schema_path, 'r') as f:
+                _schema_cache["text"] = f.read()
+            _schema_cache["mtime"] = mtime
+        return _schema_cache["text"]
+
+def embed_query(query):
+    """Question embedding for few-shot retrieval, served from the query embedding cache when possible."""
+    return get_query_embedding_cache().embed(get_embeddings(), query)
 
-def get_few_shot_examples(query, vectorstore):
-    docs = vectorstore.similarity_search(query, k=2)
+def get_few_shot_examples(query, vectorstore, embedding=None):
+    if embedding is None:
+        embedding = embed_query(query)
+    docs = vectorstore.similarity_search_by_vector(embedding, k=2)
     examples = ""
     for doc in docs:
         examples += f"Q: {doc.page_content}\nSQL: {doc.metadata['sql']}\n\n"
     return examples
 
-def generate_sql(query, model_name="gemini-3-pro-preview"):
+def load_few_shot_examples(query):
+    """Few-shot examples text for a question, or a placeholder when retrieval is unavailable."""
     try:
-        vectorstore = setup_vector_store()
+        vectorstore = get_vector_store()
         if vectorstore:
-            examples = get_few_shot_examples(query, vectorstore)
-        else:
-            examples = "No examples available due to embedding API limits."
+            return get_few_shot_examples(query, vectorstore)
+        return "No examples available due to embedding API limits."
     except Exception as e:
         print(f"Vector store error: {e}")
-        examples = "No examples available."
+        return "No examples available."
 
-    schema = get_schema_context()
-    
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", SYSTEM_PROMPT),
-        ("human", "{query}")
-    ])
-    
-    # Route to appropriate LLM based on model name
-    if "ollama" in model_name.lower():
-        llm = ChatOllama(
-            model="arctic-sql-lite",
-            temperature=0,
-            base_url="http://localhost:11434"
-        )
-    
-    elif "snowflake" in model_name.lower():
-        try:
-            client = get_snowflake_client()
-            return client.generate_sql(query, schema)
-        except Exception as e:
-            print(f"Error calling Snowflake model: {e}")
-            # Fallback to Gemini
-            model_name = "gemini-1.5-pro"
-            llm = ChatGoogleGenerativeAI(model=model_name, temperature=0)
-
-    elif "claude" in model_name.lower():
-        # Use Puter client for Claude models
-        puter = get_puter_client()
-        
-        # Format prompt for Puter
-        messages = [
-            {"role": "system", "content": SYSTEM_PROMPT.format(schema=schema, examples=examples)},
-            {"role": "user", "content": query}
-        ]
-        
-        # Call Puter with Claude model - NO FALLBACK so we see real errors
-        response = puter.chat(model_name, messages, temperature=0)
-        return response
+def backend_for(model_name):
+    """Which backend serves a model name: ollama, snowflake, claude or gemini."""
+    name = model_name.lower()
+    for backend in ("ollama", "snowflake", "claude", "gemini"):
+        if backend in name:
+            return backend
+    return "gemini"
+
+# LLM clients and compiled chains, built once per model and reused across questions
+_llms = {}
+_chains = {}
+_llm_lock = threading.Lock()
+
+def _llm_key(model_name):
+    if backend_for(model_name) == "ollama":
+        return ("ollama", "arctic-sql-lite")
+    if "gemini" in model_name.lower():
+        return ("gemini", model_name)
+    # Default to Gemini if unknown
+    return ("gemini", "gemini-3-pro-preview")
+
+def get_llm(model_name):
+    """LangChain chat model for an Ollama or Gemini model name."""
+    key = _llm_key(model_name)
+    with _llm_lock:
+        if key not in _llms:
+            if key[0] == "ollama":
+                _llms[key] = ChatOllama(
+                    model=key[1],
+                    temperature=0,
+                    base_url="http://localhost:11434"
+                )
+            else:
+                _llms[key] = ChatGoogleGenerativeAI(model=key[1], temperature=0)
+        return _llms[key]
+
+def get_sql_chain(model_name):
+    """
+    Compiled prompt | llm | parser chain for a model.
     
-    elif "gemini" in model_name.lower():
-        llm = ChatGoogleGenerativeAI(model=model_name, temperature=0)
-        
-    else:
-        # Default to Gemini if unknown
-        llm = ChatGoogleGenerativeAI(model="gemini-3-pro-preview", temperature=0)
+    Schema, examples and query are chain inputs, so the same chain serves every question.
+    """
+    key = _llm_key(model_name)
+    llm = get_llm(model_name)
+    with _llm_lock:
+        chain = _chains.get(key)
+        if chain is None:
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", SYSTEM_PROMPT),
+                ("human", "{query}")
+            ])
+            chain = prompt | llm | StrOutputParser() | RunnableLambda(clean_sql_output)
+            _chains[key] = chain
+        return chain
+
+async def _chain_backend(model_name, query, schema, examples):
+    """Ollama and Gemini through their cached LangChain chain."""
+    chain = get_sql_chain(model_name)
+    return await chain.ainvoke({"schema": schema, "examples": await examples, "query": query})
+
+async def _snowflake_backend(model_name, query, schema, examples):
+    # Local model: loading runs in a worker thread so the event loop stays free
+    client = get_snowflake_client()
+    if not await asyncio.to_thread(client.initialize):
+        raise Exception("Failed to initialize Snowflake model")
+    # Cancelling this await (hedge lost, deadline) cancels the batched request,
+    # which drops it from the queue or stops its generation
+    return await asyncio.wrap_future(client.submit_sql(query, schema))
+
+async def _claude_backend(model_name, query, schema, examples):
+    # Use Puter client for Claude models
+    puter = get_puter_client()
     
-    chain = (
-        {"schema": lambda x: schema, "examples": lambda x: examples, "query": RunnablePassthrough()}
-        | prompt
-        | llm
-        | StrOutputParser()
-        | clean_sql_output
-    )
+    # Format prompt for Puter
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT.format(schema=schema, examples=await examples)},
+        {"role": "user", "content": query}
+    ]
+    # Runs on the Puter client's own loop; cancelling this await cancels the request
+    return await asyncio.wrap_future(puter.submit_chat(model_name, messages, temperature=0))
+
+_router = None
+
+def get_router():
+    """
+    Process-wide SQLRouter.
     
-    return chain.invoke(query)
+    Snowflake falls back to (and is hedged with) gemini-1.5-pro; Claude has no
+    fallback so its real errors surface.
+    """
+    global _router
+    if _router is None:
+        _router = SQLRouter(
+            backends={
+                "ollama": _chain_backend,
+                "gemini": _chain_backend,
+                "snowflake": _snowflake_backend,
+                "claude": _claude_backend
+            },
+            backend_for=backend_for,
+            hedge=os.getenv("LLM_HEDGE", "1") != "0"
+        )
+    return _router
+
+def generate_sql(query, model_name="gemini-3-pro-preview"):
+    # Embed the question and retrieve examples while the schema and LLM client are prepared
+    examples_future = _executor.submit(load_few_shot_examples, query)
+
+    schema = get_schema_context()
+    return get_router().generate(model_name, query, schema, examples_future)
 
 def clean_sql_output(text):
     """Extract SQL from markdown code blocks or raw text."""
@@ -172,13 +309,9 @@ def clean_sql_output(text):
     return text.strip()
 
 def execute_sql(sql):
-    # For now, executing against the mock SQLite DB
+    # Runs on the backend chosen by WAREHOUSE_BACKEND (mock SQLite DB by default)
     # In production, this would connect to Snowflake
-    conn = sqlite3.connect('mock_sales.db')
     try:
-        df = pd.read_sql_query(sql, conn)
-        return df
+        return get_warehouse().execute(sql)
     except Exception as e:
         return pd.DataFrame({"error": [str(e)]})
-    finally:
-        conn.close()
@@ -0,0 +1,118 @@
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+def normalize_query(query):
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.rstrip("?.! ")
+
+class QueryEmbeddingCache:
+    """
+    Two-level cache of question embeddings: an in-memory LRU in front of a
+    SQLite file, keyed by embedding model and normalized question text.
+
+    The file keeps at most max_rows vectors; the oldest written are deleted
+    first.
+    """
+    def __init__(self, path="query_embeddings.db", max_entries=1024, max_rows=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings "
+            "(model TEXT, query TEXT, vector BLOB, PRIMARY KEY (model, query))"
+        )
+        self._conn.commit()
+
+    def get(self, model, query):
+        """Cached embedding as a list of floats, or None."""
+        key = (model, normalize_query(query))
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits["memory"] += 1
+                return self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT vector FROM query_embeddings WHERE model = ? AND query = ?", key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            vector = np.frombuffer(row[0], dtype="<f4").tolist()
+            self.hits["disk"] += 1
+            self._remember(key, vector)
+            return vector
+
+    def put(self, model, query, vector):
+        key = (model, normalize_query(query))
+        with self._lock:
+            self._remember(key, list(vector))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?)",
+                (key[0], key[1], np.asarray(vector, dtype="<f4").tobytes())
+            )
+            # REPLACE gives the row a new rowid, so rowid order is write order
+            self._conn.execute(
+                "DELETE FROM query_embeddings WHERE rowid IN "
+                "(SELECT rowid FROM query_embeddings ORDER BY rowid DESC LIMIT -1 OFFSET ?)",
+                (self.max_rows,)
+            )
+            self._conn.commit()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def embed(self, embeddings, query):
+        """
+        Embed a question through the cache.
+
+        Args:
+            embeddings: LangChain Embeddings used on a miss
+            query: Question text
+        """
+        model = getattr(embeddings, "model", type(embeddings).__name__)
+        vector = self.get(model, query)
+        if vector is None:
+            vector = embeddings.embed_query(query)
+            self.put(model, query, vector)
+        return vector
+
+    def stats(self):
+        """Hit/miss counters and overall hit rate."""
+        with self._lock:
+            hits = self.hits["memory"] + self.hits["disk"]
+            total = hits + self.misses
+            return {
+                "entries_in_memory": len(self._memory),
+                "hits": dict(self.hits),
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0
+            }
+
+# Global instance
+_query_embedding_cache = None
+
+def get_query_embedding_cache():
+    global _query_embedding_cache
+    if _query_embedding_cache is None:
+        _query_embedding_cache = QueryEmbeddingCache(
+            path=os.getenv("QUERY_EMBEDDING_CACHE", "query_embeddings.db"),
+            max_rows=int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_ROWS", "100000"))
+        )
+    return _query_embedding_cache
@@ -0,0 +1,181 @@
+import asyncio
+import concurrent.futures
+import inspect
+import re
+import threading
+import time
+from collections import deque
+
+from background_loop import get_background_loop
+
+# Seconds each backend gets before its attempt is abandoned
+DEFAULT_DEADLINES = {
+    "ollama": 60,
+    "gemini": 60,
+    "claude": 90,
+    "snowflake": 300
+}
+
+# Backend tried when the primary is slow or fails (claude has none, so its errors surface)
+DEFAULT_FALLBACKS = {
+    "snowflake": "gemini-1.5-pro"
+}
+
+def is_valid_sql(text):
+    """True if a completion looks like a runnable query."""
+    return isinstance(text, str) and re.match(r"\s*(select|with)\b", text, re.IGNORECASE) is not None
+
+class LatencyStats:
+    """Recent latencies and outcome counts for one backend."""
+    def __init__(self, window=200, min_samples=5):
+        self.latencies = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.counts = {"ok": 0, "error": 0, "timeout": 0, "cancelled": 0}
+        self._lock = threading.Lock()
+
+    def record(self, outcome, seconds=None):
+        with self._lock:
+            self.counts[outcome] += 1
+            if outcome == "ok":
+                self.latencies.append(seconds)
+
+    def percentile(self, q):
+        """q-th percentile of successful latencies, or None until min_samples are seen."""
+        with self._lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+    def snapshot(self):
+        return {
+            "counts": dict(self.counts),
+            "samples": len(self.latencies),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95)
+        }
+
+class SQLRouter:
+    """
+    Routes a question to an LLM backend with deadlines and optional hedging.
+
+    Each attempt runs as an asyncio task under its backend's deadline. With
+    hedging on, the fallback starts as soon as the primary has been running
+    longer than its own p95 latency (or immediately if the primary fails);
+    the first valid SQL wins and the other attempt is cancelled.
+    """
+    def __init__(self, backends, backend_for, deadlines=None, fallbacks=None, hedge=True):
+        """
+        Args:
+            backends: {backend: async fn(model_name, query, schema, examples) -> str},
+                where examples is an awaitable of the few-shot examples text
+            backend_for: Maps a model name to its backend
+            deadlines: {backend: seconds}
+            fallbacks: {backend: fallback model name}
+            hedge: Start the fallback early based on the primary's p95 latency
+        """
+        self.backends = backends
+        self.backend_for = backend_for
+        self.deadlines = dict(DEFAULT_DEADLINES, **(deadlines or {}))
+        self.fallbacks = dict(DEFAULT_FALLBACKS, **(fallbacks or {}))
+        self.hedge = hedge
+        self.stats = {backend: LatencyStats() for backend in backends}
+
+    async def _attempt(self, model_name, query, schema, examples):
+        backend = self.backend_for(model_name)
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(
+                self.backends[backend](model_name, query, schema, examples),
+                timeout=self.deadlines.get(backend)
+            )
+        except asyncio.TimeoutError:
+            self.stats[backend].record("timeout")
+            raise TimeoutError(f"{backend} did not answer within {self.deadlines.get(backend)}s")
+        except asyncio.CancelledError:
+            self.stats[backend].record("cancelled")
+            raise
+        except Exception:
+            self.stats[backend].record("error")
+            raise
+        self.stats[backend].record("ok", time.perf_counter() - started)
+        return result
+
+    async def route(self, model_name, query, schema, examples):
+        """
+        Generate SQL for a question.
+
+        Args:
+            examples: Few-shot examples text, or a (concurrent) future resolving to it
+
+        Returns:
+            The first valid SQL; otherwise whatever the primary (or failing
+            that, the fallback) returned
+        """
+        primary_backend = self.backend_for(model_name)
+        fallback = self.fallbacks.get(primary_backend)
+        # Backends that use few-shot examples await this; the others start without waiting for retrieval
+        if isinstance(examples, concurrent.futures.Future):
+            examples_task = asyncio.wrap_future(examples)
+        elif inspect.isawaitable(examples):
+            examples_task = asyncio.ensure_future(examples)
+        else:
+            examples_task = asyncio.get_running_loop().create_future()
+            examples_task.set_result(examples)
+
+        async def run(name):
+            return await self._attempt(name, query, schema, examples_task)
+
+        primary = asyncio.create_task(run(model_name))
+        fallback_task = None
+        tasks = {primary}
+        hedge_after = self.stats[primary_backend].percentile(95) if (self.hedge and fallback) else None
+        results, errors = {}, {}
+
+        try:
+            while tasks:
+                timeout = hedge_after if (fallback and fallback_task is None) else None
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Primary is slower than its usual p95: race the fallback against it
+                    print(f"{primary_backend} exceeded its p95 ({hedge_after:.1f}s), hedging with {fallback}")
+                    fallback_task = asyncio.create_task(run(fallback))
+                    tasks.add(fallback_task)
+                    continue
+
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is not None:
+                        errors[task] = task.exception()
+                        print(f"LLM backend error: {task.exception()}")
+                    elif is_valid_sql(task.result()):
+                        return task.result()
+                    else:
+                        results[task] = task.result()
+
+                # Primary finished without valid SQL and no hedge was started
+                if primary.done() and fallback and fallback_task is None:
+                    print(f"Falling back to {fallback}")
+                    fallback_task = asyncio.create_task(run(fallback))
+                    tasks.add(fallback_task)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if not examples_task.done():
+                examples_task.cancel()
+            # Let cancelled attempts unwind (and record it) before returning
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        for task in (primary, fallback_task):
+            if task in results:
+                return results[task]
+        raise errors[primary]
+
+    def generate(self, model_name, query, schema, examples):
+        """Synchronous entry point: runs route() on the shared background loop."""
+        return get_background_loop().run(self.route(model_name, query, schema, examples))
+
+    def latency_stats(self):
+        """{backend: latency snapshot}, used to tune deadlines and hedge thresholds."""
+        return {backend: stats.snapshot() for backend, stats in self.stats.items()}
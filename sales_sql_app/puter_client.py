@@ -2,66 +2,131 @@ import os
 from dotenv import load_dotenv
 import asyncio
 
+from background_loop import BackgroundLoop
+
 load_dotenv()
 
 class PuterClient:
-    def __init__(self):
+    """
+    Puter AI client with one long-lived, authenticated session.
+
+    All Puter calls run on a dedicated event-loop thread, so the SDK's
+    aiohttp session is created once and reused by every Streamlit session.
+    Synchronous callers use chat(); async callers on another loop can await
+    asyncio.wrap_future(client.submit_chat(...)).
+    """
+    def __init__(self, username=None, password=None, api_base=None, login_url=None,
+                 max_concurrency=4, token_refresh_interval=3600, request_timeout=120):
+        """
+        Args:
+            username, password: Puter credentials (default: PUTER_USERNAME / PUTER_PASSWORD)
+            api_base, login_url: Override the Puter endpoints, e.g. to point at a local fake
+                (default: PUTER_API_BASE / PUTER_LOGIN_URL, else the SDK's)
+            max_concurrency: Requests in flight at once
+            token_refresh_interval: Seconds between background re-logins
+            request_timeout: Seconds a synchronous chat() call waits
+        """
+        self.username = username or os.getenv("PUTER_USERNAME")
+        self.password = password or os.getenv("PUTER_PASSWORD")
+        self.api_base = api_base or os.getenv("PUTER_API_BASE")
+        self.login_url = login_url or os.getenv("PUTER_LOGIN_URL")
+        self.token_refresh_interval = token_refresh_interval
+        self.request_timeout = request_timeout
+
         self.client = None
         self._initialized = False
-        
+        self._loop = BackgroundLoop(name="puter-client")
+        # Only used on the client's loop
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._login_lock = asyncio.Lock()
+        self._refresh_task = None
+        self._pending_refresh = None
+
+    async def _ensure_session(self):
+        if self._initialized:
+            return
+        async with self._login_lock:
+            if self._initialized:
+                return
+            from putergenai import PuterClient as PuterSDK
+
+            if not self.username or not self.password:
+                raise Exception("PUTER_USERNAME and PUTER_PASSWORD not found")
+
+            client = PuterSDK()
+            if self.api_base:
+                client.api_base = self.api_base.rstrip("/")
+            if self.login_url:
+                client.login_url = self.login_url
+            await client.login(self.username, self.password)
+
+            self.client = client
+            self._initialized = True
+            if self.token_refresh_interval:
+                self._refresh_task = asyncio.ensure_future(self._refresh_periodically())
+            print(f"Puter initialized for: {self.username}")
+
+    async def _refresh_token(self):
+        """Log in again on the existing session; the new token replaces the old one."""
+        try:
+            await self.client.login(self.username, self.password)
+        except Exception as e:
+            print(f"Puter token refresh failed: {e}")
+
+    async def _refresh_periodically(self):
+        while True:
+            await asyncio.sleep(self.token_refresh_interval)
+            await self._refresh_token()
+
+    def _refresh_in_background(self):
+        """Start a token refresh unless one is already running; returns its task."""
+        if self._pending_refresh is None or self._pending_refresh.done():
+            self._pending_refresh = asyncio.ensure_future(self._refresh_token())
+        return self._pending_refresh
+
     def initialize(self):
         if self._initialized:
             return True
-            
         try:
-            from putergenai import PuterClient as PuterSDK
-            
-            username = os.getenv("PUTER_USERNAME")
-            password = os.getenv("PUTER_PASSWORD")
-            
-            if not username or not password:
-                print("WARNING: PUTER_USERNAME and PUTER_PASSWORD not found")
-                return False
-                
-            self.client = PuterSDK()
-            
-            try:
-                loop = asyncio.get_event_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            
-            loop.run_until_complete(self.client.login(username, password))
-            self._initialized = True
-            print(f"Puter initialized for: {username}")
+            self._loop.run(self._ensure_session(), timeout=self.request_timeout)
             return True
         except Exception as e:
             print(f"Puter init error: {e}")
             return False
-    
+
+    async def achat(self, model, messages, temperature=0):
+        """Chat completion; must run on the client's loop (see submit_chat)."""
+        await self._ensure_session()
+        options = {"model": model, "temperature": temperature}
+        async with self._semaphore:
+            try:
+                return await self.client.ai_chat(messages=messages, options=options)
+            except Exception as e:
+                if getattr(e, "status", None) != 401:
+                    raise
+            # Token expired between refreshes: wait for one shared refresh, then retry once
+            await self._refresh_in_background()
+            return await self.client.ai_chat(messages=messages, options=options)
+
+    def submit_chat(self, model, messages, temperature=0):
+        """Schedule a chat on the client's loop; returns a concurrent.futures.Future."""
+        return self._loop.submit(self.achat(model, messages, temperature))
+
     def chat(self, model, messages, temperature=0):
-        if not self._initialized:
-            if not self.initialize():
-                raise Exception("Puter not initialized")
-        
         try:
-            options = {"model": model, "temperature": temperature}
-            
-            try:
-                loop = asyncio.get_event_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            
-            result = loop.run_until_complete(
-                self.client.ai_chat(messages=messages, options=options)
-            )
-            
-            return result
-                
+            return self._loop.run(self.achat(model, messages, temperature), timeout=self.request_timeout)
         except Exception as e:
             raise Exception(f"Puter AI error: {e}")
 
+    def close(self):
+        async def shutdown():
+            if self._refresh_task:
+                self._refresh_task.cancel()
+            if self.client:
+                await self.client.close()
+        self._loop.run(shutdown())
+        self._loop.stop()
+
 _puter_client = None
 
 def get_puter_client():
@@ -0,0 +1,95 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+
+class RequestBatcher:
+    """
+    Collects requests from many threads into batches for one worker.
+
+    The worker thread blocks for the first request, then keeps collecting
+    until max_batch_size requests are queued or max_wait seconds have
+    passed, and hands the whole batch to run_batch. Each caller's future
+    gets the result at its own position.
+
+    A caller can cancel its future at any time. Cancelled requests still in
+    the queue are dropped without taking a batch slot; futures stay
+    cancellable while their batch runs, so run_batch (given the futures
+    with pass_futures) can stop work for callers that have gone away.
+    """
+    def __init__(self, run_batch, max_batch_size=8, max_wait=0.05, name="request-batcher", pass_futures=False):
+        """
+        Args:
+            run_batch: fn(list of requests) -> list of results, same order
+            max_batch_size: Most requests in one batch
+            max_wait: Seconds to wait for more requests after the first arrives
+            pass_futures: Call run_batch(requests, futures) instead
+        """
+        self.run_batch = run_batch
+        self.pass_futures = pass_futures
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        # Recent batch sizes, for reporting
+        self.batch_sizes = deque(maxlen=200)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, request):
+        """Queue a request; returns a concurrent.futures.Future for its result."""
+        future = Future()
+        self._queue.put((request, future))
+        return future
+
+    def _collect(self):
+        batch = []
+        deadline = None
+        while len(batch) < self.max_batch_size:
+            if deadline is None:
+                item = self._queue.get()
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            # Cancelled while queued: drop it
+            if item[1].cancelled():
+                continue
+            batch.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.max_wait
+        return batch
+
+    @staticmethod
+    def _settle(future, result=None, error=None):
+        # The caller may cancel at any moment, even between a check and this call
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def _run(self):
+        while True:
+            batch = [(request, future) for request, future in self._collect() if not future.cancelled()]
+            if not batch:
+                continue
+            self.batch_sizes.append(len(batch))
+            requests = [request for request, _ in batch]
+            try:
+                if self.pass_futures:
+                    results = self.run_batch(requests, [future for _, future in batch])
+                else:
+                    results = self.run_batch(requests)
+            except Exception as e:
+                for _, future in batch:
+                    self._settle(future, error=e)
+                continue
+            for (_, future), result in zip(batch, results):
+                self._settle(future, result)
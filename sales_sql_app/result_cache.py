@@ -0,0 +1,132 @@
+import io
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+# String literals and quoted identifiers, comments, and everything else
+SQL_TOKEN = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")|(--[^\n]*|/\*.*?\*/)|([^'"\-/]+|[\-/])""", re.DOTALL)
+
+def canonicalize_sql(sql):
+    """
+    Cache key text for a query: comments dropped, whitespace collapsed,
+    lowercased and trailing semicolons removed, except inside quotes.
+    """
+    parts, pending = [], []
+
+    def flush():
+        # Unquoted text between literals, comments replaced by a space
+        parts.append(re.sub(r"\s+", " ", "".join(pending).lower()))
+        pending.clear()
+
+    for quoted, comment, text in SQL_TOKEN.findall(sql):
+        if quoted:
+            flush()
+            parts.append(quoted)
+        else:
+            pending.append(" " if comment else text)
+    flush()
+    return "".join(parts).strip().rstrip("; ").strip()
+
+class ResultCache:
+    """
+    In-memory LRU of query results, keyed by canonical SQL and data version.
+
+    Results are stored as zstd-compressed Parquet bytes. An entry is served
+    only within ttl seconds and only for the data version it was computed
+    on; when the version changes (a write to the source tables) every older
+    entry is dropped. Entries are evicted least recently used first once
+    max_entries or max_bytes is exceeded.
+    """
+    def __init__(self, max_entries=128, max_bytes=64 * 1024 * 1024, ttl=600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _drop(self, key):
+        _, data = self._entries.pop(key)
+        self._bytes -= len(data)
+
+    def _check_version(self, version):
+        if version != self._version:
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get(self, sql, version):
+        """Cached result as a DataFrame, or None."""
+        key = canonicalize_sql(sql)
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            data = entry[1]
+        return pd.read_parquet(io.BytesIO(data))
+
+    def put(self, sql, version, df):
+        """Cache a result; results that can't be written as Parquet are skipped."""
+        buffer = io.BytesIO()
+        try:
+            df.to_parquet(buffer, index=False, compression="zstd")
+        except Exception as e:
+            print(f"Result not cached: {e}")
+            return
+        data = buffer.getvalue()
+        if len(data) > self.max_bytes:
+            return
+
+        key = canonicalize_sql(sql)
+        with self._lock:
+            self._check_version(version)
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, data)
+            self._bytes += len(data)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Entry count, size and hit rate."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+# Global instance
+_result_cache = None
+
+def get_result_cache():
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache(
+            max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "128")),
+            max_bytes=int(os.getenv("RESULT_CACHE_MAX_MB", "64")) * 1024 * 1024,
+            ttl=float(os.getenv("RESULT_CACHE_TTL", "600"))
+        )
+    return _result_cache
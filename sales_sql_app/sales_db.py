@@ -0,0 +1,110 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+DB_PATH = os.getenv("SALES_DB_PATH", "mock_sales.db")
+
+def setup_mock_db(path=DB_PATH):
+    """Create the mock sales tables and seed them if empty."""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+
+    # Create tables
+    cursor.execute('''CREATE TABLE IF NOT EXISTS LEADS (lead_id INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT, email TEXT, phone TEXT, source TEXT, status TEXT, created_at DATETIME)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS SALES_REPS (rep_id INTEGER PRIMARY KEY, name TEXT, region TEXT, quota FLOAT, email TEXT)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS DEALS (deal_id INTEGER PRIMARY KEY, lead_id INTEGER, rep_id INTEGER, amount FLOAT, stage TEXT, close_date DATE, created_at DATETIME, FOREIGN KEY(lead_id) REFERENCES LEADS(lead_id), FOREIGN KEY(rep_id) REFERENCES SALES_REPS(rep_id))''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS REVENUE (revenue_id INTEGER PRIMARY KEY, deal_id INTEGER, amount FLOAT, recognition_date DATE, FOREIGN KEY(deal_id) REFERENCES DEALS(deal_id))''')
+
+    # Insert dummy data if empty
+    cursor.execute("SELECT count(*) FROM SALES_REPS")
+    if cursor.fetchone()[0] == 0:
+        cursor.execute("INSERT INTO SALES_REPS VALUES (1, 'John Doe', 'North', 100000, 'john@example.com')")
+        cursor.execute("INSERT INTO SALES_REPS VALUES (2, 'Jane Smith', 'South', 120000, 'jane@example.com')")
+        cursor.execute("INSERT INTO LEADS VALUES (1, 'Alice', 'Brown', 'alice@test.com', '555-0101', 'Web', 'New', '2023-01-01')")
+        cursor.execute("INSERT INTO DEALS VALUES (1, 1, 1, 5000, 'Closed Won', '2023-01-15', '2023-01-05')")
+        cursor.execute("INSERT INTO REVENUE VALUES (1, 1, 5000, '2023-01-15')")
+        conn.commit()
+
+    conn.close()
+
+_setup_done = set()
+_setup_lock = threading.Lock()
+
+def ensure_database(path=DB_PATH):
+    """Run setup_mock_db once per process for a database file."""
+    with _setup_lock:
+        if path not in _setup_done:
+            setup_mock_db(path)
+            _setup_done.add(path)
+
+class ReadOnlyPool:
+    """
+    Reusable read-only SQLite connections (URI mode=ro) shared across threads.
+
+    Idle connections wait in a queue; at most max_idle are kept, extra ones
+    are closed on release.
+    """
+    def __init__(self, path=DB_PATH, max_idle=4):
+        self.uri = Path(path).resolve().as_uri() + "?mode=ro"
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+
+    def _connect(self):
+        return sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+def cursor_to_dataframe(cursor):
+    """Build a DataFrame straight from an executed cursor's rows and description."""
+    columns = [column[0] for column in cursor.description or ()]
+    return pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+
+# Global instance
+_read_pool = None
+_read_pool_lock = threading.Lock()
+
+def get_read_pool():
+    global _read_pool
+    with _read_pool_lock:
+        if _read_pool is None:
+            ensure_database()
+            _read_pool = ReadOnlyPool()
+        return _read_pool
+
+def query_dataframe(sql, params=()):
+    """Run a read-only query on a pooled connection and return a DataFrame."""
+    with get_read_pool().connection() as conn:
+        cursor = conn.execute(sql, params)
+        try:
+            return cursor_to_dataframe(cursor)
+        finally:
+            cursor.close()
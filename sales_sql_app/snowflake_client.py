@@ -1,79 +1,302 @@
+import copy
+import hashlib
+import os
+import threading
+import time
+
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, StoppingCriteria, StoppingCriteriaList
+
+from request_batcher import RequestBatcher
+
+def cpu_supports_bf16():
+    """True if the CPU has native bfloat16 instructions (AVX512-BF16 or AMX)."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+class CancelledRows(StoppingCriteria):
+    """Ends generation for batch rows whose caller cancelled its future."""
+    def __init__(self, futures):
+        self.futures = futures
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.tensor([future.cancelled() for future in self.futures], dtype=torch.bool, device=input_ids.device)
 
 class SnowflakeClient:
     """
     Client for running Snowflake Arctic Text2SQL models locally.
     """
-    def __init__(self, model_name="Snowflake/Arctic-Text2SQL-R1-7B"):
+    def __init__(self, model_name="Snowflake/Arctic-Text2SQL-R1-7B", quantization=None, device=None,
+                 max_batch_size=None, batch_wait=0.05):
+        """
+        Args:
+            model_name: Hugging Face model id
+            quantization: "int8", "int4" or "none" for CPU inference
+                (default: SNOWFLAKE_QUANTIZATION, else int8 on CPU)
+            device: "cuda" or "cpu" (default: cuda if available)
+            max_batch_size: Most questions per generate() call (default: SNOWFLAKE_MAX_BATCH, else 8)
+            batch_wait: Seconds to wait for more questions before generating
+        """
         self.model_name = model_name
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.quantization = quantization or os.getenv("SNOWFLAKE_QUANTIZATION", "int8" if self.device == "cpu" else "none")
         self.tokenizer = None
         self.model = None
         self._initialized = False
+        self._load_lock = threading.Lock()
+        self._load_thread = None
+        self.load_error = None
+        self.load_seconds = None
 
-    def initialize(self):
-        """Lazy load the model to save resources until needed."""
-        if self._initialized:
-            return True
-            
-        print(f"Loading {self.model_name}... (this may take a while)")
-        try:
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            self.model = AutoModelForCausalLM.from_pretrained(
+        # KV cache of the constant system + schema prefix: {schema hash: (prefix ids, cache)}
+        self._prefix_cache = {}
+        self._prefix_lock = threading.Lock()
+        self.last_stats = None
+
+        self._batcher = RequestBatcher(
+            self._generate_batch,
+            max_batch_size=max_batch_size or int(os.getenv("SNOWFLAKE_MAX_BATCH", "8")),
+            max_wait=batch_wait,
+            name="snowflake-batcher",
+            pass_futures=True
+        )
+
+    def _load_model(self):
+        if self.device == "cuda":
+            return AutoModelForCausalLM.from_pretrained(
                 self.model_name,
                 device_map="auto",
                 torch_dtype=torch.float16
             )
-            self._initialized = True
-            print(f"✓ {self.model_name} loaded successfully!")
+
+        if self.quantization == "int4":
+            # Weight-only int4 through optimum-quanto, which runs on CPU
+            from transformers import QuantoConfig
+            return AutoModelForCausalLM.from_pretrained(
+                self.model_name,
+                quantization_config=QuantoConfig(weights="int4"),
+                torch_dtype=torch.bfloat16 if cpu_supports_bf16() else torch.float32,
+                low_cpu_mem_usage=True
+            )
+
+        if self.quantization == "int8":
+            # Dynamic int8 quantization of the Linear layers needs a float32 model
+            model = AutoModelForCausalLM.from_pretrained(
+                self.model_name, torch_dtype=torch.float32, low_cpu_mem_usage=True
+            )
+            return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+        return AutoModelForCausalLM.from_pretrained(
+            self.model_name,
+            torch_dtype=torch.bfloat16 if cpu_supports_bf16() else torch.float32,
+            low_cpu_mem_usage=True
+        )
+
+    def initialize(self):
+        """Load the model (once); concurrent callers wait for the same load."""
+        if self._initialized:
             return True
-        except Exception as e:
-            print(f"Error loading Snowflake model: {e}")
-            return False
 
-    def generate_sql(self, query: str, schema: str) -> str:
-        """
-        Generate SQL from natural language query using Arctic model.
-        """
-        if not self._initialized:
-            if not self.initialize():
-                raise Exception("Failed to initialize Snowflake model")
+        with self._load_lock:
+            if self._initialized:
+                return True
+
+            print(f"Loading {self.model_name} on {self.device} (quantization: {self.quantization})... (this may take a while)")
+            started = time.perf_counter()
+            try:
+                self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                self.model = self._load_model()
+                self.model.eval()
+                self.load_seconds = time.perf_counter() - started
+                self.load_error = None
+                self._initialized = True
+                print(f"✓ {self.model_name} loaded successfully in {self.load_seconds:.1f}s!")
+                return True
+            except Exception as e:
+                self.load_error = e
+                print(f"Error loading Snowflake model: {e}")
+                return False
+
+    def start_background_load(self):
+        """Begin loading the model in a daemon thread (no-op if loading or loaded)."""
+        if self._initialized or (self._load_thread and self._load_thread.is_alive()):
+            return
+        self._load_thread = threading.Thread(target=self.initialize, name="snowflake-load", daemon=True)
+        self._load_thread.start()
 
-        # Format prompt specifically for Text-to-SQL
-        prompt = f"""<|im_start|>system
+    def status(self):
+        """Load state, load time and the last generation's throughput."""
+        if self._initialized:
+            state = "ready"
+        elif self._load_thread and self._load_thread.is_alive():
+            state = "loading"
+        elif self.load_error:
+            state = "failed"
+        else:
+            state = "not loaded"
+        return {
+            "state": state,
+            "device": self.device,
+            "quantization": self.quantization,
+            "load_seconds": self.load_seconds,
+            "last_generation": self.last_stats,
+            "recent_batch_sizes": list(self._batcher.batch_sizes)[-10:]
+        }
+
+    @staticmethod
+    def build_prefix(schema: str) -> str:
+        """System turn with the schema; identical for every question against the same schema."""
+        return f"""<|im_start|>system
 You are a helpful assistant that writes SQL queries.
 Here is the database schema:
 {schema}
 <|im_end|>
-<|im_start|>user
+"""
+
+    @staticmethod
+    def build_question(query: str) -> str:
+        return f"""<|im_start|>user
 {query}<|im_end|>
 <|im_start|>assistant
 """
-        
-        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
-        
+
+    def _prefix_state(self, schema: str):
+        """
+        Token ids and KV cache for the system + schema prefix, computed once per schema.
+        """
+        key = hashlib.sha256(schema.encode("utf-8")).hexdigest()
+        with self._prefix_lock:
+            if key not in self._prefix_cache:
+                prefix_ids = self.tokenizer(self.build_prefix(schema), return_tensors="pt").input_ids.to(self.model.device)
+                with torch.no_grad():
+                    cache = self.model(prefix_ids, use_cache=True).past_key_values
+                # One schema at a time is the common case; keep memory bounded
+                self._prefix_cache.clear()
+                self._prefix_cache[key] = (prefix_ids, cache)
+            return self._prefix_cache[key]
+
+    @staticmethod
+    def clean_output(text: str) -> str:
+        # Clean up any markdown code blocks
+        return text.replace("```sql", "").replace("```", "").strip()
+
+    def _generate_group(self, schema, queries, futures=None):
+        """
+        One batched generate() for questions sharing a schema; returns their SQL in order.
+
+        Rows whose future (if given) is cancelled stop generating early.
+        """
+        prefix_ids, prefix_cache = self._prefix_state(schema)
+        question_ids = [
+            self.tokenizer(self.build_question(query), add_special_tokens=False).input_ids
+            for query in queries
+        ]
+        pad_id = self.tokenizer.pad_token_id
+        if pad_id is None:
+            pad_id = self.tokenizer.eos_token_id
+
+        # Pad between the cached prefix and each question (masked out) so every row
+        # shares the prefix cache; position ids follow the mask, so each question
+        # still starts right after the prefix.
+        longest = max(len(ids) for ids in question_ids)
+        padded = [[pad_id] * (longest - len(ids)) + ids for ids in question_ids]
+        masks = [[0] * (longest - len(ids)) + [1] * len(ids) for ids in question_ids]
+
+        batch_size = len(queries)
+        device = self.model.device
+        input_ids = torch.cat([prefix_ids.repeat(batch_size, 1), torch.tensor(padded, device=device)], dim=-1)
+        attention_mask = torch.cat([
+            torch.ones_like(prefix_ids).repeat(batch_size, 1),
+            torch.tensor(masks, device=device)
+        ], dim=-1)
+
+        # generate() extends the cache in place, so each batch gets its own copy
+        cache = copy.deepcopy(prefix_cache)
+        if batch_size > 1:
+            cache.batch_repeat_interleave(batch_size)
+
+        # Each sequence stops at its own end-of-turn; finished rows are padded
+        stop_ids = [self.tokenizer.eos_token_id, self.tokenizer.convert_tokens_to_ids("<|im_end|>")]
+
+        stopping_criteria = StoppingCriteriaList([CancelledRows(futures)]) if futures else None
+
+        started = time.perf_counter()
         with torch.no_grad():
             outputs = self.model.generate(
-                **inputs,
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                past_key_values=cache,
                 max_new_tokens=256,
-                temperature=0.0,  # Deterministic for code generation
-                do_sample=False,
-                pad_token_id=self.tokenizer.eos_token_id
+                do_sample=False,  # Deterministic for code generation
+                eos_token_id=stop_ids,
+                pad_token_id=pad_id,
+                stopping_criteria=stopping_criteria
             )
-            
-        generated_text = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        
-        # Extract just the SQL part (after "assistant")
-        # The model output includes the prompt, so we need to parse it
-        if "assistant" in generated_text:
-            sql = generated_text.split("assistant")[-1].strip()
-        else:
-            sql = generated_text.strip()
-            
-        # Clean up any markdown code blocks
-        sql = sql.replace("```sql", "").replace("```", "").strip()
-        
-        return sql
+        seconds = time.perf_counter() - started
+
+        # Only the tokens after the prompt are the answer
+        new_tokens = outputs[:, input_ids.shape[-1]:]
+        generated = int((new_tokens != pad_id).sum())
+        self.last_stats = {
+            "batch_size": batch_size,
+            "cached_prefix_tokens": int(prefix_ids.shape[-1]),
+            "new_tokens": generated,
+            "seconds": round(seconds, 2),
+            "tokens_per_sec": round(generated / seconds, 2) if seconds else None
+        }
+        print(f"Snowflake generation: {self.last_stats}")
+
+        return [
+            self.clean_output(self.tokenizer.decode(row, skip_special_tokens=True))
+            for row in new_tokens
+        ]
+
+    def _generate_batch(self, requests, futures):
+        """Run a batch of (query, schema) requests, one generate() per distinct schema."""
+        by_schema = {}
+        for index, (query, schema) in enumerate(requests):
+            by_schema.setdefault(schema, []).append((index, query))
+
+        results = [None] * len(requests)
+        for schema, items in by_schema.items():
+            # Callers that cancelled while earlier groups ran are skipped
+            items = [(index, query) for index, query in items if not futures[index].cancelled()]
+            if not items:
+                continue
+            outputs = self._generate_group(
+                schema, [query for _, query in items], [futures[index] for index, _ in items]
+            )
+            for (index, _), sql in zip(items, outputs):
+                results[index] = sql
+        return results
+
+    def submit_sql(self, query: str, schema: str):
+        """
+        Queue a question for the next batch; the model must be loaded (see initialize).
+
+        Returns a concurrent.futures.Future for the SQL. Cancelling it drops
+        the question if it is still queued, or stops its row mid-generation.
+        """
+        if not self._initialized:
+            raise RuntimeError("Snowflake model is not loaded")
+        return self._batcher.submit((query, schema))
+
+    def generate_sql(self, query: str, schema: str) -> str:
+        """
+        Generate SQL from natural language query using Arctic model.
+
+        Questions arriving from other threads within batch_wait seconds are
+        generated together in one batch; only this question's SQL is returned.
+        """
+        if not self._initialized:
+            if not self.initialize():
+                raise Exception("Failed to initialize Snowflake model")
+
+        return self.submit_sql(query, schema).result()
 
 # Global instance
 _snowflake_client = None
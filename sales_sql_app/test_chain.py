@@ -0,0 +1,204 @@
+"""
+Test the per-process caches in chain.py (fake embeddings and LLMs, no Ollama or Gemini needed)
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+try:
+    import chain
+    from langchain_core.embeddings import Embeddings
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from llm_router import SQLRouter
+    from request_batcher import RequestBatcher
+except ImportError:
+    chain = None
+    Embeddings = object
+
+class CountingEmbeddings(Embeddings):
+    """Deterministic vectors from a hash of the text; records every document embedded."""
+
+    def __init__(self):
+        self.embedded = []
+
+    @staticmethod
+    def _vector(text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [b / 255.0 for b in digest[:8]]
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+EXAMPLES = [
+    {"question": "List all sales reps", "sql": "SELECT * FROM SALES_REPS"},
+    {"question": "Total revenue", "sql": "SELECT SUM(amount) FROM REVENUE"},
+    {"question": "Open deals", "sql": "SELECT * FROM DEALS WHERE stage != 'Closed'"},
+]
+
+@unittest.skipIf(chain is None, "langchain / faiss are not installed")
+class TestVectorStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.embeddings = CountingEmbeddings()
+        self.examples = list(EXAMPLES)
+        for patcher in (
+            mock.patch.object(chain, "INDEX_PATH", os.path.join(self.tmpdir.name, "index")),
+            mock.patch.object(chain, "get_embeddings", lambda: self.embeddings),
+            mock.patch.object(chain, "current_few_shot_examples", lambda: self.examples),
+            mock.patch.object(chain, "_vector_store", None),
+            mock.patch.object(chain, "_vector_store_hash", None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def stored_questions(self, store):
+        return sorted(doc.page_content for doc in store.docstore._dict.values())
+
+    def test_store_is_built_once(self):
+        store = chain.get_vector_store()
+        self.assertIs(chain.get_vector_store(), store)
+        self.assertEqual(sorted(self.embeddings.embedded), sorted(ex["question"] for ex in EXAMPLES))
+
+        # Another process loads the saved index without embedding anything
+        chain._vector_store = None
+        self.embeddings.embedded.clear()
+        self.assertEqual(self.stored_questions(chain.get_vector_store()), sorted(ex["question"] for ex in EXAMPLES))
+        self.assertEqual(self.embeddings.embedded, [])
+
+    def test_changed_examples_embed_only_the_new_ones(self):
+        first = chain.get_vector_store()
+        self.embeddings.embedded.clear()
+
+        added = {"question": "Leads by source", "sql": "SELECT source, COUNT(*) FROM LEADS GROUP BY source"}
+        self.examples = self.examples[1:] + [added]
+        store = chain.get_vector_store()
+
+        self.assertIsNot(store, first)
+        self.assertEqual(self.embeddings.embedded, [added["question"]])
+        self.assertEqual(self.stored_questions(store), sorted(ex["question"] for ex in self.examples))
+        self.assertEqual(chain._vector_store_hash, chain.examples_hash(self.examples))
+        # The saved index was updated too
+        self.assertEqual(self.stored_questions(chain.setup_vector_store(self.examples)), self.stored_questions(store))
+
+    def test_failed_rebuild_keeps_the_previous_store(self):
+        store = chain.get_vector_store()
+        self.examples = self.examples + [{"question": "Quota", "sql": "SELECT quota FROM SALES_REPS"}]
+        with mock.patch.object(chain, "setup_vector_store", return_value=None):
+            self.assertIs(chain.get_vector_store(), store)
+        self.assertIsNot(chain.get_vector_store(), store)
+
+@unittest.skipIf(chain is None, "langchain / faiss are not installed")
+class TestModelCaches(unittest.TestCase):
+
+    def setUp(self):
+        def fake_llm(**kwargs):
+            return FakeListChatModel(responses=["```sql\nSELECT 1\n```"])
+
+        for patcher in (
+            mock.patch.dict(chain._llms, clear=True),
+            mock.patch.dict(chain._chains, clear=True),
+            mock.patch.object(chain, "ChatGoogleGenerativeAI", side_effect=fake_llm),
+            mock.patch.object(chain, "ChatOllama", side_effect=fake_llm),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_llms_and_chains_are_reused_per_model(self):
+        pro = chain.get_llm("gemini-1.5-pro")
+        self.assertIs(chain.get_llm("gemini-1.5-pro"), pro)
+        self.assertIsNot(chain.get_llm("gemini-3-pro-preview"), pro)
+        # Unknown names share the default Gemini model
+        self.assertIs(chain.get_llm("mystery-model"), chain.get_llm("gemini-3-pro-preview"))
+        self.assertIs(chain.get_llm("ollama-arctic-lite"), chain.get_llm("ollama-other"))
+        self.assertEqual(chain.ChatGoogleGenerativeAI.call_count, 2)
+        self.assertEqual(chain.ChatOllama.call_count, 1)
+
+        sql_chain = chain.get_sql_chain("gemini-1.5-pro")
+        self.assertIs(chain.get_sql_chain("gemini-1.5-pro"), sql_chain)
+        self.assertIsNot(chain.get_sql_chain("ollama-arctic-lite"), sql_chain)
+        self.assertEqual(sql_chain.invoke({"schema": "", "examples": "", "query": "one"}), "SELECT 1")
+
+@unittest.skipIf(chain is None, "langchain / faiss are not installed")
+class TestSchemaContext(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "schema_context.md")
+        for patcher in (
+            mock.patch.object(chain, "__file__", os.path.join(self.tmpdir.name, "chain.py")),
+            mock.patch.dict(chain._schema_cache, {"mtime": None, "text": None}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write(self, text, mtime_ns):
+        with open(self.path, "w") as f:
+            f.write(text)
+        os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def test_reread_only_when_mtime_changes(self):
+        now = time.time_ns()
+        self.write("# Schema v1", now)
+        self.assertEqual(chain.get_schema_context(), "# Schema v1")
+
+        # Same mtime: the cached text is served
+        self.write("# Schema v2", now)
+        self.assertEqual(chain.get_schema_context(), "# Schema v1")
+
+        os.utime(self.path, ns=(now + 1_000_000, now + 1_000_000))
+        self.assertEqual(chain.get_schema_context(), "# Schema v2")
+
+class SlowSnowflakeClient:
+    """Batched like SnowflakeClient; its generation runs until every caller in the batch cancels."""
+
+    def __init__(self):
+        self.stopped = threading.Event()
+        self._batcher = RequestBatcher(self._generate_batch, max_wait=0.01, pass_futures=True)
+
+    def initialize(self):
+        return True
+
+    def submit_sql(self, query, schema):
+        return self._batcher.submit((query, schema))
+
+    def _generate_batch(self, requests, futures):
+        while not all(future.cancelled() for future in futures):
+            time.sleep(0.01)
+        self.stopped.set()
+        return [None] * len(requests)
+
+@unittest.skipIf(chain is None, "langchain / faiss are not installed")
+class TestSnowflakeBackend(unittest.TestCase):
+
+    def test_losing_hedged_attempt_stops_generating(self):
+        client = SlowSnowflakeClient()
+
+        async def gemini(model_name, query, schema, examples):
+            return "SELECT 2"
+
+        router = SQLRouter(
+            {"snowflake": chain._snowflake_backend, "gemini": gemini},
+            backend_for=chain.backend_for
+        )
+        for _ in range(5):
+            router.stats["snowflake"].record("ok", 0.05)
+
+        with mock.patch.object(chain, "get_snowflake_client", return_value=client):
+            self.assertEqual(router.generate("snowflake-arctic-text2sql", "q", "schema", "examples"), "SELECT 2")
+        self.assertEqual(router.latency_stats()["snowflake"]["counts"]["cancelled"], 1)
+        # The batched generation itself ended, not just the await on it
+        self.assertTrue(client.stopped.wait(5))
+
+if __name__ == "__main__":
+    unittest.main()
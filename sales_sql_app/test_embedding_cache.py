@@ -0,0 +1,66 @@
+"""
+Test the query embedding cache (no Ollama needed)
+"""
+import os
+import tempfile
+import unittest
+from embedding_cache import QueryEmbeddingCache
+
+class CountingEmbeddings:
+    model = "fake-embed"
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [float(len(text)), 1.0, 0.5]
+
+class TestQueryEmbeddingCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "embeddings.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_memory_and_disk_hits(self):
+        embeddings = CountingEmbeddings()
+        cache = QueryEmbeddingCache(self.path)
+        first = cache.embed(embeddings, "Total revenue by region?")
+        # Normalization makes these the same question
+        self.assertEqual(cache.embed(embeddings, "  total revenue BY region "), first)
+        self.assertEqual(embeddings.calls, 1)
+
+        # A new process starts with an empty LRU but finds the vector on disk
+        reopened = QueryEmbeddingCache(self.path)
+        self.assertEqual(reopened.embed(embeddings, "total revenue by region"), first)
+        self.assertEqual(embeddings.calls, 1)
+        self.assertEqual(reopened.stats()["hits"], {"memory": 0, "disk": 1})
+
+        stats = cache.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_lru_bound(self):
+        cache = QueryEmbeddingCache(self.path, max_entries=2)
+        embeddings = CountingEmbeddings()
+        for question in ["a", "b", "c"]:
+            cache.embed(embeddings, question)
+        self.assertEqual(cache.stats()["entries_in_memory"], 2)
+
+    def test_disk_rows_are_capped(self):
+        cache = QueryEmbeddingCache(self.path, max_entries=1, max_rows=2)
+        embeddings = CountingEmbeddings()
+        for question in ["a", "b", "a", "c"]:
+            cache.put(embeddings.model, question, embeddings.embed_query(question))
+
+        # "b" is now the oldest write
+        reopened = QueryEmbeddingCache(self.path)
+        self.assertIsNone(reopened.get(embeddings.model, "b"))
+        self.assertIsNotNone(reopened.get(embeddings.model, "a"))
+        self.assertIsNotNone(reopened.get(embeddings.model, "c"))
+
+if __name__ == "__main__":
+    unittest.main()
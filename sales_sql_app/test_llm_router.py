@@ -0,0 +1,58 @@
+"""
+Test LLM routing: deadlines, fallbacks and hedging (no real backends needed)
+"""
+import asyncio
+import concurrent.futures
+import unittest
+from llm_router import SQLRouter
+
+def backend(sql=None, delay=0.0, error=None):
+    async def call(model_name, query, schema, examples):
+        await examples
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return sql
+    return call
+
+def make_router(primary, fallback, **options):
+    return SQLRouter(
+        {"snowflake": primary, "gemini": fallback},
+        backend_for=lambda name: "snowflake" if "snowflake" in name else "gemini",
+        fallbacks={"snowflake": "gemini-1.5-pro"},
+        **options
+    )
+
+class TestSQLRouter(unittest.TestCase):
+
+    def test_primary_answer(self):
+        router = make_router(backend("SELECT 1"), backend("SELECT 2"))
+        self.assertEqual(router.generate("snowflake", "q", "schema", "examples"), "SELECT 1")
+
+    def test_failure_falls_back(self):
+        router = make_router(backend(error=RuntimeError("model not loaded")), backend("SELECT 2"), hedge=False)
+        self.assertEqual(router.generate("snowflake", "q", "schema", "examples"), "SELECT 2")
+        self.assertEqual(router.latency_stats()["snowflake"]["counts"]["error"], 1)
+
+    def test_deadline(self):
+        router = make_router(backend("SELECT 1", delay=5), backend("SELECT 2"), deadlines={"snowflake": 0.05})
+        self.assertEqual(router.generate("snowflake", "q", "schema", "examples"), "SELECT 2")
+        self.assertEqual(router.latency_stats()["snowflake"]["counts"]["timeout"], 1)
+
+    def test_hedge_after_p95(self):
+        router = make_router(backend("SELECT 1", delay=1.0), backend("SELECT 2", delay=0.01))
+        for _ in range(5):
+            router.stats["snowflake"].record("ok", 0.05)
+        examples = concurrent.futures.Future()
+        examples.set_result("examples")
+        self.assertEqual(router.generate("snowflake", "q", "schema", examples), "SELECT 2")
+        # The slow primary was cancelled rather than waited for
+        self.assertEqual(router.latency_stats()["snowflake"]["counts"]["cancelled"], 1)
+
+    def test_errors_surface_without_fallback(self):
+        router = make_router(backend("SELECT 1"), backend(error=ValueError("bad key")))
+        with self.assertRaises(ValueError):
+            router.generate("gemini-1.5-pro", "q", "schema", "examples")
+
+if __name__ == "__main__":
+    unittest.main()
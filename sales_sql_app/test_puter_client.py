@@ -0,0 +1,98 @@
+"""
+Test PuterClient against a local fake Puter endpoint (no Puter account needed)
+"""
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import putergenai  # noqa: F401
+except ImportError:
+    putergenai = None
+
+from puter_client import PuterClient
+
+class FakePuter(BaseHTTPRequestHandler):
+    """Login hands out numbered tokens; only the latest one is accepted."""
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        state = self.state
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path == "/login":
+            with state["lock"]:
+                state["logins"] += 1
+                state["token"] = f"token-{state['logins']}"
+            return self._reply(200, {"proceed": True, "token": state["token"]})
+
+        if self.path == "/drivers/call":
+            if self.headers.get("Authorization") != f"Bearer {state['token']}":
+                return self._reply(401, {"success": False})
+            with state["lock"]:
+                state["in_flight"] += 1
+                state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+            time.sleep(0.05)
+            with state["lock"]:
+                state["in_flight"] -= 1
+            question = body["args"]["messages"][-1]["content"]
+            return self._reply(200, {"success": True, "result": {"message": {"content": f"SELECT '{question}'"}}})
+
+        self._reply(404, {})
+
+@unittest.skipIf(putergenai is None, "putergenai is not installed")
+class TestPuterClient(unittest.TestCase):
+
+    def setUp(self):
+        FakePuter.state = {"lock": threading.Lock(), "logins": 0, "token": None, "in_flight": 0, "max_in_flight": 0}
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakePuter)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{self.server.server_port}"
+        self.client = PuterClient(
+            username="user", password="secret", api_base=base, login_url=f"{base}/login",
+            max_concurrency=2, token_refresh_interval=None
+        )
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_concurrent_chats_share_one_session(self):
+        questions = [f"q{i}" for i in range(6)]
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            results = list(pool.map(
+                lambda q: self.client.chat("claude-sonnet-4", [{"role": "user", "content": q}]), questions
+            ))
+
+        for question, result in zip(questions, results):
+            self.assertEqual(result["response"]["result"]["message"]["content"], f"SELECT '{question}'")
+        self.assertEqual(FakePuter.state["logins"], 1)
+        self.assertLessEqual(FakePuter.state["max_in_flight"], 2)
+
+    def test_expired_token_is_refreshed_once(self):
+        self.client.chat("claude-sonnet-4", [{"role": "user", "content": "warm up"}])
+        # Invalidate the client's token on the server side
+        FakePuter.state["token"] = "rotated"
+
+        result = self.client.chat("claude-sonnet-4", [{"role": "user", "content": "after expiry"}])
+        self.assertEqual(result["response"]["result"]["message"]["content"], "SELECT 'after expiry'")
+        self.assertEqual(FakePuter.state["logins"], 2)
+
+if __name__ == "__main__":
+    unittest.main()
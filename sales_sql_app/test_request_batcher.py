@@ -0,0 +1,89 @@
+"""
+Test request batching (no model needed)
+"""
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from request_batcher import RequestBatcher
+
+class TestRequestBatcher(unittest.TestCase):
+
+    def test_concurrent_requests_share_a_batch(self):
+        batches = []
+
+        def run_batch(requests):
+            batches.append(list(requests))
+            return [f"SELECT '{r}'" for r in requests]
+
+        batcher = RequestBatcher(run_batch, max_batch_size=4, max_wait=0.5)
+        questions = [f"q{i}" for i in range(4)]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda q: batcher.submit(q).result(timeout=5), questions))
+
+        # Each caller gets only its own answer
+        self.assertEqual(results, [f"SELECT '{q}'" for q in questions])
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(sorted(batches[0]), questions)
+
+    def test_batches_are_capped(self):
+        batcher = RequestBatcher(lambda requests: list(requests), max_batch_size=2, max_wait=0.2)
+        futures = [batcher.submit(i) for i in range(5)]
+        self.assertEqual([f.result(timeout=5) for f in futures], list(range(5)))
+        self.assertTrue(all(size <= 2 for size in batcher.batch_sizes))
+
+    def test_errors_reach_every_caller(self):
+        def run_batch(requests):
+            raise RuntimeError("out of memory")
+
+        batcher = RequestBatcher(run_batch, max_wait=0.1)
+        futures = [batcher.submit(i) for i in range(3)]
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=5)
+
+    def test_cancelled_requests_are_dropped_from_the_queue(self):
+        started, release = threading.Event(), threading.Event()
+        batches = []
+
+        def run_batch(requests):
+            batches.append(list(requests))
+            started.set()
+            release.wait(5)
+            return list(requests)
+
+        batcher = RequestBatcher(run_batch, max_batch_size=2, max_wait=0.05)
+        first = batcher.submit("first")
+        started.wait(5)
+        # Queued behind the running batch, then abandoned by its caller
+        gone = batcher.submit("gone")
+        kept = batcher.submit("kept")
+        self.assertTrue(gone.cancel())
+        release.set()
+
+        self.assertEqual(first.result(timeout=5), "first")
+        self.assertEqual(kept.result(timeout=5), "kept")
+        self.assertEqual(batches, [["first"], ["kept"]])
+
+    def test_running_requests_can_be_cancelled(self):
+        started, stopped = threading.Event(), threading.Event()
+
+        def run_batch(requests, futures):
+            if requests == ["slow"]:
+                started.set()
+                # Work for a caller that went away stops early
+                while not futures[0].cancelled():
+                    time.sleep(0.01)
+                stopped.set()
+            return list(requests)
+
+        batcher = RequestBatcher(run_batch, max_wait=0.01, pass_futures=True)
+        future = batcher.submit("slow")
+        started.wait(5)
+        self.assertTrue(future.cancel())
+        self.assertTrue(stopped.wait(5))
+        # The worker carries on with the next batch
+        self.assertEqual(batcher.submit("next").result(timeout=5), "next")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Test the query result cache
+"""
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+import pandas as pd
+from result_cache import ResultCache, canonicalize_sql
+from warehouse import SQLiteBackend
+
+class TestCanonicalizeSQL(unittest.TestCase):
+
+    def test_formatting_differences_share_a_key(self):
+        a = "SELECT region, SUM(amount)\n  FROM DEALS -- by region\n GROUP BY region;"
+        b = "select region, sum(amount) from deals /* totals */ group by region"
+        self.assertEqual(canonicalize_sql(a), canonicalize_sql(b))
+
+    def test_literals_are_kept(self):
+        self.assertNotEqual(
+            canonicalize_sql("SELECT * FROM SALES_REPS WHERE region = 'North'"),
+            canonicalize_sql("SELECT * FROM SALES_REPS WHERE region = 'NORTH'")
+        )
+        self.assertIn("'a  -- b'", canonicalize_sql("SELECT 'a  -- b'"))
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({"region": ["North", "South"], "total_revenue": [5000.0, 0.0]})
+
+    def test_hit_returns_same_frame(self):
+        cache = ResultCache()
+        cache.put("SELECT 1", "v1", self.df)
+        pd.testing.assert_frame_equal(cache.get("select 1;", "v1"), self.df)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_new_data_version_invalidates(self):
+        cache = ResultCache()
+        cache.put("SELECT 1", "v1", self.df)
+        self.assertIsNone(cache.get("SELECT 1", "v2"))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_ttl(self):
+        cache = ResultCache(ttl=0.05)
+        cache.put("SELECT 1", "v1", self.df)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("SELECT 1", "v1"))
+
+    def test_lru_eviction(self):
+        cache = ResultCache(max_entries=2)
+        for sql in ("SELECT 1", "SELECT 2"):
+            cache.put(sql, "v1", self.df)
+        cache.get("SELECT 1", "v1")
+        cache.put("SELECT 3", "v1", self.df)
+        self.assertIsNotNone(cache.get("SELECT 1", "v1"))
+        self.assertIsNone(cache.get("SELECT 2", "v1"))
+
+    def test_size_bound(self):
+        cache = ResultCache()
+        cache.put("SELECT 1", "v1", self.df)
+        size = cache.stats()["bytes"]
+        cache = ResultCache(max_bytes=size)
+        cache.put("SELECT 1", "v1", self.df)
+        cache.put("SELECT 2", "v1", self.df)
+        self.assertEqual(cache.stats()["entries"], 1)
+
+    def test_writes_change_sqlite_data_version(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "sales.db")
+            backend = SQLiteBackend(path).connect()
+            before = backend.data_version()
+            time.sleep(0.01)
+            conn = sqlite3.connect(path)
+            conn.execute("UPDATE REVENUE SET amount = amount + 1")
+            conn.commit()
+            conn.close()
+            self.assertNotEqual(backend.data_version(), before)
+            backend.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+"""
+Test the pooled read-only database access layer (uses a temporary SQLite file)
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+import sales_db
+
+class TestSalesDB(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "sales.db")
+        sales_db.ensure_database(self.path)
+        self.pool = sales_db.ReadOnlyPool(self.path, max_idle=2)
+
+    def tearDown(self):
+        self.pool.close()
+        self.tmpdir.cleanup()
+
+    def test_setup_runs_once_per_process(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("DELETE FROM SALES_REPS")
+        conn.commit()
+        conn.close()
+        # Already set up: the seed data is not inserted again
+        sales_db.ensure_database(self.path)
+        with self.pool.connection() as conn:
+            self.assertEqual(conn.execute("SELECT count(*) FROM SALES_REPS").fetchone()[0], 0)
+
+    def test_connections_are_read_only_and_reused(self):
+        with self.pool.connection() as conn:
+            with self.assertRaises(sqlite3.OperationalError):
+                conn.execute("DELETE FROM LEADS")
+            first = conn
+        with self.pool.connection() as conn:
+            self.assertIs(conn, first)
+
+    def test_cursor_to_dataframe(self):
+        with self.pool.connection() as conn:
+            df = sales_db.cursor_to_dataframe(conn.execute("SELECT rep_id, name, quota FROM SALES_REPS ORDER BY rep_id"))
+        self.assertEqual(list(df.columns), ["rep_id", "name", "quota"])
+        self.assertEqual(df["name"].tolist(), ["John Doe", "Jane Smith"])
+        self.assertEqual(df["quota"].sum(), 220000)
+
+        with self.pool.connection() as conn:
+            empty = sales_db.cursor_to_dataframe(conn.execute("SELECT name FROM SALES_REPS WHERE 0"))
+        self.assertEqual(list(empty.columns), ["name"])
+        self.assertTrue(empty.empty)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+Test batched Snowflake generation with a tiny random model (no download needed)
+"""
+import unittest
+from concurrent.futures import Future
+
+try:
+    import torch
+    from transformers import LlamaConfig, LlamaForCausalLM
+    from snowflake_client import SnowflakeClient
+except ImportError:
+    torch = None
+
+SPECIAL_TOKENS = ["<pad>", "<eos>", "<|im_start|>", "<|im_end|>"]
+
+class ByteTokenizer:
+    """One token per byte after the special tokens; enough of the tokenizer API for SnowflakeClient."""
+    pad_token_id = 0
+    eos_token_id = 1
+
+    class Encoding:
+        def __init__(self, ids, return_tensors):
+            self.input_ids = torch.tensor([ids]) if return_tensors == "pt" else ids
+
+    def encode(self, text):
+        ids = []
+        while text:
+            special = next((t for t in SPECIAL_TOKENS if text.startswith(t)), None)
+            if special:
+                ids.append(SPECIAL_TOKENS.index(special))
+                text = text[len(special):]
+            else:
+                ids.extend(len(SPECIAL_TOKENS) + b for b in text[0].encode("utf-8"))
+                text = text[1:]
+        return ids
+
+    def __call__(self, text, return_tensors=None, add_special_tokens=True):
+        return self.Encoding(self.encode(text), return_tensors)
+
+    def convert_tokens_to_ids(self, token):
+        return SPECIAL_TOKENS.index(token)
+
+    def decode(self, ids, skip_special_tokens=False):
+        data = bytes(int(i) - len(SPECIAL_TOKENS) for i in ids if int(i) >= len(SPECIAL_TOKENS))
+        return data.decode("utf-8", errors="replace")
+
+@unittest.skipIf(torch is None, "torch and transformers are not installed")
+class TestBatchedGeneration(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+        config = LlamaConfig(
+            vocab_size=len(SPECIAL_TOKENS) + 256, hidden_size=32, intermediate_size=64,
+            num_hidden_layers=2, num_attention_heads=4, num_key_value_heads=2,
+            max_position_embeddings=1024, pad_token_id=0, eos_token_id=1
+        )
+        self.client = SnowflakeClient(device="cpu", quantization="none", max_batch_size=4)
+        self.client.tokenizer = ByteTokenizer()
+        # float64 so padding can't flip a greedy choice through rounding
+        self.client.model = LlamaForCausalLM(config).double().eval()
+        self.client._initialized = True
+
+    def generate_alone(self, query, schema):
+        """Reference: the full prompt, one question, no prefix cache."""
+        prompt = self.client.build_prefix(schema) + self.client.build_question(query)
+        input_ids = self.client.tokenizer(prompt, return_tensors="pt").input_ids
+        stop_ids = [1, self.client.tokenizer.convert_tokens_to_ids("<|im_end|>")]
+        with torch.no_grad():
+            outputs = self.client.model.generate(
+                input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                max_new_tokens=256, do_sample=False, eos_token_id=stop_ids, pad_token_id=0
+            )
+        return self.client.clean_output(self.client.tokenizer.decode(outputs[0, input_ids.shape[-1]:]))
+
+    def test_batch_with_prefix_cache_matches_single_runs(self):
+        schema = "SALES_REPS(rep_id, name, region)"
+        # Different lengths, so the shorter questions are padded
+        queries = ["Reps in the North?", "How many reps are there per region?", "All reps"]
+
+        batched = self.client._generate_group(schema, queries)
+
+        self.assertEqual(self.client.last_stats["batch_size"], 3)
+        self.assertEqual(batched, [self.generate_alone(query, schema) for query in queries])
+        # The cached prefix is reused as is by the next batch
+        self.assertEqual(self.client._generate_group(schema, queries[:1]), batched[:1])
+
+    def test_cancelled_rows_stop_generating(self):
+        schema = "SALES_REPS(rep_id, name, region)"
+        queries = ["Reps in the North?", "All reps"]
+        futures = [Future(), Future()]
+        futures[0].cancel()
+
+        outputs = self.client._generate_group(schema, queries, futures)
+
+        self.assertEqual(outputs[1], self.generate_alone(queries[1], schema))
+        # The cancelled row stopped after its first token
+        self.assertLessEqual(len(outputs[0].encode("utf-8")), 1)
+        self.assertGreater(len(outputs[1]), 1)
+
+    def test_cancelled_request_is_not_generated(self):
+        started = []
+
+        def generate_group(schema, queries, futures=None):
+            started.append(queries)
+            return ["SELECT 1"] * len(queries)
+
+        self.client._generate_group = generate_group
+        future = self.client.submit_sql("gone", "schema")
+        future.cancel()
+        self.assertEqual(self.client.generate_sql("kept", "schema"), "SELECT 1")
+        self.assertEqual(started, [["kept"]])
+
+if __name__ == "__main__":
+    unittest.main()
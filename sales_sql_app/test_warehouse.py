@@ -0,0 +1,109 @@
+"""
+Test the warehouse backends (SQLite on a temporary file; DuckDB if installed)
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+import pandas as pd
+from warehouse import SQLiteBackend, DuckDBBackend, batches_to_dataframe, duckdb
+
+REVENUE_BY_REGION = """
+    SELECT s.region, SUM(r.amount) AS total_revenue
+    FROM REVENUE r JOIN DEALS d ON r.deal_id = d.deal_id JOIN SALES_REPS s ON d.rep_id = s.rep_id
+    GROUP BY s.region ORDER BY s.region
+"""
+
+class TestSQLiteBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.backend = SQLiteBackend(os.path.join(self.tmpdir.name, "sales.db")).connect()
+
+    def tearDown(self):
+        self.backend.close()
+        self.tmpdir.cleanup()
+
+    def test_execute(self):
+        df = self.backend.execute(REVENUE_BY_REGION)
+        self.assertEqual(df.to_dict("records"), [{"region": "North", "total_revenue": 5000.0}])
+
+    def test_stream_batches(self):
+        batches = list(self.backend.stream_batches("SELECT rep_id, name FROM SALES_REPS ORDER BY rep_id", batch_size=1))
+        self.assertEqual([batch.num_rows for batch in batches], [1, 1])
+        df = batches_to_dataframe(batches)
+        self.assertEqual(df["name"].tolist(), ["John Doe", "Jane Smith"])
+
+    def test_empty_result_keeps_columns(self):
+        batches = list(self.backend.stream_batches("SELECT name, quota FROM SALES_REPS WHERE 0"))
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(batches[0].schema.names, ["name", "quota"])
+
+    def test_cancel(self):
+        slow = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT count(*) FROM n"
+        errors = []
+
+        def run():
+            try:
+                self.backend.execute(slow)
+            except sqlite3.OperationalError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        time.sleep(0.2)
+        self.backend.cancel()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertIn("interrupted", str(errors[0]))
+
+@unittest.skipIf(duckdb is None, "duckdb is not installed")
+class TestDuckDBBackend(unittest.TestCase):
+
+    def test_extracts_are_tables(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            pd.DataFrame({"rep_id": [1, 2], "region": ["North", "South"]}).to_csv(os.path.join(tmpdir, "sales_reps.csv"), index=False)
+            pd.DataFrame({"deal_id": [1, 2], "rep_id": [1, 2]}).to_parquet(os.path.join(tmpdir, "DEALS.parquet"))
+            pd.DataFrame({"deal_id": [1, 2, 2], "amount": [5.0, 1.0, 2.0]}).to_parquet(os.path.join(tmpdir, "REVENUE.parquet"))
+
+            backend = DuckDBBackend(extracts_dir=tmpdir).connect()
+            try:
+                df = backend.execute(REVENUE_BY_REGION)
+                self.assertEqual(df["total_revenue"].tolist(), [5.0, 3.0])
+                streamed = batches_to_dataframe(backend.stream_batches(REVENUE_BY_REGION, batch_size=1))
+                self.assertEqual(streamed["region"].tolist(), ["North", "South"])
+            finally:
+                backend.close()
+
+    def test_queries_cannot_reach_other_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            extracts = os.path.join(tmpdir, "extracts")
+            os.mkdir(extracts)
+            pd.DataFrame({"rep_id": [1]}).to_parquet(os.path.join(extracts, "SALES_REPS.parquet"))
+            outside = os.path.join(tmpdir, "secret.csv")
+            pd.DataFrame({"x": [1]}).to_csv(outside, index=False)
+            database = os.path.join(tmpdir, "sales.duckdb")
+            conn = duckdb.connect(database)
+            conn.execute("CREATE TABLE DEALS AS SELECT 1 AS deal_id")
+            conn.close()
+
+            backend = DuckDBBackend(database=database, extracts_dir=extracts).connect()
+            try:
+                self.assertEqual(backend.execute("SELECT count(*) AS n FROM DEALS JOIN SALES_REPS ON true")["n"][0], 1)
+                for sql in (
+                    f"SELECT * FROM read_csv_auto('{outside}')",
+                    f"COPY (SELECT 1) TO '{os.path.join(tmpdir, 'out.csv')}'",
+                    f"ATTACH '{os.path.join(tmpdir, 'other.duckdb')}' AS other",
+                    "DROP TABLE warehouse.DEALS",
+                    "SET enable_external_access = true",
+                ):
+                    with self.assertRaises(duckdb.Error, msg=sql):
+                        backend.execute(sql)
+            finally:
+                backend.close()
+            self.assertFalse(os.path.exists(os.path.join(tmpdir, "out.csv")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,287 @@
+import os
+import threading
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+from sales_db import DB_PATH, ReadOnlyPool, cursor_to_dataframe, ensure_database
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+def file_version(paths):
+    """(path, mtime, size) for each existing file: changes whenever one of them is written."""
+    version = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        version.append((str(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+def rows_to_record_batch(rows, columns):
+    """Arrow record batch from DB-API rows; columns Arrow can't type uniformly become strings."""
+    arrays = []
+    for values in zip(*rows) if rows else [()] * len(columns):
+        try:
+            arrays.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array([None if v is None else str(v) for v in values]))
+    return pa.RecordBatch.from_arrays(arrays, names=columns)
+
+class WarehouseBackend:
+    """
+    Where generated SQL runs.
+
+    execute() returns the whole result as a DataFrame; stream_batches()
+    yields Arrow record batches as rows arrive so callers can show the
+    first rows early. cancel() interrupts queries running on this backend.
+    data_version() changes whenever the source data does.
+    """
+    name = None
+
+    def connect(self):
+        raise NotImplementedError
+
+    def execute(self, sql):
+        raise NotImplementedError
+
+    def stream_batches(self, sql, batch_size=1000):
+        raise NotImplementedError
+
+    def cancel(self):
+        raise NotImplementedError
+
+    def data_version(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class SQLiteBackend(WarehouseBackend):
+    """The mock sales SQLite file, through pooled read-only connections."""
+    name = "sqlite"
+
+    def __init__(self, path=DB_PATH, max_idle=4):
+        self.path = path
+        self.max_idle = max_idle
+        self.pool = None
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def connect(self):
+        with self._lock:
+            if self.pool is None:
+                ensure_database(self.path)
+                self.pool = ReadOnlyPool(self.path, max_idle=self.max_idle)
+        return self
+
+    def _acquire(self):
+        conn = self.connect().pool.acquire()
+        with self._lock:
+            self._active.add(conn)
+        return conn
+
+    def _release(self, conn):
+        with self._lock:
+            self._active.discard(conn)
+        self.pool.release(conn)
+
+    def execute(self, sql):
+        conn = self._acquire()
+        try:
+            cursor = conn.execute(sql)
+            try:
+                return cursor_to_dataframe(cursor)
+            finally:
+                cursor.close()
+        finally:
+            self._release(conn)
+
+    def stream_batches(self, sql, batch_size=1000):
+        conn = self._acquire()
+        try:
+            cursor = conn.execute(sql)
+            try:
+                columns = [column[0] for column in cursor.description or ()]
+                rows = cursor.fetchmany(batch_size)
+                yield rows_to_record_batch(rows, columns)
+                while len(rows) == batch_size:
+                    rows = cursor.fetchmany(batch_size)
+                    if rows:
+                        yield rows_to_record_batch(rows, columns)
+            finally:
+                cursor.close()
+        finally:
+            self._release(conn)
+
+    def cancel(self):
+        with self._lock:
+            for conn in self._active:
+                conn.interrupt()
+
+    def data_version(self):
+        # Committed writes land in the -wal file until a checkpoint
+        return file_version([self.path, self.path + "-wal"])
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+
+class DuckDBBackend(WarehouseBackend):
+    """
+    DuckDB over local Parquet/CSV extracts (or a DuckDB database file).
+
+    Every *.parquet / *.csv file in extracts_dir is exposed as a view named
+    after the file in upper case (LEADS.parquet -> LEADS), so the generated
+    SQL runs unchanged against the extracts. A database file is attached
+    read-only and its tables exposed the same way.
+
+    Queries run in an in-memory catalog, which is locked down once the views
+    exist: files outside extracts_dir can't be read or written, nothing else
+    can be attached and extensions can't be installed (needs DuckDB >= 1.2).
+    """
+    name = "duckdb"
+
+    def __init__(self, database=None, extracts_dir=None):
+        if duckdb is None:
+            raise ImportError("duckdb is not installed (pip install duckdb)")
+        self.database = database
+        self.extracts_dir = extracts_dir
+        self.conn = None
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def connect(self):
+        with self._lock:
+            if self.conn is None:
+                conn = duckdb.connect(":memory:")
+                try:
+                    self._attach_database(conn)
+                    self._register_extracts(conn)
+                    self._restrict(conn)
+                except Exception:
+                    conn.close()
+                    raise
+                self.conn = conn
+        return self
+
+    @staticmethod
+    def _quote(value):
+        return str(value).replace("'", "''")
+
+    def _attach_database(self, conn):
+        if not self.database:
+            return
+        conn.execute(f"ATTACH '{self._quote(self.database)}' AS warehouse (READ_ONLY)")
+        tables = conn.execute(
+            "SELECT table_name FROM information_schema.tables "
+            "WHERE table_catalog = 'warehouse' AND table_schema = 'main'"
+        ).fetchall()
+        for (table,) in tables:
+            name = table.replace('"', '""')
+            conn.execute(f'CREATE OR REPLACE VIEW memory.main."{name}" AS SELECT * FROM warehouse.main."{name}"')
+
+    def _register_extracts(self, conn):
+        if not self.extracts_dir:
+            return
+        readers = {".parquet": "read_parquet", ".csv": "read_csv_auto"}
+        for path in sorted(Path(self.extracts_dir).iterdir()):
+            reader = readers.get(path.suffix.lower())
+            if reader:
+                source = self._quote(path.resolve())
+                conn.execute(f'CREATE OR REPLACE VIEW memory.main."{path.stem.upper()}" AS SELECT * FROM {reader}(\'{source}\')')
+
+    def _restrict(self, conn):
+        # The views keep reading the extracts; every other path is off limits
+        if self.extracts_dir:
+            directory = self._quote(os.path.join(Path(self.extracts_dir).resolve(), ""))
+            conn.execute(f"SET allowed_directories = ['{directory}']")
+        conn.execute("SET autoinstall_known_extensions = false")
+        conn.execute("SET autoload_known_extensions = false")
+        conn.execute("SET enable_external_access = false")
+        conn.execute("SET lock_configuration = true")
+
+    def _cursor(self):
+        # DuckDB cursors are independent connections to the same database, one per query
+        cursor = self.connect().conn.cursor()
+        with self._lock:
+            self._active.add(cursor)
+        return cursor
+
+    def _done(self, cursor):
+        with self._lock:
+            self._active.discard(cursor)
+        cursor.close()
+
+    def execute(self, sql):
+        cursor = self._cursor()
+        try:
+            return cursor.execute(sql).fetch_df()
+        finally:
+            self._done(cursor)
+
+    def stream_batches(self, sql, batch_size=1000):
+        cursor = self._cursor()
+        try:
+            reader = cursor.execute(sql).fetch_record_batch(batch_size)
+            yielded = False
+            for batch in reader:
+                yielded = True
+                yield batch
+            if not yielded:
+                yield pa.RecordBatch.from_pylist([], schema=reader.schema)
+        finally:
+            self._done(cursor)
+
+    def cancel(self):
+        with self._lock:
+            for cursor in self._active:
+                cursor.interrupt()
+
+    def data_version(self):
+        paths = [self.database + ".wal", self.database] if self.database else []
+        if self.extracts_dir:
+            paths += sorted(Path(self.extracts_dir).iterdir())
+        return file_version(paths)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+def batches_to_dataframe(batches):
+    """
+    Concatenate record batches into one DataFrame.
+
+    Converted batch by batch: SQLite batches of the same query may infer
+    different Arrow types for a column.
+    """
+    frames = [batch.to_pandas() for batch in batches]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+# Global instance
+_warehouse = None
+_warehouse_lock = threading.Lock()
+
+def get_warehouse():
+    """
+    Backend chosen by WAREHOUSE_BACKEND: sqlite (default) or duckdb, the
+    latter reading DUCKDB_DATABASE and/or the extracts in DUCKDB_EXTRACTS_DIR.
+    """
+    global _warehouse
+    with _warehouse_lock:
+        if _warehouse is None:
+            if os.getenv("WAREHOUSE_BACKEND", "sqlite").lower() == "duckdb":
+                _warehouse = DuckDBBackend(
+                    database=os.getenv("DUCKDB_DATABASE"),
+                    extracts_dir=os.getenv("DUCKDB_EXTRACTS_DIR")
+                )
+            else:
+                _warehouse = SQLiteBackend()
+        return _warehouse.connect()